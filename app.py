@@ -1,31 +1,55 @@
 import os
 os.environ["OTEL_SDK_DISABLED"] = "true"
 
+import base64
+import csv
+import hashlib
+import heapq
+import itertools
+import json
+import smtplib
+import socket
+import sys
+import tempfile
+
 from dotenv import load_dotenv
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(APP_DIR, ".env"))
 
+from collections import Counter, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta, date
+from functools import wraps
+from urllib.parse import urlencode
+import io
 import re
+import threading
 import time
 import pandas as pd
 
 from flask import (
     Flask, request, render_template, redirect, url_for,
-    flash, jsonify
+    flash, jsonify, g, send_from_directory, Response, stream_with_context,
+    make_response, has_request_context
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import (
     LoginManager, login_user, logout_user, login_required,
     current_user, UserMixin
 )
-from sqlalchemy.orm import joinedload
-from sqlalchemy import func, desc, case, or_, text, extract
+from sqlalchemy.orm import joinedload, deferred
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Engine
+from sqlalchemy import (
+    func, desc, case, or_, and_, text, select, insert, update,
+    literal, null, union_all, false, true, event, delete
+)
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from flask_mail import Mail, Message
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
 
 # Fuso horário São Paulo
 os.environ['TZ'] = 'America/Sao_Paulo'
@@ -44,7 +68,9 @@ DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME", "controle_ligacoes")
 SECRET_KEY = os.getenv("SECRET_KEY")
 
-DB_URI = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+# DATABASE_URL (ex.: sqlite:///bench.db) troca o banco inteiro; sem ela, MySQL pelas DB_*
+DB_URI = (os.getenv("DATABASE_URL")
+          or f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4")
 
 MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.office365.com")
 MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
@@ -58,6 +84,8 @@ MAIL_RECIPIENTS = [e.strip() for e in os.getenv(
     "MAIL_RECIPIENTS",
     "gabriel.frizon@bakof.com.br"
 ).split(",") if e.strip()]
+# relatório pessoal diário para cada consultor ativo
+RELATORIO_INDIVIDUAL = os.getenv("RELATORIO_INDIVIDUAL", "true").lower() == "true"
 
 # =============================================================================
 # APP
@@ -66,6 +94,10 @@ app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = DB_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if DB_URI.startswith("sqlite"):
+    # SQLite (testes e benchmarks): com várias threads gravando, espera o lock
+    # em vez de falhar na hora com "database is locked"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"connect_args": {"timeout": 30}}
 
 app.config.update(
     MAIL_SERVER=MAIL_SERVER,
@@ -80,6 +112,20 @@ mail = Mail(app)
 
 db = SQLAlchemy(app)
 
+
+@event.listens_for(Engine, 'connect')
+def _configurar_sqlite(dbapi_conn, registro):
+    """Aproxima o SQLite do MySQL em produção: chaves estrangeiras valendo e
+    leituras que não esperam as gravações (WAL)."""
+    if type(dbapi_conn).__module__.split('.')[0] != 'sqlite3':
+        return
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA foreign_keys = ON")
+    cur.execute("PRAGMA journal_mode = WAL")  # ignorado em banco :memory:
+    cur.execute("PRAGMA synchronous = NORMAL")
+    cur.close()
+
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
@@ -111,9 +157,17 @@ class Cliente(db.Model):
     ativo = db.Column(db.Boolean, default=True)
     proxima_ligacao = db.Column(db.DateTime, nullable=True)
     origem = db.Column(db.Enum('importado_csv', 'manual'), default='manual', nullable=False)
+    # colunas-resumo mantidas a cada ligação registrada (evitam ler ligacoes nas listas)
+    ultima_ligacao = db.Column(db.DateTime, nullable=True)
+    total_ligacoes = db.Column(db.Integer, default=0, nullable=False)
 
     consultor = db.relationship('Usuario', backref='meus_clientes', foreign_keys=[consultor_id])
 
+    __table_args__ = (
+        db.Index('ix_clientes_fila', 'consultor_id', 'ativo', 'proxima_ligacao'),
+        db.Index('ix_clientes_ultima', 'consultor_id', 'ativo', 'ultima_ligacao'),
+    )
+
 
 class Ligacao(db.Model):
     __tablename__ = 'ligacoes'
@@ -121,15 +175,48 @@ class Ligacao(db.Model):
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
     consultor_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     data_hora = db.Column(db.DateTime, default=datetime.now)
-    observacao = db.Column(db.Text)
+    observacao = deferred(db.Column(db.Text))  # texto grande: só carrega quando acessado
     contato_nome = db.Column(db.String(200))
     resultado = db.Column(db.Enum('comprou', 'nao_comprou', 'retornar', 'sem_interesse', 'relacionamento', 'cliente_inativo'),
                           default='nao_comprou')
     valor_venda = db.Column(db.Numeric(12, 2), default=0)
+    atualizado_em = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    chave_idempotencia = db.Column(db.String(64), nullable=True)
+    # dia de data_hora, calculado e gravado pelo próprio banco (coluna gerada)
+    dia = db.Column(db.Date, db.Computed('date(data_hora)', persisted=True))
 
     cliente = db.relationship('Cliente', backref='ligacoes', foreign_keys=[cliente_id])
     consultor = db.relationship('Usuario', backref='ligacoes', foreign_keys=[consultor_id])
 
+    __table_args__ = (
+        db.Index('ix_ligacoes_consultor_data', 'consultor_id', 'data_hora'),
+        db.Index('ix_ligacoes_cliente_data', 'cliente_id', 'data_hora'),
+        db.Index('ux_ligacoes_chave', 'chave_idempotencia', unique=True),
+        # cobre o agrupamento por dia/consultor/resultado das métricas sem ler a tabela
+        db.Index('ix_ligacoes_dia', 'dia', 'consultor_id', 'resultado', 'valor_venda'),
+    )
+
+
+class LigacaoArquivo(db.Model):
+    """Ligações antigas movidas de `ligacoes` por arquivar_ligacoes(); mesmo id."""
+    __tablename__ = 'ligacoes_arquivo'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    cliente_id = db.Column(db.Integer, nullable=False)
+    consultor_id = db.Column(db.Integer, nullable=False)
+    data_hora = db.Column(db.DateTime)
+    observacao = db.Column(db.Text)
+    contato_nome = db.Column(db.String(200))
+    resultado = db.Column(db.Enum('comprou', 'nao_comprou', 'retornar', 'sem_interesse', 'relacionamento', 'cliente_inativo'))
+    valor_venda = db.Column(db.Numeric(12, 2))
+    atualizado_em = db.Column(db.DateTime)
+    arquivada_em = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('ix_ligacoes_arquivo_cliente_data', 'cliente_id', 'data_hora'),
+        db.Index('ix_ligacoes_arquivo_consultor_data', 'consultor_id', 'data_hora'),
+        db.Index('ix_ligacoes_arquivo_data', 'data_hora'),
+    )
+
 
 class Nota(db.Model):
     __tablename__ = 'notas'
@@ -157,10 +244,260 @@ class Banner(db.Model):
     criador = db.relationship('Usuario', foreign_keys=[criado_por])
 
 
+class ExecucaoJob(db.Model):
+    """Histórico das execuções dos jobs agendados."""
+    __tablename__ = 'execucoes_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    agendado_para = db.Column(db.DateTime)  # horário do disparo (jobs com horário fixo)
+    instancia = db.Column(db.String(120))
+    inicio = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    fim = db.Column(db.DateTime)
+    duracao_ms = db.Column(db.Integer)
+    status = db.Column(db.Enum('ok', 'erro'), nullable=False)
+    mensagem = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_execucoes_jobs_job', 'job', 'agendado_para'),
+    )
+
+
+class LeaseJob(db.Model):
+    """Trava de job para bancos sem GET_LOCK (o MySQL usa GET_LOCK)."""
+    __tablename__ = 'jobs_lease'
+    job = db.Column(db.String(50), primary_key=True)
+    dono = db.Column(db.String(120), nullable=False)
+    expira_em = db.Column(db.DateTime, nullable=False)
+
+
+class Alteracao(db.Model):
+    """Log de alterações em clientes, ligações e notas. O id é o cursor de /api/sync."""
+    __tablename__ = 'alteracoes'
+    id = db.Column(db.Integer, primary_key=True)
+    entidade = db.Column(db.Enum('cliente', 'ligacao', 'nota'), nullable=False)
+    entidade_id = db.Column(db.Integer, nullable=False)
+    consultor_id = db.Column(db.Integer, nullable=False)  # dono da carteira afetada
+    criado_em = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_alteracoes_consultor', 'consultor_id', 'id'),
+    )
+
+
+class Evento(db.Model):
+    """Outbox: eventos de negócio gravados na mesma transação da escrita."""
+    __tablename__ = 'eventos'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    dados = db.Column(db.Text, nullable=False)  # JSON
+    criado_em = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+
+class EventoOffset(db.Model):
+    """Último evento já entregue a cada assinante."""
+    __tablename__ = 'eventos_offsets'
+    assinante = db.Column(db.String(100), primary_key=True)
+    ultimo_id = db.Column(db.Integer, default=0, nullable=False)
+    atualizado_em = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class MetricasCongeladas(db.Model):
+    """Snapshot de métricas congelado pelo relatório diário; vale até o fim do dia."""
+    __tablename__ = 'metricas_congeladas'
+    dia = db.Column(db.Date, primary_key=True)
+    dados = db.Column(db.Text(16777215), nullable=False)  # MetricasSnapshot.para_json()
+    criado_em = db.Column(db.DateTime, default=datetime.now)
+
+
+class ResumoMensal(db.Model):
+    """Ligações, vendas e receita por consultor e mês, mantidas pelo assinante
+    _resumo_mensal a partir dos eventos ligacao_registrada."""
+    __tablename__ = 'resumo_mensal'
+    ano = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    mes = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    consultor_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    ligacoes = db.Column(db.Integer, default=0, nullable=False)
+    vendas = db.Column(db.Integer, default=0, nullable=False)
+    receita = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+
+
+class EmailSaida(db.Model):
+    """Fila de saída de e-mails; quem envia é enviar_emails_pendentes()."""
+    __tablename__ = 'emails_saida'
+    id = db.Column(db.Integer, primary_key=True)
+    assunto = db.Column(db.String(255), nullable=False)
+    destinatarios = db.Column(db.Text, nullable=False)  # separados por vírgula
+    html = db.Column(db.Text(16777215), nullable=False)  # MEDIUMTEXT no MySQL
+    status = db.Column(db.Enum('pendente', 'enviado', 'falhou'), default='pendente', nullable=False)
+    tentativas = db.Column(db.Integer, default=0, nullable=False)
+    proxima_tentativa = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    ultimo_erro = db.Column(db.Text)
+    criado_em = db.Column(db.DateTime, default=datetime.now)
+    enviado_em = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_emails_saida_fila', 'status', 'proxima_tentativa'),
+    )
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return Usuario.query.get(int(user_id))
 
+# =============================================================================
+# LOG DE ALTERAÇÕES
+# =============================================================================
+# Toda escrita ORM em Cliente/Ligacao/Nota é anotada no flush; UPDATE/INSERT
+# em massa (que não passam pelo ORM) chamam registrar_alteracoes(). As linhas
+# do log só são gravadas no before_commit, na mesma transação: assim o id e o
+# criado_em saem da hora do commit, e não do flush — uma transação longa (a
+# importação) não deixa alterações com criado_em antigo para trás do cursor
+# do /api/sync.
+def registrar_alteracoes(linhas):
+    """linhas: (entidade, entidade_id, consultor_id); gravadas no próximo commit."""
+    db.session.info.setdefault('alteracoes', set()).update(linhas)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _alteracoes_do_flush(session, flush_context):
+    linhas = []
+    filhos = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Cliente):
+            linhas.append(('cliente', obj.id, obj.consultor_id))
+            # reatribuído: o dono anterior também precisa saber que perdeu o cliente
+            for anterior in db.inspect(obj).attrs.consultor_id.history.deleted:
+                if anterior is not None:
+                    linhas.append(('cliente', obj.id, anterior))
+        elif isinstance(obj, Ligacao):
+            filhos.append(('ligacao', obj.id, obj.cliente_id))
+        elif isinstance(obj, Nota):
+            filhos.append(('nota', obj.id, obj.cliente_id))
+
+    if filhos:
+        donos = dict(session.connection().execute(
+            select(Cliente.id, Cliente.consultor_id).where(Cliente.id.in_({c for _, _, c in filhos}))
+        ).all())
+        linhas += [(e, i, donos[c]) for e, i, c in filhos if c in donos]
+    session.info.setdefault('alteracoes', set()).update(linhas)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _gravar_alteracoes(session):
+    session.flush()  # o flush do commit vem depois deste evento; as anotações precisam vir antes
+    linhas = session.info.pop('alteracoes', None)
+    if not linhas:
+        return
+    agora = datetime.now()
+    session.connection().execute(insert(Alteracao.__table__), [
+        {"entidade": e, "entidade_id": i, "consultor_id": c, "criado_em": agora}
+        for e, i, c in sorted(linhas)
+    ])
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_alteracoes(session):
+    session.info.pop('alteracoes', None)
+
+# =============================================================================
+# EVENTOS (OUTBOX)
+# =============================================================================
+# emitir_evento() só adiciona o evento à sessão: ele é gravado no mesmo commit
+# da escrita que o gerou (ou descartado junto no rollback). O despachante roda
+# no scheduler e entrega os eventos, em ordem, a cada assinante registrado com
+# @assinar; o offset de cada assinante fica em eventos_offsets. Eventos que
+# todos os assinantes já receberam são apagados ao fim de cada rodada.
+EVENTOS_LOTE = int(os.getenv("EVENTOS_LOTE", "200"))
+EVENTOS_INTERVALO = int(os.getenv("EVENTOS_INTERVALO", "10"))  # segundos
+EVENTOS_FOLGA = timedelta(seconds=5)  # ids menores ainda podem estar em transações abertas
+
+_assinantes = {}
+
+
+def emitir_evento(tipo, **dados):
+    db.session.add(Evento(tipo=tipo, dados=json.dumps(dados, default=str)))
+
+
+def assinar(*tipos, carga_inicial=None):
+    """Registra `fn(tipo, dados)` para os tipos dados (nenhum = todos).
+
+    A entrega é pelo menos uma vez: se o assinante falhar, o evento volta na
+    próxima rodada. O que o assinante gravar na sessão é commitado junto com o
+    avanço do offset.
+
+    Assinantes que mantêm dados derivados passam `carga_inicial()`: na
+    primeira rodada ela monta o estado a partir das tabelas e o assinante
+    começa a partir do último evento já gravado, em vez do primeiro.
+    """
+    def decorador(fn):
+        _assinantes[fn.__name__] = (set(tipos), fn, carga_inicial)
+        return fn
+    return decorador
+
+
+def _despachar_para(nome, tipos, fn, carga_inicial, corte):
+    offset = db.session.get(EventoOffset, nome, with_for_update=True)
+    if offset is None:
+        offset = EventoOffset(assinante=nome, ultimo_id=0)
+        if carga_inicial is not None:
+            # mesma transação: o que a carga leu já está nos eventos até aqui
+            offset.ultimo_id = db.session.execute(select(func.max(Evento.id))).scalar() or 0
+            carga_inicial()
+        db.session.add(offset)
+
+    eventos = db.session.execute(
+        select(Evento.id, Evento.tipo, Evento.dados)
+        .where(Evento.id > offset.ultimo_id, Evento.criado_em < corte)
+        .order_by(Evento.id)
+        .limit(EVENTOS_LOTE)
+    ).all()
+
+    entregues = 0
+    for ev in eventos:
+        if not tipos or ev.tipo in tipos:
+            try:
+                fn(ev.tipo, json.loads(ev.dados))
+            except Exception as e:
+                print(f"❌ Assinante {nome} falhou no evento {ev.id}: {e}")
+                break
+            entregues += 1
+        offset.ultimo_id = ev.id
+    db.session.commit()
+    return entregues
+
+
+def despachar_eventos():
+    """Uma rodada do despachante; devolve quantos eventos foram entregues."""
+    corte = datetime.now() - EVENTOS_FOLGA
+    total = 0
+    for nome, (tipos, fn, carga_inicial) in list(_assinantes.items()):
+        try:
+            total += _despachar_para(nome, tipos, fn, carga_inicial, corte)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Erro ao despachar eventos para {nome}: {e}")
+    _podar_eventos()
+    return total
+
+
+def _podar_eventos():
+    """Apaga os eventos que todos os assinantes registrados já receberam."""
+    offsets = db.session.execute(
+        select(EventoOffset.ultimo_id).where(EventoOffset.assinante.in_(list(_assinantes)))
+    ).scalars().all()
+    if not offsets or len(offsets) < len(_assinantes):
+        return 0  # assinante sem offset ainda vai querer os eventos desde o início
+    # o evento mais novo fica: com a tabela vazia, o SQLite (e o MySQL 5.7 depois
+    # de reiniciar) reaproveita ids, e o próximo evento cairia abaixo dos offsets
+    ultimo = db.session.execute(select(func.max(Evento.id))).scalar()
+    if ultimo is None:
+        return 0
+    res = db.session.execute(delete(Evento).where(Evento.id <= min(offsets), Evento.id < ultimo))
+    db.session.commit()
+    return res.rowcount
+
 # =============================================================================
 # HELPERS
 # =============================================================================
@@ -212,6 +549,417 @@ def _percent(a, b):
     except:
         return 0.0
 
+
+app.add_template_filter(formatar_dinheiro, 'dinheiro')
+app.add_template_filter(_kfmt, 'kfmt')
+
+
+def _intervalo_mes(mes, ano):
+    """[início, fim) do mês, para filtrar data_hora por faixa (usa índice)."""
+    inicio = datetime(ano, mes, 1)
+    fim = datetime(ano + 1, 1, 1) if mes == 12 else datetime(ano, mes + 1, 1)
+    return inicio, fim
+
+
+PAGINA_PADRAO = 50
+PAGINA_MAXIMA = 200
+
+
+def _limite_pagina(v, padrao=PAGINA_PADRAO, maximo=PAGINA_MAXIMA):
+    try:
+        n = int(v)
+    except (TypeError, ValueError):
+        return padrao
+    return max(1, min(n, maximo))
+
+
+def _codificar_cursor(data_hora, id_):
+    """Cursor opaco (data_hora, id) para paginação por chave."""
+    raw = f"{data_hora.isoformat()}|{id_}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        dt, id_ = raw.rsplit('|', 1)
+        return datetime.fromisoformat(dt), int(id_)
+    except Exception:
+        return None
+
+# =============================================================================
+# ESTATÍSTICAS DO CONSULTOR
+# =============================================================================
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "30"))
+_stats_cache = {}
+_stats_lock = threading.Lock()
+
+
+def stats_consultor(usuario):
+    """Números do consultor (clientes, ligações hoje/7d/30d, vendas e receita 30d).
+
+    Tudo sai de uma única consulta com SUM(CASE ...) sobre o índice
+    (consultor_id, data_hora). O resultado fica memoizado no request (g) e,
+    por STATS_CACHE_TTL segundos, por usuário.
+    """
+    memo = g.setdefault('_stats_consultor', {})
+    if usuario.id in memo:
+        return memo[usuario.id]
+
+    with _stats_lock:
+        cache = _stats_cache.get(usuario.id)
+    if cache and cache[0] > time.monotonic():
+        memo[usuario.id] = cache[1]
+        return cache[1]
+
+    agora = datetime.now()
+    inicio_hoje = datetime.combine(agora.date(), datetime.min.time())
+    desde7 = agora - timedelta(days=7)
+    desde30 = agora - timedelta(days=30)
+
+    total_clientes = (db.session.query(func.count(Cliente.id))
+                      .filter(Cliente.consultor_id == usuario.id, Cliente.ativo == True)
+                      .scalar_subquery())
+
+    row = (db.session.query(
+               total_clientes,
+               func.sum(case((Ligacao.data_hora >= inicio_hoje, 1), else_=0)),
+               func.sum(case((Ligacao.data_hora >= desde7, 1), else_=0)),
+               func.count(Ligacao.id),
+               func.sum(case((Ligacao.resultado == 'comprou', 1), else_=0)),
+               func.sum(case((Ligacao.resultado == 'comprou', Ligacao.valor_venda), else_=0)))
+           .filter(Ligacao.consultor_id == usuario.id, Ligacao.data_hora >= desde30)
+           .one())
+
+    meta = usuario.meta_diaria or 10
+    hoje = int(row[1] or 0)
+    st = {
+        "total_clientes": int(row[0] or 0),
+        "ligacoes_hoje": hoje,
+        "ligacoes_semana": int(row[2] or 0),
+        "ligacoes_mes": int(row[3] or 0),
+        "vendas_mes": int(row[4] or 0),
+        "receita_mes": float(row[5] or 0),
+        "meta_diaria": meta,
+        "progresso_meta": round(_percent(hoje, meta), 1),
+    }
+
+    with _stats_lock:
+        _stats_cache[usuario.id] = (time.monotonic() + STATS_CACHE_TTL, st)
+    memo[usuario.id] = st
+    return st
+
+
+def invalidar_stats_consultor(usuario_id):
+    with _stats_lock:
+        _stats_cache.pop(usuario_id, None)
+    g.pop('_stats_consultor', None)
+
+
+@assinar('ligacao_registrada', 'cliente_criado', 'cliente_atualizado', 'cliente_removido',
+         'clientes_em_massa')
+def _stats_por_evento(tipo, dados):
+    """Invalida o cache de stats_consultor() para escritas feitas por outras
+    instâncias e pelo importador, que não invalidam o cache deste processo.
+    Só alcança o processo que roda o despachante; nos demais o cache expira
+    em STATS_CACHE_TTL."""
+    with _stats_lock:
+        if tipo == 'clientes_em_massa':
+            _stats_cache.clear()  # o evento não traz os donos anteriores
+            return
+        for chave in ('dono_id', 'dono_anterior', 'consultor_id', 'por'):
+            _stats_cache.pop(dados.get(chave), None)
+
+# =============================================================================
+# CLASSES DE CARGA (timeout de consulta e limite de concorrência)
+# =============================================================================
+# Cada rota pertence a uma classe. Consultas SELECT feitas durante o request
+# levam o timeout da classe (hint MAX_EXECUTION_TIME no MySQL), e as classes
+# pesadas têm um número máximo de requests simultâneos por processo: acima
+# dele, a rota responde 503 com Retry-After na hora, sem segurar thread nem
+# conexão. A classe interativa (registrar ligação, fila, busca da própria
+# carteira) não tem limite, então sempre sobra capacidade para ela.
+# Consultas com stream_results (exportações em streaming) ficam sem o hint: o
+# MAX_EXECUTION_TIME conta enquanto o cliente baixa, e cortaria o arquivo no meio.
+CLASSES_CARGA = {
+    'interativo': {"concorrencia": None,
+                   "timeout_ms": int(os.getenv("TIMEOUT_INTERATIVO_MS", "10000")),
+                   "retry_after": 0},
+    'analitico': {"concorrencia": int(os.getenv("CARGA_ANALITICO_MAX", "4")),
+                  "timeout_ms": int(os.getenv("TIMEOUT_ANALITICO_MS", "30000")),
+                  "retry_after": 5},
+    'exportacao': {"concorrencia": int(os.getenv("CARGA_EXPORTACAO_MAX", "2")),
+                   "timeout_ms": int(os.getenv("TIMEOUT_EXPORTACAO_MS", "300000")),
+                   "retry_after": 30},
+}
+_semaforos_carga = {nome: threading.BoundedSemaphore(c["concorrencia"])
+                    for nome, c in CLASSES_CARGA.items() if c["concorrencia"]}
+_RE_SELECT = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+
+def _resposta_sobrecarga(classe):
+    espera = str(CLASSES_CARGA[classe]["retry_after"])
+    mensagem = "Servidor ocupado com outras consultas pesadas. Tente novamente em instantes."
+    if request.accept_mimetypes.best == 'text/html':
+        return Response(mensagem, 503, {"Retry-After": espera}, mimetype='text/plain')
+    return jsonify({"ok": False, "mensagem": mensagem}), 503, {"Retry-After": espera}
+
+
+def classe_carga(classe):
+    """Decora uma rota com sua classe de carga. `classe` pode ser uma função
+    que decide pelo request (ex.: lista de clientes de todos vs. só os meus).
+    A vaga só é devolvida quando a resposta termina de ser enviada, o que
+    vale também para exportações em streaming."""
+    def decorador(fn):
+        @wraps(fn)
+        def envolvida(*args, **kwargs):
+            nome = classe() if callable(classe) else classe
+            semaforo = _semaforos_carga.get(nome)
+            if semaforo is not None and not semaforo.acquire(blocking=False):
+                return _resposta_sobrecarga(nome)
+            g.classe_carga = nome
+            try:
+                resp = make_response(fn(*args, **kwargs))
+            except BaseException:
+                if semaforo is not None:
+                    semaforo.release()
+                raise
+            if semaforo is not None:
+                resp.call_on_close(semaforo.release)
+            return resp
+        return envolvida
+    return decorador
+
+
+def _classe_lista_clientes():
+    # supervisor vendo a carteira de todos os consultores é consulta pesada
+    if current_user.is_authenticated and current_user.tipo == 'supervisor' and request.args.get('meus') != '1':
+        return 'analitico'
+    return 'interativo'
+
+
+@event.listens_for(Engine, 'before_cursor_execute', retval=True)
+def _timeout_da_classe(conn, cursor, statement, parameters, context, executemany):
+    if conn.dialect.name != 'mysql' or not has_request_context():
+        return statement, parameters
+    if context is not None and context.execution_options.get('stream_results'):
+        return statement, parameters
+    timeout = CLASSES_CARGA[g.get('classe_carga', 'interativo')]["timeout_ms"]
+    if timeout and 'MAX_EXECUTION_TIME' not in statement:
+        statement = _RE_SELECT.sub(f"SELECT /*+ MAX_EXECUTION_TIME({timeout}) */", statement, count=1)
+    return statement, parameters
+
+# =============================================================================
+# PERFIL SOB DEMANDA (supervisor)
+# =============================================================================
+# Um supervisor pode pedir o perfil de qualquer request: ?_perfil=1 devolve o
+# relatório em texto no lugar da página; o header X-Perfil: 1 mantém a resposta
+# e aponta o relatório em X-Perfil-Url (útil nas chamadas da API). A troca pelo
+# relatório só vale para GET/HEAD: num POST com ?_perfil=1 a escrita acontece
+# igual, então a resposta normal é mantida, como com o header. Respostas em
+# streaming só fecham o perfil quando terminam de ser enviadas. Durante o
+# request, uma thread lê a pilha da thread do request a cada PERFIL_INTERVALO_MS
+# e cada consulta SQL tem o tempo medido. Os últimos PERFIL_MAX perfis ficam em
+# memória (por processo) e aparecem em /supervisor/perfis.
+PERFIL_INTERVALO = int(os.getenv("PERFIL_INTERVALO_MS", "5")) / 1000.0
+PERFIL_MAX = int(os.getenv("PERFIL_MAX", "50"))
+PERFIL_MIN_PCT = 1.0  # galhos da árvore com menos amostras que isso ficam de fora
+PERFIL_MAX_SQL = 20   # consultas distintas listadas no relatório
+
+_perfis = deque(maxlen=PERFIL_MAX)
+_perfis_lock = threading.Lock()
+_perfis_seq = itertools.count(1)
+
+
+class _Amostrador(threading.Thread):
+    """Conta as pilhas de chamadas vistas numa thread, amostradas em intervalo fixo."""
+
+    def __init__(self, alvo):
+        super().__init__(daemon=True, name=f"perfil-{alvo}")
+        self.alvo = alvo
+        self.pilhas = Counter()
+        self.parar = threading.Event()
+
+    def run(self):
+        while not self.parar.wait(PERFIL_INTERVALO):
+            frame = sys._current_frames().get(self.alvo)
+            pilha = []
+            while frame is not None:
+                co = frame.f_code
+                pilha.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+                frame = frame.f_back
+            pilha.reverse()
+            # o que vem antes do Flask despachar o request é servidor WSGI
+            for i, nome in enumerate(pilha):
+                if nome.startswith('full_dispatch_request '):
+                    pilha = pilha[i + 1:]
+                    break
+            if pilha:
+                self.pilhas[tuple(pilha)] += 1
+
+
+@app.before_request
+def _iniciar_perfil():
+    if not (request.args.get('_perfil') or request.headers.get('X-Perfil')):
+        return
+    if not current_user.is_authenticated or current_user.tipo != 'supervisor':
+        return
+    amostrador = _Amostrador(threading.get_ident())
+    no_lugar = bool(request.args.get('_perfil')) and request.method in ('GET', 'HEAD')
+    g.perfil = {"inicio": time.perf_counter(), "quando": datetime.now(), "sql": [],
+                "amostrador": amostrador, "no_lugar": no_lugar}
+    amostrador.start()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _perfil_sql_inicio(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'perfil' in g:
+        context._perfil_inicio = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _perfil_sql_fim(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, '_perfil_inicio', None)
+    if inicio is not None and has_request_context() and 'perfil' in g:
+        g.perfil["sql"].append((statement, (time.perf_counter() - inicio) * 1000.0))
+
+
+@app.after_request
+def _finalizar_perfil(resp):
+    perfil = g.get('perfil')
+    if perfil is None:
+        return resp
+    args = [(k, v) for k, v in request.args.items(multi=True) if k != '_perfil']
+    perfil["registro"] = {
+        "id": next(_perfis_seq),
+        "quando": perfil["quando"],
+        "usuario": current_user.nome,
+        "metodo": request.method,
+        "caminho": request.path + (f"?{urlencode(args)}" if args else ""),
+        "status": resp.status_code,
+    }
+
+    if resp.is_streamed and not perfil["no_lugar"]:
+        # o corpo ainda vai ser gerado (exportações): amostrador e SQL seguem
+        # até a resposta terminar de ser enviada
+        perfil["streaming"] = True
+        resp.call_on_close(lambda: _concluir_perfil(perfil))
+    else:
+        g.pop('perfil')
+        registro = _concluir_perfil(perfil)
+        if perfil["no_lugar"]:
+            resp.close()  # devolve vaga de classe de carga / encerra streaming descartado
+            return Response(_relatorio_perfil(registro), mimetype='text/plain')
+    resp.headers['X-Perfil-Url'] = url_for('ver_perfil', perfil_id=perfil["registro"]["id"])
+    return resp
+
+
+def _concluir_perfil(perfil):
+    amostrador = perfil["amostrador"]
+    amostrador.parar.set()
+    amostrador.join()
+
+    # consultas iguais (mesmo SQL, parâmetros diferentes) somadas
+    por_sql = {}
+    for statement, ms in perfil["sql"]:
+        item = por_sql.setdefault(" ".join(statement.split()), [0, 0.0])
+        item[0] += 1
+        item[1] += ms
+    registro = dict(
+        perfil["registro"],
+        duracao_ms=(time.perf_counter() - perfil["inicio"]) * 1000.0,
+        pilhas=amostrador.pilhas,
+        amostras=sum(amostrador.pilhas.values()),
+        sql_qtd=len(perfil["sql"]),
+        sql_ms=sum(ms for _, ms in perfil["sql"]),
+        sql=sorted(((sql, n, ms) for sql, (n, ms) in por_sql.items()), key=lambda x: -x[2]),
+    )
+    with _perfis_lock:
+        _perfis.appendleft(registro)
+    return registro
+
+
+@app.teardown_request
+def _parar_perfil(exc):
+    # request que não chegou ao after_request: não deixa o amostrador rodando
+    # (em streaming, quem para é o _concluir_perfil, no fim do envio)
+    perfil = g.get('perfil')
+    if perfil is not None and not perfil.get("streaming"):
+        g.pop('perfil')
+        perfil["amostrador"].parar.set()
+
+
+def _relatorio_perfil(p):
+    linhas = [
+        f"{p['metodo']} {p['caminho']} — HTTP {p['status']} em {p['duracao_ms']:.0f} ms",
+        f"{p['quando'].strftime('%d/%m/%Y %H:%M:%S')}, {p['usuario']}; "
+        f"{p['amostras']} amostras a cada {PERFIL_INTERVALO * 1000:.0f} ms",
+        "",
+        f"SQL: {p['sql_qtd']} consultas, {p['sql_ms']:.1f} ms "
+        f"({_percent(p['sql_ms'], p['duracao_ms']):.0f}% do request)",
+    ]
+    if p["sql"]:
+        linhas.append(f"{'ms':>9} {'vezes':>6}  consulta")
+        for sql, n, ms in p["sql"][:PERFIL_MAX_SQL]:
+            linhas.append(f"{ms:9.1f} {n:6d}  {sql[:300]}")
+        if len(p["sql"]) > PERFIL_MAX_SQL:
+            linhas.append(f"          ... mais {len(p['sql']) - PERFIL_MAX_SQL} consultas distintas")
+
+    linhas += ["", "Árvore de chamadas (% das amostras; galhos abaixo de "
+                   f"{PERFIL_MIN_PCT:.0f}% omitidos):"]
+    raiz = {}
+    for pilha, n in p["pilhas"].items():
+        nivel = raiz
+        for nome in pilha:
+            no = nivel.setdefault(nome, [0, {}])
+            no[0] += n
+            nivel = no[1]
+
+    def descer(nivel, profundidade):
+        for nome, (n, filhos) in sorted(nivel.items(), key=lambda kv: -kv[1][0]):
+            pct = _percent(n, p["amostras"])
+            if pct < PERFIL_MIN_PCT:
+                continue
+            linhas.append(f"{pct:5.1f}% {n:6d}  {'  ' * profundidade}{nome}")
+            descer(filhos, profundidade + 1)
+
+    if p["amostras"]:
+        descer(raiz, 0)
+    else:
+        linhas.append("(request rápido demais para ser amostrado)")
+    return "\n".join(linhas) + "\n"
+
+
+@app.route('/supervisor/perfis')
+@login_required
+def perfis_requests():
+    if current_user.tipo != 'supervisor':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('index'))
+    with _perfis_lock:
+        perfis = list(_perfis)
+    return render_template('perfis.html', perfis=perfis, perfil_max=PERFIL_MAX)
+
+
+@app.route('/supervisor/perfis/<int:perfil_id>')
+@login_required
+def ver_perfil(perfil_id):
+    """Relatório em texto; ?formato=folded dá as pilhas no formato do
+    flamegraph.pl / speedscope para gerar o flame graph."""
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+    with _perfis_lock:
+        perfil = next((p for p in _perfis if p["id"] == perfil_id), None)
+    if perfil is None:
+        return jsonify({"ok": False, "mensagem": "Perfil não encontrado (já saiu do histórico?)"}), 404
+    if request.args.get('formato') == 'folded':
+        corpo = "".join(f"{';'.join(pilha)} {n}\n" for pilha, n in perfil["pilhas"].items())
+        return Response(corpo, mimetype='text/plain',
+                        headers={"Content-Disposition": f"attachment; filename=perfil_{perfil_id}.folded"})
+    return Response(_relatorio_perfil(perfil), mimetype='text/plain')
+
 # =============================================================================
 # LOGIN / BASE
 # =============================================================================
@@ -271,148 +1019,336 @@ def marcar_novidades_vistas():
         return jsonify({"ok": False, "mensagem": str(e)}), 500
 
 # =============================================================================
-# LISTAGEM DE CLIENTES
+# CLIENTES POR ABA / FILA DE LIGAÇÕES (colunas-resumo)
 # =============================================================================
-@app.route('/meus-clientes')
-def meus_clientes():
-    if not current_user.is_authenticated:
-        return redirect(url_for('login'))
-
-    if current_user.tipo not in ('consultor', 'supervisor'):
-        flash('Perfil sem acesso.', 'danger')
-        return redirect(url_for('index'))
+def _registrar_resumo_ligacao(cli, quando):
+    """Atualiza as colunas-resumo do cliente ao registrar uma ligação.
+
+    Soma e máximo vão no próprio UPDATE, então duas ligações simultâneas para o
+    mesmo cliente não perdem contagem; o flush imediato evita que uma segunda
+    chamada antes dele sobrescreva a expressão pendente."""
+    cli.total_ligacoes = Cliente.total_ligacoes + 1
+    cli.ultima_ligacao = case(
+        (or_(Cliente.ultima_ligacao == None, Cliente.ultima_ligacao < quando), quando),
+        else_=Cliente.ultima_ligacao,
+    )
+    db.session.flush()
 
-    aba = request.args.get('aba', 'pendentes')
-    apenas_meus = True if current_user.tipo == 'consultor' else (request.args.get('meus') == '1')
-    
-    # Parâmetros de filtro mensal para consultores
-    mes_filtro = None
-    ano_filtro = None
-    if current_user.tipo == 'consultor':
-        mes_filtro = request.args.get('mes')
-        ano_filtro = request.args.get('ano')
-        if mes_filtro:
-            mes_filtro = int(mes_filtro)
-        if ano_filtro:
-            ano_filtro = int(ano_filtro)
 
-    q = Cliente.query.options(joinedload(Cliente.ligacoes)).filter(Cliente.ativo == True)
+def _condicoes_clientes(apenas_meus, termo):
+    conds = [Cliente.ativo == True]
     if apenas_meus:
-        q = q.filter(Cliente.consultor_id == current_user.id)
-
-    termo = s(request.args.get('q'))
+        conds.append(Cliente.consultor_id == current_user.id)
     if termo:
         like = f"%{termo}%"
-        q = q.filter(or_(
+        conds.append(or_(
             Cliente.nome.like(like),
             Cliente.cnpj.like(like),
             Cliente.telefone.like(like),
             Cliente.representante_nome.like(like)
         ))
+    return conds
+
+
+def _contagem_abas(conds):
+    pendentes, retornar, contatados = db.session.execute(
+        select(
+            func.sum(case((Cliente.total_ligacoes == 0, 1), else_=0)),
+            func.sum(case((and_(Cliente.total_ligacoes > 0, Cliente.proxima_ligacao != None), 1), else_=0)),
+            func.sum(case((and_(Cliente.total_ligacoes > 0, Cliente.proxima_ligacao == None), 1), else_=0)),
+        ).where(*conds)
+    ).one()
+    return {
+        "pendentes": int(pendentes or 0),
+        "retornar": int(retornar or 0),
+        "contatados": int(contatados or 0),
+    }
 
-    clientes_todos = q.order_by(Cliente.nome.asc()).all()
 
-    pendentes, contatados, precisa_retornar = [], [], []
-    agora = datetime.now()
+_COLUNAS_LISTA_CLIENTES = (
+    Cliente.id, Cliente.nome, Cliente.cnpj, Cliente.telefone, Cliente.representante_nome,
+    Cliente.ultima_ligacao, Cliente.total_ligacoes, Cliente.proxima_ligacao, Cliente.origem,
+)
 
-    for c in clientes_todos:
-        ligs = sorted(c.ligacoes, key=lambda x: x.data_hora, reverse=True)
-        ultima = ligs[0] if ligs else None
-        total = len(ligs)
-        dados = {
-            "id": c.id,
-            "nome": c.nome,
-            "cnpj": c.cnpj,
-            "telefone": c.telefone,
-            "representante_nome": c.representante_nome,
-            "ultima_ligacao": ultima.data_hora if ultima else None,
-            "total_ligacoes": total,
-            "proxima_ligacao": c.proxima_ligacao,
-            "origem": getattr(c, 'origem', None),
-        }
 
-        if total == 0:
-            pendentes.append(dados)
-        else:
-            if c.proxima_ligacao:
-                dados["retorno_atrasado"] = (agora >= c.proxima_ligacao)
-                precisa_retornar.append(dados)
-            else:
-                contatados.append(dados)
+def _dados_cliente(row):
+    return {
+        "id": row.id,
+        "nome": row.nome,
+        "cnpj": row.cnpj,
+        "telefone": row.telefone,
+        "representante_nome": row.representante_nome,
+        "ultima_ligacao": row.ultima_ligacao,
+        "total_ligacoes": int(row.total_ligacoes or 0),
+        "proxima_ligacao": row.proxima_ligacao,
+        "origem": row.origem,
+    }
+
+
+def _clientes_da_aba(aba, conds, filtro=None):
+    """Clientes de uma aba (pendentes / retornar / contatados), já ordenados no banco."""
+    stmt = select(*_COLUNAS_LISTA_CLIENTES).where(*conds)
+    agora = datetime.now()
 
     if aba == 'pendentes':
-        clientes = pendentes
+        stmt = stmt.where(Cliente.total_ligacoes == 0).order_by(Cliente.nome.asc())
     elif aba == 'retornar':
-        clientes = sorted(precisa_retornar, key=lambda x: (x['proxima_ligacao'] or datetime.max))
+        stmt = (stmt.where(Cliente.total_ligacoes > 0, Cliente.proxima_ligacao != None)
+                .order_by(Cliente.proxima_ligacao.asc(), Cliente.nome.asc()))
     else:
-        clientes = contatados
-        filtro = request.args.get('filtro')
+        stmt = stmt.where(Cliente.total_ligacoes > 0, Cliente.proxima_ligacao == None)
         if filtro == 'antigos':
-            limite = datetime.now() - timedelta(days=30)
-            clientes = [c for c in clientes if c['ultima_ligacao'] and c['ultima_ligacao'] < limite]
+            stmt = stmt.where(Cliente.ultima_ligacao < agora - timedelta(days=30))
         elif filtro == 'recentes':
-            limite = datetime.now() - timedelta(days=7)
-            clientes = [c for c in clientes if c['ultima_ligacao'] and c['ultima_ligacao'] >= limite]
+            stmt = stmt.where(Cliente.ultima_ligacao >= agora - timedelta(days=7))
+        stmt = stmt.order_by(Cliente.nome.asc())
 
-    consultores = (Usuario.query
-                   .filter_by(tipo='consultor', ativo=True)
-                   .order_by(Usuario.nome.asc())
-                   .all() if current_user.tipo == 'supervisor' else None)
+    out = []
+    for row in db.session.execute(stmt):
+        dados = _dados_cliente(row)
+        if aba == 'retornar':
+            dados["retorno_atrasado"] = (agora >= row.proxima_ligacao)
+        out.append(dados)
+    return out
 
-    stats = {}
-    if current_user.tipo == 'consultor':
-        hoje_date = datetime.now().date()
-        desde7 = datetime.now() - timedelta(days=7)
-        desde30 = datetime.now() - timedelta(days=30)
 
-        stats['total_clientes'] = Cliente.query.filter_by(
-            consultor_id=current_user.id, ativo=True
-        ).count()
+FILA_LOTE_PADRAO = 20
 
-        stats['ligacoes_hoje'] = db.session.query(func.count(Ligacao.id)).filter(
-            Ligacao.consultor_id == current_user.id,
-            func.date(Ligacao.data_hora) == hoje_date
-        ).scalar() or 0
 
-        stats['ligacoes_semana'] = db.session.query(func.count(Ligacao.id)).filter(
-            Ligacao.consultor_id == current_user.id,
-            Ligacao.data_hora >= desde7
-        ).scalar() or 0
+@app.route('/api/fila-ligacoes')
+@login_required
+def api_fila_ligacoes():
+    """Próximos clientes a ligar: retornos atrasados, depois nunca ligados, depois os
+    contatados há mais tempo. O front busca um lote e só volta ao servidor quando ele
+    está acabando (`excluir` evita repetir quem ainda está no lote local)."""
+    consultor_id = current_user.id
+    if current_user.tipo == 'supervisor':
+        consultor_id = request.args.get('consultor_id', type=int) or current_user.id
+
+    limite = _limite_pagina(request.args.get('limite'), padrao=FILA_LOTE_PADRAO)
+    excluir = [int(x) for x in (request.args.get('excluir') or "").split(',') if x.strip().isdigit()][:PAGINA_MAXIMA]
+    agora = datetime.now()
 
-        stats['ligacoes_mes'] = db.session.query(func.count(Ligacao.id)).filter(
-            Ligacao.consultor_id == current_user.id,
-            Ligacao.data_hora >= desde30
-        ).scalar() or 0
+    base_conds = [Cliente.consultor_id == consultor_id, Cliente.ativo == True]
+    if excluir:
+        base_conds.append(Cliente.id.notin_(excluir))
+
+    # 1) retornos vencidos — índice (consultor_id, ativo, proxima_ligacao)
+    rows = db.session.execute(
+        select(*_COLUNAS_LISTA_CLIENTES)
+        .where(*base_conds, Cliente.proxima_ligacao <= agora)
+        .order_by(Cliente.proxima_ligacao.asc())
+        .limit(limite)
+    ).all()
+
+    # 2) sem retorno agendado: nunca ligados (ultima_ligacao NULL ordena primeiro
+    #    no MySQL/SQLite) e depois os mais antigos — índice (consultor_id, ativo, ultima_ligacao)
+    if len(rows) < limite:
+        rows += db.session.execute(
+            select(*_COLUNAS_LISTA_CLIENTES)
+            .where(*base_conds, Cliente.proxima_ligacao == None)
+            .order_by(Cliente.ultima_ligacao.asc(), Cliente.id.asc())
+            .limit(limite - len(rows))
+        ).all()
+
+    fila = []
+    for row in rows:
+        dados = _dados_cliente(row)
+        if row.proxima_ligacao:
+            dados["motivo"] = "retorno_atrasado"
+        elif not row.total_ligacoes:
+            dados["motivo"] = "nunca_ligado"
+        else:
+            dados["motivo"] = "mais_antigo"
+        for campo in ("ultima_ligacao", "proxima_ligacao"):
+            dados[campo] = dados[campo].strftime("%d/%m/%Y %H:%M") if dados[campo] else None
+        fila.append(dados)
 
-        stats['meta_diaria'] = current_user.meta_diaria or 10
-        stats['progresso_meta'] = round(
-            (stats['ligacoes_hoje'] / stats['meta_diaria'] * 100) if stats['meta_diaria'] > 0 else 0, 1
-        )
+    return jsonify({"ok": True, "clientes": fila})
 
-        vendas_30 = db.session.query(func.count(Ligacao.id)).filter(
-            Ligacao.consultor_id == current_user.id,
-            Ligacao.data_hora >= desde30,
-            Ligacao.resultado == 'comprou'
-        ).scalar() or 0
+# =============================================================================
+# MODO OFFLINE (service worker + sincronização incremental)
+# =============================================================================
+SYNC_FOLGA = timedelta(seconds=5)  # tempo para transações abertas terminarem de gravar no log
 
-        stats['taxa_conversao'] = round(
-            (vendas_30 / stats['ligacoes_mes'] * 100) if stats['ligacoes_mes'] > 0 else 0, 1
-        )
 
-        receita_total = db.session.query(func.sum(Ligacao.valor_venda)).filter(
-            Ligacao.consultor_id == current_user.id,
-            Ligacao.data_hora >= desde30,
-            Ligacao.resultado == 'comprou'
+@app.route('/sw.js')
+def service_worker():
+    # servido da raiz para que o escopo do service worker cubra todo o site
+    resp = send_from_directory(app.static_folder, 'sw.js', mimetype='application/javascript')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['Service-Worker-Allowed'] = '/'
+    return resp
+
+
+SYNC_LIMITE_PADRAO = 500
+SYNC_LIMITE_MAXIMO = 2000
+
+
+def _dados_sync_cliente(row):
+    dados = _dados_cliente(row)
+    for campo in ("ultima_ligacao", "proxima_ligacao"):
+        dados[campo] = dados[campo].isoformat() if dados[campo] else None
+    return dados
+
+
+@app.route('/api/sync')
+@login_required
+def api_sync():
+    """Réplica incremental de clientes, ligações e notas.
+
+    Sem `since`, devolve a carteira ativa inteira e o cursor a partir do qual
+    continuar. Com `since`, devolve só o que mudou depois dele (no máximo
+    `limite` alterações; `mais` indica que há outra página). Clientes
+    inativados ou que saíram da carteira vêm em `removidos`.
+    """
+    supervisor = current_user.tipo == 'supervisor'
+    limite = _limite_pagina(request.args.get('limite'), SYNC_LIMITE_PADRAO, SYNC_LIMITE_MAXIMO)
+    # alterações mais novas que a folga ficam para a próxima chamada: um id
+    # menor ainda pode estar em uma transação aberta
+    corte = datetime.now() - SYNC_FOLGA
+    visiveis = [Alteracao.criado_em < corte]
+    if not supervisor:
+        visiveis.append(Alteracao.consultor_id == current_user.id)
+
+    since = request.args.get('since')
+    if not since:
+        cursor = db.session.execute(
+            select(func.max(Alteracao.id)).where(Alteracao.criado_em < corte)
         ).scalar() or 0
+        conds = [Cliente.ativo == True]
+        if not supervisor:
+            conds.append(Cliente.consultor_id == current_user.id)
+        clientes = [_dados_sync_cliente(r) for r in
+                    db.session.execute(select(*_COLUNAS_LISTA_CLIENTES).where(*conds))]
+        return jsonify({"ok": True, "cursor": str(cursor), "mais": False, "completo": True,
+                        "clientes": clientes, "ligacoes": [], "notas": [],
+                        "removidos": {"clientes": [], "ligacoes": [], "notas": []}})
 
-        def _fmt_money(v):
-            try:
-                v = float(v or 0)
-                return f"{v:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            except:
-                return "0,00"
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify({"ok": False, "mensagem": "Cursor inválido"}), 400
+
+    alteracoes = db.session.execute(
+        select(Alteracao.id, Alteracao.entidade, Alteracao.entidade_id)
+        .where(Alteracao.id > since, *visiveis)
+        .order_by(Alteracao.id)
+        .limit(limite)
+    ).all()
+    cursor = alteracoes[-1].id if alteracoes else since
+    ids = {'cliente': set(), 'ligacao': set(), 'nota': set()}
+    for a in alteracoes:
+        ids[a.entidade].add(a.entidade_id)
+
+    clientes, removidos_clientes = [], set(ids['cliente'])
+    if ids['cliente']:
+        for row in db.session.execute(
+            select(*_COLUNAS_LISTA_CLIENTES, Cliente.ativo, Cliente.consultor_id)
+            .where(Cliente.id.in_(ids['cliente']))
+        ):
+            if row.ativo and (supervisor or row.consultor_id == current_user.id):
+                clientes.append(_dados_sync_cliente(row))
+                removidos_clientes.discard(row.id)
+
+    ligacoes = []
+    if ids['ligacao']:
+        for row in db.session.execute(
+            select(Ligacao.id, Ligacao.cliente_id, Ligacao.data_hora, Ligacao.resultado,
+                   Ligacao.contato_nome, Ligacao.valor_venda, Ligacao.observacao,
+                   Usuario.nome.label('autor'))
+            .outerjoin(Usuario, Usuario.id == Ligacao.consultor_id)
+            .where(Ligacao.id.in_(ids['ligacao']))
+        ):
+            ligacoes.append({
+                "id": row.id,
+                "cliente_id": row.cliente_id,
+                "data_hora": row.data_hora.isoformat() if row.data_hora else None,
+                "resultado": row.resultado,
+                "contato_nome": row.contato_nome,
+                "valor_venda": float(row.valor_venda or 0),
+                "observacao": row.observacao,
+                "autor": row.autor,
+            })
 
-        stats['receita_mes'] = _fmt_money(receita_total)
+    notas = []
+    if ids['nota']:
+        for row in db.session.execute(
+            select(Nota.id, Nota.cliente_id, Nota.texto, Nota.data_criacao,
+                   Usuario.nome.label('autor'))
+            .outerjoin(Usuario, Usuario.id == Nota.usuario_id)
+            .where(Nota.id.in_(ids['nota']))
+        ):
+            notas.append({
+                "id": row.id,
+                "cliente_id": row.cliente_id,
+                "texto": row.texto,
+                "data_criacao": row.data_criacao.isoformat() if row.data_criacao else None,
+                "autor": row.autor,
+            })
+
+    return jsonify({
+        "ok": True,
+        "cursor": str(cursor),
+        "mais": len(alteracoes) == limite,
+        "completo": False,
+        "clientes": clientes,
+        "ligacoes": ligacoes,
+        "notas": notas,
+        "removidos": {
+            "clientes": sorted(removidos_clientes),
+            "ligacoes": sorted(ids['ligacao'] - {l["id"] for l in ligacoes}),
+            "notas": sorted(ids['nota'] - {n["id"] for n in notas}),
+        },
+    })
+
+# =============================================================================
+# LISTAGEM DE CLIENTES
+# =============================================================================
+@app.route('/meus-clientes')
+@classe_carga(_classe_lista_clientes)
+def meus_clientes():
+    if not current_user.is_authenticated:
+        return redirect(url_for('login'))
+
+    if current_user.tipo not in ('consultor', 'supervisor'):
+        flash('Perfil sem acesso.', 'danger')
+        return redirect(url_for('index'))
+
+    aba = request.args.get('aba', 'pendentes')
+    apenas_meus = True if current_user.tipo == 'consultor' else (request.args.get('meus') == '1')
+    
+    # Parâmetros de filtro mensal para consultores
+    mes_filtro = None
+    ano_filtro = None
+    if current_user.tipo == 'consultor':
+        mes_filtro = request.args.get('mes')
+        ano_filtro = request.args.get('ano')
+        if mes_filtro:
+            mes_filtro = int(mes_filtro)
+        if ano_filtro:
+            ano_filtro = int(ano_filtro)
+
+    conds = _condicoes_clientes(apenas_meus, s(request.args.get('q')))
+    contagens = _contagem_abas(conds)
+    clientes = _clientes_da_aba(aba, conds, request.args.get('filtro'))
+
+    consultores = (Usuario.query
+                   .filter_by(tipo='consultor', ativo=True)
+                   .order_by(Usuario.nome.asc())
+                   .all() if current_user.tipo == 'supervisor' else None)
+
+    stats = {}
+    if current_user.tipo == 'consultor':
+        st = stats_consultor(current_user)
+        stats['total_clientes'] = st['total_clientes']
+        stats['ligacoes_hoje'] = st['ligacoes_hoje']
+        stats['ligacoes_semana'] = st['ligacoes_semana']
+        stats['ligacoes_mes'] = st['ligacoes_mes']
+        stats['meta_diaria'] = st['meta_diaria']
+        stats['progresso_meta'] = st['progresso_meta']
+        stats['taxa_conversao'] = round(_percent(st['vendas_mes'], st['ligacoes_mes']), 1)
+        stats['receita_mes'] = formatar_dinheiro(st['receita_mes'])
     
     # Gerar lista de meses/anos disponíveis para o filtro do consultor
     meses_disponiveis_consultor = []
@@ -434,9 +1370,9 @@ def meus_clientes():
     return render_template(
         'meus_clientes.html',
         clientes=clientes,
-        total_pendentes=len(pendentes),
-        total_contatados=len(contatados),
-        total_retornar=len(precisa_retornar),
+        total_pendentes=contagens['pendentes'],
+        total_contatados=contagens['contatados'],
+        total_retornar=contagens['retornar'],
         aba=aba,
         is_supervisor=(current_user.tipo == 'supervisor'),
         now=datetime.now,
@@ -490,7 +1426,10 @@ def criar_cliente_manual():
                 )
                 db.session.add(n)
 
+                emitir_evento('cliente_atualizado', cliente_id=existente.id, dono_id=consultor_id,
+                              por=current_user.id, reativado=True)
                 db.session.commit()
+                invalidar_stats_consultor(consultor_id)
                 return jsonify({
                     "ok": True,
                     "mensagem": "Cliente atualizado (reativado) com sucesso!",
@@ -516,7 +1455,10 @@ def criar_cliente_manual():
         )
         db.session.add(n)
 
+        emitir_evento('cliente_criado', cliente_id=novo.id, dono_id=consultor_id,
+                      por=current_user.id, origem='manual')
         db.session.commit()
+        invalidar_stats_consultor(consultor_id)
         return jsonify({
             "ok": True,
             "mensagem": "Cliente criado com sucesso!",
@@ -530,6 +1472,84 @@ def criar_cliente_manual():
 # =============================================================================
 # REGISTRAR LIGAÇÃO
 # =============================================================================
+def _proxima_ligacao(resultado, payload, base):
+    """Regra de retorno: data escolhida (9h), N dias ou 30 dias; None se não for 'retornar'."""
+    if resultado != 'retornar':
+        return None
+
+    dias_retorno = None
+    data_retorno = s(payload.get('data_retorno'))
+    try:
+        dias_retorno = int(payload.get('dias_retorno')) if payload.get('dias_retorno') else None
+    except Exception:
+        dias_retorno = None
+
+    if data_retorno:
+        try:
+            d = datetime.strptime(data_retorno, "%Y-%m-%d").date()
+            return datetime(d.year, d.month, d.day, 9, 0, 0)
+        except Exception:
+            return base + timedelta(days=30)
+    elif dias_retorno and dias_retorno > 0:
+        return base + timedelta(days=dias_retorno)
+    return base + timedelta(days=30)
+
+
+def _registrar_ligacao_cliente(cli, payload, quando, chave=None):
+    """Cria a Ligacao e atualiza resumo e próxima ligação do cliente (sem commit)."""
+    obs = s(payload.get('observacao'))
+    contato_nome = s(payload.get('contato_nome'))
+    resultado = s(payload.get('resultado') or 'nao_comprou')
+
+    try:
+        valor_venda = float(str(payload.get('valor_venda') or 0).replace(',', '.'))
+    except:
+        valor_venda = 0.0
+
+    if resultado not in ('comprou', 'nao_comprou', 'retornar', 'sem_interesse', 'relacionamento', 'cliente_inativo'):
+        resultado = 'nao_comprou'
+
+    lig = Ligacao(
+        cliente_id=cli.id,
+        consultor_id=current_user.id,
+        data_hora=quando,
+        observacao=obs or None,
+        contato_nome=contato_nome or None,
+        resultado=resultado,
+        valor_venda=valor_venda,
+        chave_idempotencia=chave
+    )
+    db.session.add(lig)
+
+    # ligação mais antiga que a última conhecida (fila offline) não mexe no retorno
+    mais_recente = not cli.ultima_ligacao or quando >= cli.ultima_ligacao
+    _registrar_resumo_ligacao(cli, quando)
+    if mais_recente:
+        cli.proxima_ligacao = _proxima_ligacao(resultado, payload, quando)
+    _evento_ligacao(lig, cli)
+    return resultado
+
+
+def _evento_ligacao(lig, cli):
+    db.session.flush()  # id da ligação para o evento
+    emitir_evento('ligacao_registrada',
+                  ligacao_id=lig.id,
+                  cliente_id=cli.id,
+                  dono_id=cli.consultor_id,
+                  consultor_id=lig.consultor_id,
+                  resultado=lig.resultado,
+                  valor_venda=float(lig.valor_venda or 0),
+                  data_hora=lig.data_hora.isoformat())
+
+
+def _chaves_existentes(chaves):
+    if not chaves:
+        return set()
+    return set(db.session.execute(
+        select(Ligacao.chave_idempotencia).where(Ligacao.chave_idempotencia.in_(list(chaves)))
+    ).scalars())
+
+
 @app.route('/registrar-ligacao/<int:cliente_id>', methods=['POST'])
 def registrar_ligacao(cliente_id: int):
     if not current_user.is_authenticated:
@@ -537,14 +1557,7 @@ def registrar_ligacao(cliente_id: int):
 
     try:
         payload = request.get_json(silent=True) or {}
-        obs = s(payload.get('observacao'))
-        contato_nome = s(payload.get('contato_nome'))
-        resultado = s(payload.get('resultado') or 'nao_comprou')
-
-        try:
-            valor_venda = float(str(payload.get('valor_venda') or 0).replace(',', '.'))
-        except:
-            valor_venda = 0.0
+        chave = s(payload.get('chave_idempotencia'))[:64] or None
 
         cli = Cliente.query.get(cliente_id)
         if not cli:
@@ -553,44 +1566,19 @@ def registrar_ligacao(cliente_id: int):
         if current_user.tipo == 'consultor' and cli.consultor_id != current_user.id:
             return jsonify({"ok": False, "mensagem": "Sem permissão para este cliente."}), 403
 
-        agora = datetime.now()
+        if chave and _chaves_existentes([chave]):
+            return jsonify({"ok": True, "mensagem": "Ligação já registrada.", "duplicada": True})
 
-        if resultado not in ('comprou', 'nao_comprou', 'retornar', 'sem_interesse', 'relacionamento', 'cliente_inativo'):
-            resultado = 'nao_comprou'
+        resultado = _registrar_ligacao_cliente(cli, payload, datetime.now(), chave)
 
-        lig = Ligacao(
-            cliente_id=cliente_id,
-            consultor_id=current_user.id,
-            data_hora=agora,
-            observacao=obs or None,
-            contato_nome=contato_nome or None,
-            resultado=resultado,
-            valor_venda=valor_venda
-        )
-        db.session.add(lig)
-
-        if resultado == 'retornar':
-            dias_retorno = None
-            data_retorno = s(payload.get('data_retorno'))
-            try:
-                dias_retorno = int(payload.get('dias_retorno')) if payload.get('dias_retorno') else None
-            except Exception:
-                dias_retorno = None
-
-            if data_retorno:
-                try:
-                    d = datetime.strptime(data_retorno, "%Y-%m-%d").date()
-                    cli.proxima_ligacao = datetime(d.year, d.month, d.day, 9, 0, 0)
-                except Exception:
-                    cli.proxima_ligacao = agora + timedelta(days=30)
-            elif dias_retorno and dias_retorno > 0:
-                cli.proxima_ligacao = agora + timedelta(days=dias_retorno)
-            else:
-                cli.proxima_ligacao = agora + timedelta(days=30)
-        else:
-            cli.proxima_ligacao = None
-
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if chave and _chaves_existentes([chave]):
+                return jsonify({"ok": True, "mensagem": "Ligação já registrada.", "duplicada": True})
+            raise
+        invalidar_stats_consultor(current_user.id)
 
         msg = "Ligação registrada!"
         if resultado == 'retornar':
@@ -604,6 +1592,110 @@ def registrar_ligacao(cliente_id: int):
         db.session.rollback()
         return jsonify({"ok": False, "mensagem": f"Erro: {str(e)}"}), 500
 
+# =============================================================================
+# REGISTRAR LIGAÇÕES EM LOTE (idempotente)
+# =============================================================================
+LOTE_LIGACOES_MAX = 500
+JANELA_LIGACAO_OFFLINE = timedelta(days=7)
+
+
+def _quando_ligacao(valor, agora):
+    """Horário informado pelo cliente (fila offline), limitado aos últimos 7 dias."""
+    try:
+        quando = datetime.fromisoformat(s(valor))
+    except ValueError:
+        return agora
+    if quando.tzinfo is not None:
+        quando = quando.astimezone().replace(tzinfo=None)
+    if quando > agora or quando < agora - JANELA_LIGACAO_OFFLINE:
+        return agora
+    return quando
+
+
+def _id_cliente_item(item):
+    """cliente_id de um item do lote, ou None se ausente/não numérico."""
+    if not isinstance(item, dict):
+        return None
+    try:
+        return int(item.get('cliente_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+@app.route('/registrar-ligacoes', methods=['POST'])
+@login_required
+def registrar_ligacoes_lote():
+    """Várias ligações em uma transação. Cada item traz `chave_idempotencia`
+    (gerada no navegador); reenvios da mesma chave voltam como 'duplicada'."""
+    payload = request.get_json(silent=True) or {}
+    itens = payload.get('ligacoes') or []
+    if not isinstance(itens, list) or not itens:
+        return jsonify({"ok": False, "mensagem": "Nenhuma ligação enviada"}), 400
+    if len(itens) > LOTE_LIGACOES_MAX:
+        return jsonify({"ok": False, "mensagem": f"Máximo de {LOTE_LIGACOES_MAX} ligações por lote"}), 400
+
+    for tentativa in range(2):
+        try:
+            agora = datetime.now()
+            chaves = {s(i.get('chave_idempotencia'))[:64] for i in itens if isinstance(i, dict)} - {""}
+            ja_gravadas = _chaves_existentes(chaves)
+
+            ids_itens = [_id_cliente_item(i) for i in itens]
+            ids = set(ids_itens) - {None}
+            clientes = {c.id: c for c in Cliente.query.filter(Cliente.id.in_(ids)).all()} if ids else {}
+
+            preparados = []
+            for item, cid in zip(itens, ids_itens):
+                if not isinstance(item, dict):
+                    preparados.append((None, None, None, None, item))
+                    continue
+                chave = s(item.get('chave_idempotencia'))[:64]
+                preparados.append((_quando_ligacao(item.get('data_hora'), agora), chave,
+                                   cid, clientes.get(cid), item))
+
+            resultados = [None] * len(preparados)
+            vistas = set()
+            # em ordem cronológica, para o retorno do cliente refletir a ligação mais recente
+            ordem = sorted(range(len(preparados)), key=lambda k: preparados[k][0] or agora)
+            for k in ordem:
+                quando, chave, cid, cli, item = preparados[k]
+                if quando is None:
+                    resultados[k] = {"chave_idempotencia": None, "status": "erro", "mensagem": "Item inválido"}
+                elif not chave:
+                    resultados[k] = {"chave_idempotencia": None, "status": "erro", "mensagem": "chave_idempotencia obrigatória"}
+                elif chave in ja_gravadas or chave in vistas:
+                    resultados[k] = {"chave_idempotencia": chave, "status": "duplicada"}
+                elif cid is None:
+                    resultados[k] = {"chave_idempotencia": chave, "status": "erro", "mensagem": "cliente_id inválido"}
+                elif not cli:
+                    resultados[k] = {"chave_idempotencia": chave, "status": "erro", "mensagem": "Cliente não encontrado"}
+                elif current_user.tipo == 'consultor' and cli.consultor_id != current_user.id:
+                    resultados[k] = {"chave_idempotencia": chave, "status": "erro", "mensagem": "Sem permissão para este cliente"}
+                else:
+                    _registrar_ligacao_cliente(cli, item, quando, chave)
+                    vistas.add(chave)
+                    resultados[k] = {"chave_idempotencia": chave, "status": "registrada"}
+
+            db.session.commit()
+            break
+        except IntegrityError:
+            # outra requisição gravou alguma das chaves ao mesmo tempo: refaz como replay
+            db.session.rollback()
+            if tentativa:
+                return jsonify({"ok": False, "mensagem": "Conflito ao gravar o lote, tente novamente"}), 409
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"ok": False, "mensagem": f"Erro: {str(e)}"}), 500
+
+    invalidar_stats_consultor(current_user.id)
+    return jsonify({
+        "ok": True,
+        "registradas": sum(1 for r in resultados if r["status"] == "registrada"),
+        "duplicadas": sum(1 for r in resultados if r["status"] == "duplicada"),
+        "erros": sum(1 for r in resultados if r["status"] == "erro"),
+        "resultados": resultados,
+    })
+
 # =============================================================================
 # 🆕 EDITAR OBSERVAÇÃO DE LIGAÇÃO
 # =============================================================================
@@ -631,6 +1723,73 @@ def editar_observacao(ligacao_id: int):
         db.session.rollback()
         return jsonify({"ok": False, "mensagem": f"Erro: {str(e)}"}), 500
 
+# =============================================================================
+# ARQUIVO DE LIGAÇÕES (dados antigos fora da tabela quente)
+# =============================================================================
+# Ligações anteriores ao horizonte (ARQUIVO_MESES, contado em meses fechados)
+# vão para `ligacoes_arquivo`, assim `ligacoes` e seus índices ficam do tamanho
+# do período que o dia a dia consulta. Quem lê por período monta o SELECT com
+# _ligacoes_quentes_e_arquivo(): a tabela de arquivo só entra quando o período
+# alcança dados arquivados, e o filtro vai dentro de cada ramo do UNION (o
+# MySQL 5.7 não empurra condições para dentro de uma subconsulta com UNION).
+ARQUIVO_MESES = int(os.getenv("ARQUIVO_MESES", "0"))  # 0 = não arquiva automaticamente
+ARQUIVO_LOTE = 5000
+
+_COLUNAS_ARQUIVO = ('id', 'cliente_id', 'consultor_id', 'data_hora', 'observacao',
+                    'contato_nome', 'resultado', 'valor_venda', 'atualizado_em')
+
+
+def _ultima_arquivada():
+    return db.session.execute(select(func.max(LigacaoArquivo.data_hora))).scalar()
+
+
+def _ligacoes_quentes_e_arquivo(montar, inicio=None):
+    """`montar(t, arquivada)` devolve o SELECT para uma tabela de ligações
+    (`t` é Ligacao.__table__ ou LigacaoArquivo.__table__; `arquivada` é a
+    coluna literal que marca a origem). Devolve a lista de SELECTs para o
+    UNION ALL: só o da tabela quente, ou também o do arquivo quando `inicio`
+    é None ou anterior à ligação arquivada mais recente."""
+    partes = [montar(Ligacao.__table__, false())]
+    ultima = _ultima_arquivada()
+    if ultima is not None and (inicio is None or inicio <= ultima):
+        partes.append(montar(LigacaoArquivo.__table__, true()))
+    return partes
+
+
+def arquivar_ligacoes(meses=None):
+    """Move para o arquivo as ligações anteriores ao 1º dia do mês de `meses`
+    meses atrás, em lotes (cada lote copia e apaga na mesma transação).
+    Devolve quantas foram movidas."""
+    meses = ARQUIVO_MESES if meses is None else meses
+    if meses <= 0:
+        return 0
+    hoje = date.today()
+    ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - meses, 12)
+    corte = datetime(ano, mes + 1, 1)
+
+    quente, arquivo = Ligacao.__table__, LigacaoArquivo.__table__
+    total = 0
+    while True:
+        ids = db.session.execute(
+            select(quente.c.id).where(quente.c.data_hora < corte)
+            .order_by(quente.c.id).limit(ARQUIVO_LOTE)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(
+            insert(arquivo).from_select(
+                [*_COLUNAS_ARQUIVO, 'arquivada_em'],
+                select(*[quente.c[c] for c in _COLUNAS_ARQUIVO], literal(datetime.now()))
+                .where(quente.c.id.in_(ids))
+            )
+        )
+        db.session.execute(quente.delete().where(quente.c.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+
+    print(f"🗄️ Arquivo de ligações: {total} movidas (anteriores a {corte:%d/%m/%Y})")
+    return total
+
 # =============================================================================
 # HISTÓRICO LIGAÇÕES
 # =============================================================================
@@ -640,49 +1799,169 @@ def historico_ligacoes(cliente_id: int):
         return jsonify([])
 
     try:
-        cli = Cliente.query.get(cliente_id)
-        if not cli:
+        dono_id = db.session.execute(
+            select(Cliente.consultor_id).where(Cliente.id == cliente_id)
+        ).scalar_one_or_none()
+        if dono_id is None:
             return jsonify([])
 
-        if current_user.tipo == 'consultor' and cli.consultor_id != current_user.id:
+        if current_user.tipo == 'consultor' and dono_id != current_user.id:
             return jsonify([])
 
-        regs = (Ligacao.query
-                .options(joinedload(Ligacao.consultor))
-                .filter(Ligacao.cliente_id == cliente_id)
-                .order_by(Ligacao.data_hora.desc())
-                .all())
+        def montar(t, arquivada):
+            return (select(t.c.id, t.c.data_hora, t.c.consultor_id, Usuario.nome,
+                           t.c.contato_nome, t.c.resultado, t.c.valor_venda,
+                           t.c.observacao, arquivada.label('arquivada'))
+                    .outerjoin(Usuario, Usuario.id == t.c.consultor_id)
+                    .where(t.c.cliente_id == cliente_id))
+
+        ligs = union_all(*_ligacoes_quentes_e_arquivo(montar)).subquery()
+        stmt = select(ligs).order_by(ligs.c.data_hora.desc())
 
         out = []
-        for r in regs:
+        for lid, data_hora, consultor_id, consultor_nome, contato, resultado, valor, obs, arquivada in db.session.execute(stmt):
             try:
-                dt = r.data_hora.strftime("%d/%m/%Y %H:%M") if r.data_hora else ""
-                consultor_nome = r.consultor.nome if getattr(r, "consultor", None) else ""
-                contato = s(r.contato_nome)
-                resultado = s(r.resultado)
-                try:
-                    valor_num = float(r.valor_venda or 0)
-                except Exception:
-                    valor_num = 0.0
-
-                out.append({
-                    "id": r.id,  # 🆕 NOVO: incluir ID da ligação
-                    "data_hora": dt,
-                    "consultor": consultor_nome,
-                    "contato_nome": contato,
-                    "resultado": resultado,
-                    "valor_venda": formatar_dinheiro(valor_num),
-                    "observacao": s(r.observacao),
-                    "pode_editar": (current_user.tipo == 'supervisor' or r.consultor_id == current_user.id)  # 🆕 NOVO
-                })
+                valor_num = float(valor or 0)
             except Exception:
-                continue
+                valor_num = 0.0
+
+            out.append({
+                "id": lid,  # 🆕 NOVO: incluir ID da ligação
+                "data_hora": data_hora.strftime("%d/%m/%Y %H:%M") if data_hora else "",
+                "consultor": consultor_nome or "",
+                "contato_nome": s(contato),
+                "resultado": s(resultado),
+                "valor_venda": formatar_dinheiro(valor_num),
+                "observacao": s(obs),
+                "pode_editar": not arquivada and (current_user.tipo == 'supervisor' or consultor_id == current_user.id)  # 🆕 NOVO
+            })
 
         return jsonify(out)
 
     except Exception:
         return jsonify([])
 
+# =============================================================================
+# LINHA DO TEMPO DO CLIENTE (ligações + notas, paginada e com cache HTTP)
+# =============================================================================
+@app.route('/clientes/<int:cliente_id>/timeline')
+@login_required
+def timeline_cliente(cliente_id: int):
+    # Uma consulta leve decide permissão e validadores (ETag/Last-Modified)
+    # antes de montar a página; reabrir o modal sem mudanças devolve 304.
+    lig_total = (select(func.count(Ligacao.id))
+                 .where(Ligacao.cliente_id == cliente_id).scalar_subquery())
+    lig_ultima = (select(func.max(Ligacao.atualizado_em))
+                  .where(Ligacao.cliente_id == cliente_id).scalar_subquery())
+    nota_total = (select(func.count(Nota.id))
+                  .where(Nota.cliente_id == cliente_id).scalar_subquery())
+    nota_ultima = (select(func.max(Nota.data_criacao))
+                   .where(Nota.cliente_id == cliente_id).scalar_subquery())
+    info = db.session.execute(
+        select(Cliente.consultor_id, lig_total, lig_ultima, nota_total, nota_ultima)
+        .where(Cliente.id == cliente_id)
+    ).first()
+    if not info:
+        return jsonify({"ok": False, "mensagem": "Cliente não encontrado"}), 404
+
+    dono_id, n_lig, ult_lig, n_nota, ult_nota = info
+    if current_user.tipo == 'consultor' and dono_id != current_user.id:
+        return jsonify({"ok": False, "mensagem": "Sem permissão"}), 403
+
+    limite = _limite_pagina(request.args.get('limite'), padrao=20)
+    cursor_txt = request.args.get('cursor') or ""
+    cursor = _decodificar_cursor(cursor_txt)
+
+    ultima_escrita = max([d for d in (ult_lig, ult_nota) if d], default=None)
+    assinatura = f"{cliente_id}|{n_lig}|{ult_lig}|{n_nota}|{ult_nota}|{limite}|{cursor_txt}|{current_user.id}"
+
+    resp = app.response_class(mimetype='application/json')
+    resp.set_etag(hashlib.md5(assinatura.encode()).hexdigest())
+    if ultima_escrita:
+        resp.last_modified = ultima_escrita
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    resp.make_conditional(request)
+    if resp.status_code == 304:
+        return resp
+
+    # Ligações e notas na mesma consulta. A chave de desempate é o id da
+    # ligação (positivo) ou o id da nota negado, para que um único cursor
+    # (quando, chave) funcione sobre as duas tabelas.
+    def q_lig(t, arquivada):
+        q = (select(literal('ligacao').label('tipo'),
+                    t.c.id.label('chave'),
+                    t.c.data_hora.label('quando'),
+                    t.c.consultor_id.label('autor_id'),
+                    Usuario.nome.label('autor'),
+                    t.c.resultado.label('resultado'),
+                    t.c.contato_nome.label('contato_nome'),
+                    t.c.valor_venda.label('valor_venda'),
+                    t.c.observacao.label('texto'),
+                    arquivada.label('arquivada'))
+             .outerjoin(Usuario, Usuario.id == t.c.consultor_id)
+             .where(t.c.cliente_id == cliente_id))
+        if cursor:
+            c_quando, c_chave = cursor
+            q = q.where(or_(
+                t.c.data_hora < c_quando,
+                and_(t.c.data_hora == c_quando,
+                     t.c.id < c_chave if c_chave > 0 else false())
+            ))
+        return q
+
+    q_nota = (select(literal('nota').label('tipo'),
+                     (-Nota.id).label('chave'),
+                     Nota.data_criacao.label('quando'),
+                     Nota.usuario_id.label('autor_id'),
+                     Usuario.nome.label('autor'),
+                     null().label('resultado'),
+                     null().label('contato_nome'),
+                     null().label('valor_venda'),
+                     Nota.texto.label('texto'),
+                     false().label('arquivada'))
+              .outerjoin(Usuario, Usuario.id == Nota.usuario_id)
+              .where(Nota.cliente_id == cliente_id))
+
+    if cursor:
+        c_quando, c_chave = cursor
+        q_nota = q_nota.where(or_(
+            Nota.data_criacao < c_quando,
+            and_(Nota.data_criacao == c_quando,
+                 true() if c_chave > 0 else Nota.id > -c_chave)
+        ))
+
+    linha = union_all(*_ligacoes_quentes_e_arquivo(q_lig), q_nota).subquery()
+    rows = db.session.execute(
+        select(linha).order_by(linha.c.quando.desc(), linha.c.chave.desc()).limit(limite + 1)
+    ).all()
+
+    proximo_cursor = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        proximo_cursor = _codificar_cursor(rows[-1].quando, rows[-1].chave)
+
+    itens = []
+    for tipo, chave, quando, autor_id, autor, resultado, contato, valor, texto, arquivada in rows:
+        item = {
+            "tipo": tipo,
+            "id": abs(chave),
+            "quando": quando.strftime("%d/%m/%Y %H:%M") if quando else "",
+            "autor": autor or "",
+            "texto": s(texto),
+        }
+        if tipo == 'ligacao':
+            item.update({
+                "resultado": s(resultado),
+                "contato_nome": s(contato),
+                "valor_venda": formatar_dinheiro(valor),
+                "pode_editar": not arquivada and (current_user.tipo == 'supervisor' or autor_id == current_user.id),
+            })
+        itens.append(item)
+
+    resp.set_data(app.json.dumps({"ok": True, "itens": itens, "proximo_cursor": proximo_cursor}))
+    return resp
+
 # =============================================================================
 # NOTAS RÁPIDAS
 # =============================================================================
@@ -690,17 +1969,16 @@ def historico_ligacoes(cliente_id: int):
 def listar_notas(cliente_id: int):
     if not current_user.is_authenticated:
         return jsonify([])
-    notas = (Nota.query
-             .options(joinedload(Nota.usuario))
-             .filter(Nota.cliente_id == cliente_id)
-             .order_by(Nota.data_criacao.desc())
-             .all())
+    stmt = (select(Nota.id, Usuario.nome, Nota.texto, Nota.data_criacao)
+            .outerjoin(Usuario, Usuario.id == Nota.usuario_id)
+            .where(Nota.cliente_id == cliente_id)
+            .order_by(Nota.data_criacao.desc()))
     out = [{
-        "id": n.id,
-        "autor": n.usuario.nome if n.usuario else "",
-        "texto": n.texto,
-        "quando": n.data_criacao.strftime("%d/%m/%Y %H:%M")
-    } for n in notas]
+        "id": nid,
+        "autor": autor or "",
+        "texto": texto,
+        "quando": quando.strftime("%d/%m/%Y %H:%M")
+    } for nid, autor, texto, quando in db.session.execute(stmt)]
     return jsonify(out)
 
 
@@ -787,6 +2065,7 @@ def importar_clientes_view():
 
         total_inseridos, pulados = 0, 0
         erros = []
+        criados, atualizados = [], []  # (cliente, reativado, dono anterior) para os eventos
 
         for i, row in df.iterrows():
             try:
@@ -828,6 +2107,7 @@ def importar_clientes_view():
                         if representante and representante != existente_ativo.representante_nome:
                             existente_ativo.representante_nome = representante[:200]
                             mudou = True
+                        dono_anterior = existente_ativo.consultor_id
                         if consultor_id and existente_ativo.consultor_id != consultor_id:
                             existente_ativo.consultor_id = consultor_id
                             mudou = True
@@ -837,12 +2117,14 @@ def importar_clientes_view():
 
                         if mudou:
                             total_inseridos += 1
+                            atualizados.append((existente_ativo, False, dono_anterior))
                         else:
                             pulados += 1
                         continue
 
                     existente_inativo = Cliente.query.filter_by(cnpj=empresa_cnpj, ativo=False).first()
                     if existente_inativo:
+                        atualizados.append((existente_inativo, True, existente_inativo.consultor_id))
                         existente_inativo.nome = nome_cliente[:200] or existente_inativo.nome
                         existente_inativo.telefone = telefone
                         existente_inativo.representante_nome = (representante[:200] or None)
@@ -862,6 +2144,7 @@ def importar_clientes_view():
                     origem='importado_csv'
                 )
                 db.session.add(novo)
+                criados.append(novo)
                 total_inseridos += 1
 
             except Exception as e:
@@ -877,6 +2160,14 @@ def importar_clientes_view():
         except Exception:
             pass
 
+        db.session.flush()  # ids dos clientes novos para os eventos
+        for cli in criados:
+            emitir_evento('cliente_criado', cliente_id=cli.id, dono_id=cli.consultor_id,
+                          por=current_user.id, origem='importado_csv', arquivo=imp_nome)
+        for cli, reativado, dono_anterior in atualizados:
+            emitir_evento('cliente_atualizado', cliente_id=cli.id, dono_id=cli.consultor_id,
+                          dono_anterior=dono_anterior, por=current_user.id, reativado=reativado,
+                          origem='importado_csv', arquivo=imp_nome)
         db.session.commit()
 
         msg = f'Importação concluída! Inseridos/Atualizados/Reativados: {total_inseridos} • Pulados: {pulados}'
@@ -909,13 +2200,339 @@ def limpar_clientes_consultor():
         if not consultor_id:
             return jsonify({"ok": False, "mensagem": "Consultor não informado"}), 400
 
-        clientes = Cliente.query.filter_by(consultor_id=consultor_id, ativo=True).all()
-        for cli in clientes:
-            cli.ativo = False
+        res = operacao_clientes_em_massa('inativar', current_user, consultor_id=int(consultor_id))
+        return jsonify({"ok": True, "mensagem": f"{res['afetados']} clientes removidos com sucesso."})
 
-        db.session.commit()
-        return jsonify({"ok": True, "mensagem": f"{len(clientes)} clientes removidos com sucesso."})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "mensagem": f"Erro: {str(e)}"}), 500
+
+# =============================================================================
+# OPERAÇÕES EM MASSA (inativar / reatribuir / reativar)
+# =============================================================================
+LOTE_OPERACOES = int(os.getenv("LOTE_OPERACOES", "1000"))
+
+
+def _em_lotes(seq, tamanho=LOTE_OPERACOES):
+    for i in range(0, len(seq), tamanho):
+        yield seq[i:i + tamanho]
+
+
+def _inserir_notas_em_massa(donos, usuario_id, texto):
+    """Notas de auditoria do lote, num flush só.
+
+    `donos` mapeia cliente_id -> consultor dono após a operação; o UPDATE do
+    lote já rodou, então o log de alterações (after_flush) acha o mesmo dono.
+    Os ids vêm do próprio INSERT (RETURNING em lote onde o banco tem; no MySQL,
+    um INSERT por nota): reler por data pegaria notas de outra operação.
+    """
+    if not donos:
+        return 0
+    agora = datetime.now().replace(microsecond=0)  # DATETIME do MySQL não guarda fração
+    db.session.add_all([
+        Nota(cliente_id=cid, usuario_id=usuario_id, texto=texto, data_criacao=agora)
+        for cid in donos
+    ])
+    db.session.flush()
+    return len(donos)
+
+
+def operacao_clientes_em_massa(operacao, autor, consultor_id=None, destino_id=None,
+                               cliente_ids=None, origem=None):
+    """Aplica `operacao` a todos os clientes que batem no filtro.
+
+    Só os ids são lidos; as mudanças saem em UPDATEs por lote de LOTE_OPERACOES
+    linhas, cada lote com suas notas de auditoria e seu próprio commit, para
+    não segurar locks longos em carteiras grandes.
+    """
+    conds = []
+    if consultor_id:
+        conds.append(Cliente.consultor_id == consultor_id)
+    if cliente_ids:
+        conds.append(Cliente.id.in_(cliente_ids))
+    if origem:
+        conds.append(Cliente.origem == origem)
+    if not conds:
+        raise ValueError("Informe consultor, lista de clientes ou origem.")
+
+    quando = datetime.now().strftime('%d/%m/%Y %H:%M')
+    if operacao == 'inativar':
+        conds.append(Cliente.ativo == True)
+        valores = {"ativo": False}
+        texto = f"Cliente inativado em massa por {autor.nome} em {quando}."
+    elif operacao == 'reativar':
+        conds.append(Cliente.ativo == False)
+        valores = {"ativo": True}
+        if destino_id:
+            valores["consultor_id"] = destino_id
+        texto = f"Cliente reativado em massa por {autor.nome} em {quando}."
+    elif operacao == 'reatribuir':
+        if not destino_id:
+            raise ValueError("Consultor de destino não informado.")
+        conds += [Cliente.ativo == True, Cliente.consultor_id != destino_id]
+        valores = {"consultor_id": destino_id}
+        texto = f"Cliente reatribuído em massa por {autor.nome} em {quando}."
+    else:
+        raise ValueError("Operação inválida.")
+
+    if destino_id and not db.session.execute(
+        select(Usuario.id).where(Usuario.id == destino_id, Usuario.tipo == 'consultor', Usuario.ativo == True)
+    ).first():
+        raise ValueError("Consultor de destino inválido ou inativo.")
+
+    ids = db.session.execute(
+        select(Cliente.id).where(*conds).order_by(Cliente.id)
+    ).scalars().all()
+
+    afetados = 0
+    notas = 0
+    for ids_lote in _em_lotes(ids):
+        try:
+            # o filtro vale de novo em cada lote: cliente reatribuído ou inativado
+            # depois da leitura dos ids fica de fora
+            lote = db.session.execute(
+                select(Cliente.id, Cliente.consultor_id)
+                .where(Cliente.id.in_(ids_lote), *conds)
+                .with_for_update()
+            ).all()
+            if not lote:
+                db.session.rollback()
+                continue
+            res = db.session.execute(
+                update(Cliente)
+                .where(Cliente.id.in_([cid for cid, _ in lote]), *conds)
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+            donos = {cid: valores.get("consultor_id", dono) for cid, dono in lote}
+            registrar_alteracoes([('cliente', cid, dono) for cid, dono in lote] +
+                                 [('cliente', cid, dono) for cid, dono in donos.items()])
+            notas += _inserir_notas_em_massa(donos, autor.id, texto)
+            emitir_evento('clientes_em_massa', operacao=operacao, cliente_ids=list(donos),
+                          destino_id=valores.get("consultor_id"), por=autor.id)
+            db.session.commit()
+            afetados += res.rowcount
+        except Exception:
+            db.session.rollback()
+            raise
+
+    for uid in {consultor_id, destino_id} - {None}:
+        invalidar_stats_consultor(uid)
+    return {"afetados": afetados, "notas": notas}
+
+
+@app.route('/supervisor/clientes/em-massa', methods=['POST'])
+@login_required
+def clientes_em_massa():
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+
+    try:
+        payload = request.get_json(silent=True) or {}
+        operacao = s(payload.get('operacao'))
+        cliente_ids = [int(x) for x in (payload.get('cliente_ids') or [])]
+        res = operacao_clientes_em_massa(
+            operacao,
+            current_user,
+            consultor_id=int(payload.get('consultor_id') or 0) or None,
+            destino_id=int(payload.get('destino_id') or 0) or None,
+            cliente_ids=cliente_ids or None,
+            origem=s(payload.get('origem')) or None,
+        )
+        return jsonify({
+            "ok": True,
+            "mensagem": f"{res['afetados']} clientes atualizados.",
+            "afetados": res["afetados"],
+            "notas": res["notas"],
+        })
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "mensagem": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "mensagem": f"Erro: {str(e)}"}), 500
+
+# =============================================================================
+# REDISTRIBUIÇÃO DE CARTEIRA (balanceamento por carga)
+# =============================================================================
+def _carga_clientes(conds):
+    """(id, consultor_id, pendente, atrasado, receita) dos clientes que batem em `conds`."""
+    agora = datetime.now()
+
+    def montar(t, arquivada):
+        return (select(t.c.cliente_id.label('cliente_id'), func.sum(t.c.valor_venda).label('receita'))
+                .join(Cliente, Cliente.id == t.c.cliente_id)
+                .where(t.c.resultado == 'comprou', *conds)
+                .group_by(t.c.cliente_id))
+
+    partes = union_all(*_ligacoes_quentes_e_arquivo(montar)).subquery()
+    receita = (select(partes.c.cliente_id, func.sum(partes.c.receita).label('receita'))
+               .group_by(partes.c.cliente_id)
+               .subquery())
+    rows = db.session.execute(
+        select(Cliente.id, Cliente.consultor_id,
+               case((Cliente.total_ligacoes == 0, 1), else_=0),
+               case((Cliente.proxima_ligacao <= agora, 1), else_=0),
+               func.coalesce(receita.c.receita, 0))
+        .outerjoin(receita, receita.c.cliente_id == Cliente.id)
+        .where(*conds)
+        .order_by(Cliente.id)
+    ).all()
+    return [(cid, cons, int(pend), int(atr), float(rec or 0)) for cid, cons, pend, atr, rec in rows]
+
+
+def planejar_redistribuicao(destino_ids, consultor_id=None, cliente_ids=None):
+    """Distribui clientes entre `destino_ids` equilibrando pendentes, retornos
+    atrasados, receita histórica e quantidade, proporcionalmente à meta_diaria.
+
+    Guloso: clientes do mais "pesado" ao mais leve, cada um vai para o consultor
+    de menor carga relativa (heap). Nada é gravado aqui.
+    """
+    conds = [Cliente.ativo == True]
+    if consultor_id:
+        conds.append(Cliente.consultor_id == consultor_id)
+    if cliente_ids:
+        conds.append(Cliente.id.in_(cliente_ids))
+    if not consultor_id and not cliente_ids:
+        raise ValueError("Informe o consultor de origem ou a lista de clientes.")
+
+    destinos = (Usuario.query
+                .filter(Usuario.id.in_(destino_ids), Usuario.tipo == 'consultor', Usuario.ativo == True)
+                .order_by(Usuario.id)
+                .all())
+    if not destinos:
+        raise ValueError("Nenhum consultor de destino válido.")
+
+    movidos = _carga_clientes(conds)
+    ids_movidos = {c[0] for c in movidos}
+
+    # carga atual dos destinos, sem os clientes que estão sendo redistribuídos
+    carga = {u.id: [0, 0, 0.0, 0] for u in destinos}  # pendentes, atrasados, receita, clientes
+    for cid, cons, pend, atr, rec in _carga_clientes([Cliente.ativo == True,
+                                                      Cliente.consultor_id.in_(list(carga))]):
+        if cid in ids_movidos:
+            continue
+        c = carga[cons]
+        c[0] += pend
+        c[1] += atr
+        c[2] += rec
+        c[3] += 1
+    antes = {uid: list(v) for uid, v in carga.items()}
+
+    # normalização: cada dimensão pesa o mesmo no total
+    tot_pend = sum(c[2] for c in movidos) + sum(v[0] for v in carga.values()) or 1
+    tot_atr = sum(c[3] for c in movidos) + sum(v[1] for v in carga.values()) or 1
+    tot_rec = sum(c[4] for c in movidos) + sum(v[2] for v in carga.values()) or 1.0
+    tot_cli = len(movidos) + sum(v[3] for v in carga.values()) or 1
+
+    def peso(pend, atr, rec, n=1):
+        return pend / tot_pend + atr / tot_atr + rec / tot_rec + n / tot_cli
+
+    capacidade = {u.id: float(u.meta_diaria or 10) for u in destinos}
+    heap = [(peso(*carga[uid][:3], n=carga[uid][3]) / capacidade[uid], uid) for uid in carga]
+    heapq.heapify(heap)
+
+    ordem = sorted(movidos, key=lambda c: (-peso(c[2], c[3], c[4]), c[0]))
+    atribuicao = {}
+    for cid, cons, pend, atr, rec in ordem:
+        _, uid = heapq.heappop(heap)
+        atribuicao[cid] = uid
+        c = carga[uid]
+        c[0] += pend
+        c[1] += atr
+        c[2] += rec
+        c[3] += 1
+        heapq.heappush(heap, (peso(*c[:3], n=c[3]) / capacidade[uid], uid))
+
+    origem = {c[0]: c[1] for c in movidos}
+    resumo = []
+    for u in destinos:
+        a, d = antes[u.id], carga[u.id]
+        resumo.append({
+            "id": u.id,
+            "nome": u.nome,
+            "meta_diaria": u.meta_diaria or 10,
+            "recebidos": sum(1 for cid, uid in atribuicao.items() if uid == u.id and origem[cid] != u.id),
+            "antes": {"clientes": a[3], "pendentes": a[0], "atrasados": a[1], "receita": round(a[2], 2)},
+            "depois": {"clientes": d[3], "pendentes": d[0], "atrasados": d[1], "receita": round(d[2], 2)},
+        })
+
+    mudancas = {cid: uid for cid, uid in atribuicao.items() if origem[cid] != uid}
+    return mudancas, resumo
+
+
+def aplicar_redistribuicao(mudancas, autor):
+    """Grava o plano: um UPDATE por destino e lote, com nota de auditoria."""
+    por_destino = {}
+    for cid, uid in mudancas.items():
+        por_destino.setdefault(uid, []).append(cid)
+
+    quando = datetime.now().strftime('%d/%m/%Y %H:%M')
+    texto = f"Cliente redistribuído por {autor.nome} em {quando}."
+    origem = {}
+    for lote in _em_lotes(list(mudancas)):
+        origem.update(db.session.execute(
+            select(Cliente.id, Cliente.consultor_id).where(Cliente.id.in_(lote))
+        ).all())
+
+    afetados = 0
+    for uid, ids in por_destino.items():
+        for lote in _em_lotes(sorted(ids)):
+            try:
+                res = db.session.execute(
+                    update(Cliente)
+                    .where(Cliente.id.in_(lote))
+                    .values(consultor_id=uid)
+                    .execution_options(synchronize_session=False)
+                )
+                registrar_alteracoes([('cliente', cid, origem[cid]) for cid in lote if cid in origem] +
+                                     [('cliente', cid, uid) for cid in lote])
+                _inserir_notas_em_massa(dict.fromkeys(lote, uid), autor.id, texto)
+                emitir_evento('clientes_em_massa', operacao='redistribuir', cliente_ids=lote,
+                              destino_id=uid, por=autor.id)
+                db.session.commit()
+                afetados += res.rowcount
+            except Exception:
+                db.session.rollback()
+                raise
+
+    for uid in set(origem.values()) | set(por_destino):
+        invalidar_stats_consultor(uid)
+    return afetados
 
+
+@app.route('/supervisor/redistribuir', methods=['POST'])
+@login_required
+def redistribuir_carteira():
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+
+    try:
+        payload = request.get_json(silent=True) or {}
+        destinos = [int(x) for x in (payload.get('destinos') or [])]
+        if not destinos:
+            return jsonify({"ok": False, "mensagem": "Informe os consultores de destino"}), 400
+
+        mudancas, resumo = planejar_redistribuicao(
+            destinos,
+            consultor_id=int(payload.get('consultor_id') or 0) or None,
+            cliente_ids=[int(x) for x in (payload.get('cliente_ids') or [])] or None,
+        )
+
+        if not payload.get('aplicar'):
+            return jsonify({"ok": True, "previa": True, "movimentos": len(mudancas), "destinos": resumo})
+
+        afetados = aplicar_redistribuicao(mudancas, current_user)
+        return jsonify({
+            "ok": True,
+            "previa": False,
+            "movimentos": afetados,
+            "destinos": resumo,
+            "mensagem": f"{afetados} clientes redistribuídos."
+        })
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "mensagem": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"ok": False, "mensagem": f"Erro: {str(e)}"}), 500
@@ -923,8 +2540,71 @@ def limpar_clientes_consultor():
 # =============================================================================
 # 🆕 FILTRAR RESULTADOS POR MÊS/ANO (SUPERVISOR)
 # =============================================================================
+# Meses fechados saem de resumo_mensal, mantido pelos eventos; o mês corrente
+# (e qualquer mês enquanto o resumo não foi carregado) é somado das ligações.
+#
+# Toda escrita que cria, apaga ou muda consultor/data/resultado/valor de uma
+# ligação precisa emitir 'ligacao_registrada' (ou o equivalente tratado aqui),
+# senão o resumo dos meses fechados fica defasado sem aviso. Hoje:
+#   - _registrar_ligacao_cliente (avulsa e em lote) e remover_cliente com
+#     motivo emitem via _evento_ligacao;
+#   - arquivar_ligacoes só move linhas para ligacoes_arquivo, e o resumo soma
+#     as duas tabelas: não precisa de evento;
+#   - editar_observacao não mexe em nada que o resumo conta;
+#   - semear_dados.py grava direto nas tabelas e por isso descarta o resumo e
+#     o offset de _resumo_mensal, que é refeito pela carga inicial.
+# tests/test_eventos.py confere o resumo contra a soma das ligações.
+def _resultados_por_consultor(t, conds, *colunas):
+    return (
+        select(
+            t.c.consultor_id, *colunas,
+            func.count(t.c.id).label("total"),
+            func.sum(case((t.c.resultado == 'comprou', 1), else_=0)).label("vendas"),
+            func.sum(case((t.c.resultado == 'comprou', t.c.valor_venda), else_=0)).label("receita")
+        )
+        .where(*conds)
+        .group_by(t.c.consultor_id, *colunas)
+    )
+
+
+def _carga_resumo_mensal():
+    def montar(t, arquivada):
+        ano, mes = func.extract('year', t.c.data_hora), func.extract('month', t.c.data_hora)
+        return _resultados_por_consultor(t, [t.c.data_hora != None], ano.label("ano"), mes.label("mes"))
+
+    partes = union_all(*_ligacoes_quentes_e_arquivo(montar)).subquery()
+    # sobra de uma carga anterior (offset apagado, base semeada de novo...)
+    db.session.execute(delete(ResumoMensal))
+    db.session.execute(insert(ResumoMensal).from_select(
+        ["consultor_id", "ano", "mes", "ligacoes", "vendas", "receita"],
+        select(partes.c.consultor_id, partes.c.ano, partes.c.mes, func.sum(partes.c.total),
+               func.sum(partes.c.vendas), func.coalesce(func.sum(partes.c.receita), 0))
+        .group_by(partes.c.consultor_id, partes.c.ano, partes.c.mes)
+    ))
+
+
+@assinar('ligacao_registrada', carga_inicial=_carga_resumo_mensal)
+def _resumo_mensal(tipo, dados):
+    quando = datetime.fromisoformat(dados["data_hora"])
+    chave = (ResumoMensal.ano == quando.year, ResumoMensal.mes == quando.month,
+             ResumoMensal.consultor_id == dados["consultor_id"])
+    venda = dados.get("resultado") == 'comprou'
+    valor = (dados.get("valor_venda") or 0) if venda else 0
+    res = db.session.execute(
+        update(ResumoMensal).where(*chave)
+        .values(ligacoes=ResumoMensal.ligacoes + 1, vendas=ResumoMensal.vendas + int(venda),
+                receita=ResumoMensal.receita + valor)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount == 0:
+        db.session.execute(insert(ResumoMensal).values(
+            ano=quando.year, mes=quando.month, consultor_id=dados["consultor_id"],
+            ligacoes=1, vendas=int(venda), receita=valor))
+
+
 @app.route('/api/resultados-por-mes')
 @login_required
+@classe_carga('analitico')
 def api_resultados_por_mes():
     if current_user.tipo != 'supervisor':
         return jsonify({"erro": "Acesso negado"}), 403
@@ -933,26 +2613,46 @@ def api_resultados_por_mes():
         mes = int(request.args.get('mes', datetime.now().month))
         ano = int(request.args.get('ano', datetime.now().year))
         
-        # Buscar ligações do mês/ano específico
+        # Buscar ligações do mês/ano específico (faixa de data_hora: usa índice)
+        inicio, fim = _intervalo_mes(mes, ano)
+
+        fechado = fim <= datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if fechado and db.session.get(EventoOffset, '_resumo_mensal') is not None:
+            por_consultor = (
+                select(
+                    ResumoMensal.consultor_id,
+                    ResumoMensal.ligacoes.label("total"),
+                    ResumoMensal.vendas,
+                    ResumoMensal.receita
+                )
+                .where(ResumoMensal.ano == ano, ResumoMensal.mes == mes)
+                .subquery()
+            )
+        else:
+            def montar(t, arquivada):
+                return _resultados_por_consultor(t, [t.c.data_hora >= inicio, t.c.data_hora < fim])
+
+            partes = union_all(*_ligacoes_quentes_e_arquivo(montar, inicio)).subquery()
+            por_consultor = (
+                select(
+                    partes.c.consultor_id,
+                    func.sum(partes.c.total).label("total"),
+                    func.sum(partes.c.vendas).label("vendas"),
+                    func.sum(partes.c.receita).label("receita")
+                )
+                .group_by(partes.c.consultor_id)
+                .subquery()
+            )
         ligacoes = (
             db.session.query(
                 Usuario.id,
                 Usuario.nome,
-                func.count(Ligacao.id).label("total_ligacoes"),
-                func.sum(case((Ligacao.resultado == 'comprou', 1), else_=0)).label("vendas"),
-                func.sum(case((Ligacao.resultado == 'comprou', Ligacao.valor_venda), else_=0)).label("receita")
+                func.coalesce(por_consultor.c.total, 0).label("total_ligacoes"),
+                func.coalesce(por_consultor.c.vendas, 0).label("vendas"),
+                func.coalesce(por_consultor.c.receita, 0).label("receita")
             )
-            .join(Ligacao, Ligacao.consultor_id == Usuario.id, isouter=True)
+            .outerjoin(por_consultor, por_consultor.c.consultor_id == Usuario.id)
             .filter(Usuario.tipo == 'consultor', Usuario.ativo == True)
-            .filter(or_(
-                extract('month', Ligacao.data_hora) == mes,
-                Ligacao.id == None
-            ))
-            .filter(or_(
-                extract('year', Ligacao.data_hora) == ano,
-                Ligacao.id == None
-            ))
-            .group_by(Usuario.id, Usuario.nome)
             .order_by(desc("receita"))
             .all()
         )
@@ -997,57 +2697,312 @@ def api_minhas_ligacoes_por_mes():
         mes = int(request.args.get('mes', datetime.now().month))
         ano = int(request.args.get('ano', datetime.now().year))
         
-        # Buscar ligações do consultor no mês/ano específico
-        ligacoes = (
-            db.session.query(Ligacao)
-            .filter(Ligacao.consultor_id == current_user.id)
-            .filter(extract('month', Ligacao.data_hora) == mes)
-            .filter(extract('year', Ligacao.data_hora) == ano)
-            .order_by(Ligacao.data_hora.desc())
-            .all()
+        inicio, fim = _intervalo_mes(mes, ano)
+        limite = _limite_pagina(request.args.get('limite'))
+        cursor = _decodificar_cursor(request.args.get('cursor'))
+        
+        # Buscar ligações do consultor no mês/ano específico (paginado por cursor)
+        def montar(t, arquivada):
+            q = (
+                select(t.c.id, t.c.cliente_id, t.c.data_hora, t.c.resultado, t.c.valor_venda)
+                .where(t.c.consultor_id == current_user.id)
+                .where(t.c.data_hora >= inicio, t.c.data_hora < fim)
+                .order_by(t.c.data_hora.desc(), t.c.id.desc())
+                .limit(limite + 1)
+            )
+            if cursor:
+                c_data, c_id = cursor
+                q = q.where(or_(
+                    t.c.data_hora < c_data,
+                    and_(t.c.data_hora == c_data, t.c.id < c_id)
+                ))
+            # cada ramo com o próprio LIMIT; embrulhado porque nem todo banco
+            # aceita ORDER BY/LIMIT direto em um ramo de UNION
+            return select(q.subquery())
+
+        ligs = union_all(*_ligacoes_quentes_e_arquivo(montar, inicio)).subquery()
+        stmt = (
+            select(ligs.c.id, ligs.c.cliente_id, Cliente.nome, ligs.c.data_hora,
+                   ligs.c.resultado, ligs.c.valor_venda)
+            .outerjoin(Cliente, Cliente.id == ligs.c.cliente_id)
+            .order_by(ligs.c.data_hora.desc(), ligs.c.id.desc())
+            .limit(limite + 1)
         )
         
+        rows = db.session.execute(stmt).all()
+        proximo_cursor = None
+        if len(rows) > limite:
+            rows = rows[:limite]
+            proximo_cursor = _codificar_cursor(rows[-1].data_hora, rows[-1].id)
+        
         resultado = []
-        for lig in ligacoes:
+        for lid, cliente_id, cliente_nome, data_hora, res, valor in rows:
             resultado.append({
-                "id": lig.id,
-                "cliente_id": lig.cliente_id,
-                "cliente_nome": lig.cliente.nome if lig.cliente else "N/A",
-                "data_hora": lig.data_hora.strftime("%d/%m/%Y %H:%M"),
-                "resultado": lig.resultado,
-                "valor_venda": float(lig.valor_venda or 0),
-                "valor_venda_fmt": formatar_dinheiro(lig.valor_venda),
-                "observacao": lig.observacao
+                "id": lid,
+                "cliente_id": cliente_id,
+                "cliente_nome": cliente_nome or "N/A",
+                "data_hora": data_hora.strftime("%d/%m/%Y %H:%M"),
+                "resultado": res,
+                "valor_venda": float(valor or 0),
+                "valor_venda_fmt": formatar_dinheiro(valor),
             })
         
-        # Estatísticas do mês
-        total_ligacoes = len(resultado)
-        vendas = len([l for l in resultado if l["resultado"] == "comprou"])
-        receita_total = sum([l["valor_venda"] for l in resultado if l["resultado"] == "comprou"])
-        taxa_conversao = _percent(vendas, total_ligacoes) if total_ligacoes else 0
-        
-        return jsonify({
+        out = {
             "ok": True,
             "mes": mes,
             "ano": ano,
             "ligacoes": resultado,
-            "estatisticas": {
+            "proximo_cursor": proximo_cursor,
+        }
+        
+        # Estatísticas do mês: só na primeira página, agregadas no banco
+        if not cursor:
+            def montar_totais(t, arquivada):
+                return (
+                    select(
+                        func.count(t.c.id).label('total'),
+                        func.sum(case((t.c.resultado == 'comprou', 1), else_=0)).label('vendas'),
+                        func.sum(case((t.c.resultado == 'comprou', t.c.valor_venda), else_=0)).label('receita'),
+                    )
+                    .where(t.c.consultor_id == current_user.id)
+                    .where(t.c.data_hora >= inicio, t.c.data_hora < fim)
+                )
+
+            totais = union_all(*_ligacoes_quentes_e_arquivo(montar_totais, inicio)).subquery()
+            total_ligacoes, vendas, receita_total = db.session.execute(
+                select(func.sum(totais.c.total), func.sum(totais.c.vendas), func.sum(totais.c.receita))
+            ).one()
+            total_ligacoes = int(total_ligacoes or 0)
+            vendas = int(vendas or 0)
+            receita_total = float(receita_total or 0)
+            out["estatisticas"] = {
                 "total_ligacoes": total_ligacoes,
                 "vendas": vendas,
                 "receita_total": receita_total,
                 "receita_fmt": formatar_dinheiro(receita_total),
-                "taxa_conversao": round(taxa_conversao, 1)
+                "taxa_conversao": round(_percent(vendas, total_ligacoes), 1)
             }
-        })
+        
+        return jsonify(out)
         
     except Exception as e:
         return jsonify({"ok": False, "erro": str(e)}), 500
 
+# =============================================================================
+# MÉTRICAS (snapshot compartilhado por e-mail, dashboard e API)
+# =============================================================================
+class MetricasSnapshot:
+    """Números de hoje, 7 e 30 dias (dias de calendário), calculados de uma vez.
+
+    Três consultas (e a da última ligação arquivada): consultores ativos,
+    totais gerais (o de ligações inclui o arquivo) e as ligações dos últimos
+    30 dias agrupadas por consultor, dia e resultado. Todo o resto
+    (ranking, gráfico, metas, conversão) sai dessas linhas em memória.
+    """
+
+    def __init__(self, agora=None):
+        agora = agora or datetime.now()
+        self.gerado_em = agora
+        self.hoje = agora.date()
+        inicio7 = self.hoje - timedelta(days=6)
+        inicio30 = self.hoje - timedelta(days=29)
+
+        self.consultores = [
+            {"id": u.id, "nome": u.nome, "email": u.email, "meta": int(u.meta_diaria or 0)}
+            for u in db.session.execute(
+                select(Usuario.id, Usuario.nome, Usuario.email, Usuario.meta_diaria)
+                .where(Usuario.tipo == 'consultor', Usuario.ativo == True)
+                .order_by(Usuario.nome)
+            )
+        ]
+
+        contagens = union_all(*_ligacoes_quentes_e_arquivo(
+            lambda t, arquivada: select(func.count(t.c.id).label('qtd'))
+        )).subquery()
+        totais = db.session.execute(select(
+            select(func.count(Cliente.id)).where(Cliente.ativo == True).scalar_subquery(),
+            select(func.sum(contagens.c.qtd)).scalar_subquery(),
+        )).one()
+        self.total_clientes = int(totais[0] or 0)
+        self.total_ligacoes = int(totais[1] or 0)
+
+        vazio = lambda: {"ligacoes": 0, "vendas": 0, "receita": 0.0, "resultados": {}}
+        hoje_por = {c["id"]: vazio() for c in self.consultores}
+        mes_por = {c["id"]: vazio() for c in self.consultores}
+        por_dia = {}
+        self.resultados_30 = {}
+        self.total_hoje = self.total_7 = self.total_30 = 0
+
+        # agrupa pela coluna gerada `dia`, na ordem do índice ix_ligacoes_dia
+        for row in db.session.execute(
+            select(Ligacao.consultor_id, Ligacao.dia, Ligacao.resultado,
+                   func.count().label('qtd'),
+                   func.coalesce(func.sum(Ligacao.valor_venda), 0).label('valor'))
+            .where(Ligacao.dia >= inicio30)
+            .group_by(Ligacao.dia, Ligacao.consultor_id, Ligacao.resultado)
+        ):
+            d = row.dia
+            resultado = row.resultado or 'nao_comprou'
+            qtd = int(row.qtd)
+
+            self.total_30 += qtd
+            self.resultados_30[resultado] = self.resultados_30.get(resultado, 0) + qtd
+            if d >= inicio7:
+                self.total_7 += qtd
+                por_dia[d] = por_dia.get(d, 0) + qtd
+            if d == self.hoje:
+                self.total_hoje += qtd
+
+            alvos = [mes_por.get(row.consultor_id)]
+            if d == self.hoje:
+                alvos.append(hoje_por.get(row.consultor_id))
+            for acc in alvos:
+                if acc is None:  # consultor inativo: só entra nos totais gerais
+                    continue
+                acc["ligacoes"] += qtd
+                acc["resultados"][resultado] = acc["resultados"].get(resultado, 0) + qtd
+                if resultado == 'comprou':
+                    acc["vendas"] += qtd
+                    acc["receita"] += float(row.valor or 0)
+
+        self.ligacoes_por_dia = [{"dia": d, "total": por_dia[d]} for d in sorted(por_dia)]
+        self.conversao_30 = _percent(self.resultados_30.get('comprou', 0), self.total_30)
+
+        self.ranking = sorted(
+            ({"id": c["id"], "nome": c["nome"], "ligacoes": mes_por[c["id"]]["ligacoes"]} for c in self.consultores),
+            key=lambda r: r["ligacoes"], reverse=True
+        )
+        self.desempenho_hoje = []
+        self.progresso = []
+        for c in self.consultores:
+            h = hoje_por[c["id"]]
+            pct = round(_percent(h["ligacoes"], c["meta"]), 1) if c["meta"] else 0.0
+            self.desempenho_hoje.append(dict(h, id=c["id"], nome=c["nome"], meta=c["meta"], pct_meta=pct))
+            self.progresso.append({"id": c["id"], "nome": c["nome"], "meta": c["meta"],
+                                   "feitas": h["ligacoes"], "percentual": pct})
+        self.conversao = sorted(
+            ({
+                "id": c["id"],
+                "nome": c["nome"],
+                "ligacoes": mes_por[c["id"]]["ligacoes"],
+                "vendas": mes_por[c["id"]]["vendas"],
+                "conversao": round(_percent(mes_por[c["id"]]["vendas"], mes_por[c["id"]]["ligacoes"]), 1),
+                "receita": mes_por[c["id"]]["receita"],
+                "receita_fmt": formatar_dinheiro(mes_por[c["id"]]["receita"]),
+                "media_dia": mes_por[c["id"]]["ligacoes"] / 30.0,
+            } for c in self.consultores),
+            key=lambda r: r["receita"], reverse=True
+        )
+
+    def contexto_dashboard(self):
+        return {
+            "total_consultores": len(self.consultores),
+            "total_clientes": self.total_clientes,
+            "total_ligacoes": self.total_ligacoes,
+            "ligacoes_hoje": self.total_hoje,
+            "ranking": self.ranking,
+            "ligacoes_por_dia": [
+                {"data": d["dia"].strftime("%d/%m/%Y"), "data_iso": d["dia"].isoformat(), "total": d["total"]}
+                for d in self.ligacoes_por_dia
+            ],
+            "resultados_chart": self.resultados_30,
+            "progresso": self.progresso,
+            "consultores": self.consultores,
+            "conversao": self.conversao,
+            "metricas_geradas_em": self.gerado_em,
+        }
+
+    def html_email(self):
+        template = app.jinja_env.get_template('email/relatorio_global.html')
+        return template.render(m=self, resultados=RESULTADOS_ROTULOS)
+
+    def como_json(self):
+        return {
+            "gerado_em": self.gerado_em.isoformat(),
+            "hoje": self.hoje.isoformat(),
+            "totais": {
+                "consultores": len(self.consultores),
+                "clientes": self.total_clientes,
+                "ligacoes": self.total_ligacoes,
+                "hoje": self.total_hoje,
+                "ultimos_7": self.total_7,
+                "ultimos_30": self.total_30,
+                "conversao_30": round(self.conversao_30, 1),
+            },
+            "resultados_30": self.resultados_30,
+            "ligacoes_por_dia": [{"dia": d["dia"].isoformat(), "total": d["total"]} for d in self.ligacoes_por_dia],
+            "ranking": self.ranking,
+            "desempenho_hoje": [{k: v for k, v in c.items()} for c in self.desempenho_hoje],
+            "conversao": [{k: v for k, v in c.items() if k != "receita_fmt"} for c in self.conversao],
+        }
+
+    def para_json(self):
+        """Todos os atributos, para gravar em metricas_congeladas."""
+        return json.dumps(dict(
+            vars(self),
+            gerado_em=self.gerado_em.isoformat(),
+            hoje=self.hoje.isoformat(),
+            ligacoes_por_dia=[{"dia": d["dia"].isoformat(), "total": d["total"]} for d in self.ligacoes_por_dia],
+        ))
+
+    @classmethod
+    def de_json(cls, texto):
+        snap = cls.__new__(cls)
+        vars(snap).update(json.loads(texto))
+        snap.gerado_em = datetime.fromisoformat(snap.gerado_em)
+        snap.hoje = date.fromisoformat(snap.hoje)
+        snap.ligacoes_por_dia = [{"dia": date.fromisoformat(d["dia"]), "total": d["total"]}
+                                 for d in snap.ligacoes_por_dia]
+        return snap
+
+
+_snapshot_congelado = {}  # cópia local do snapshot gravado, que não muda mais no dia
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_metricas(congelar=False):
+    """Snapshot das métricas. Até o relatório diário rodar, cada chamada calcula
+    um novo; o relatório chama com congelar=True e, daí até o fim do dia, todos
+    (dashboard, API, reenvios) usam exatamente os números enviados por e-mail.
+
+    O snapshot congelado fica em metricas_congeladas, então vale também para
+    as instâncias web quando o relatório roda no scheduler.py."""
+    hoje = date.today()
+    with _snapshot_lock:
+        snap = _snapshot_congelado.get(hoje)
+    if snap is not None:
+        return snap
+
+    gravado = db.session.get(MetricasCongeladas, hoje)
+    if gravado is not None:
+        snap = MetricasSnapshot.de_json(gravado.dados)
+    else:
+        snap = MetricasSnapshot()
+        if not congelar:
+            return snap
+        db.session.execute(delete(MetricasCongeladas).where(MetricasCongeladas.dia < hoje))
+        db.session.add(MetricasCongeladas(dia=hoje, dados=snap.para_json()))
+        db.session.commit()
+    with _snapshot_lock:
+        _snapshot_congelado.clear()
+        _snapshot_congelado[hoje] = snap
+    return snap
+
+
+@app.route('/api/metricas')
+@login_required
+@classe_carga('analitico')
+def api_metricas():
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+    return jsonify(dict(ok=True, **snapshot_metricas().como_json()))
+
 # =============================================================================
 # DASHBOARD SUPERVISOR
 # =============================================================================
 @app.route('/supervisor', endpoint='dashboard_supervisor')
 @login_required
+@classe_carga('analitico')
 def supervisor_dashboard():
     if current_user.tipo != 'supervisor':
         return redirect(url_for('meus_clientes'))
@@ -1056,85 +3011,7 @@ def supervisor_dashboard():
     mes_filtro = int(request.args.get('mes', datetime.now().month))
     ano_filtro = int(request.args.get('ano', datetime.now().year))
 
-    hoje = datetime.now().date()
-    desde = datetime.now() - timedelta(days=30)
-
-    total_consultores = Usuario.query.filter_by(tipo='consultor', ativo=True).count()
-    total_clientes = Cliente.query.filter_by(ativo=True).count()
-    total_ligacoes = Ligacao.query.count()
-    ligacoes_hoje = (Ligacao.query
-                     .filter(func.date(Ligacao.data_hora) == hoje)
-                     .count())
-
-    rows = (db.session.query(Usuario.nome, func.count(Ligacao.id))
-            .join(Ligacao, Ligacao.consultor_id == Usuario.id, isouter=True)
-            .filter(Usuario.tipo == 'consultor', Usuario.ativo == True)
-            .filter(or_(Ligacao.data_hora >= desde, Ligacao.id == None))
-            .group_by(Usuario.id, Usuario.nome)
-            .order_by(desc(func.count(Ligacao.id)))
-            .all())
-    ranking = [{"nome": n, "ligacoes": int(q or 0)} for n, q in rows]
-
-    ult7 = (db.session.query(func.date(Ligacao.data_hora), func.count(Ligacao.id))
-            .filter(Ligacao.data_hora >= datetime.now() - timedelta(days=7))
-            .group_by(func.date(Ligacao.data_hora))
-            .order_by(func.date(Ligacao.data_hora))
-            .all())
-    lig_por_dia = [{"data": d.strftime("%d/%m/%Y"), "data_iso": d.strftime("%Y-%m-%d"), "total": int(t)} for d, t in ult7]
-
-    res = (db.session.query(Ligacao.resultado, func.count(Ligacao.id))
-           .filter(Ligacao.data_hora >= desde)
-           .group_by(Ligacao.resultado)
-           .all())
-    resultados_chart = {(r or "nao_comprou"): int(c) for r, c in res}
-
-    progresso = []
-    consultores = Usuario.query.filter_by(tipo='consultor', ativo=True).order_by(Usuario.nome).all()
-    for u in consultores:
-        feitas = (db.session.query(func.count(Ligacao.id))
-                  .filter(Ligacao.consultor_id == u.id)
-                  .filter(func.date(Ligacao.data_hora) == hoje)
-                  .scalar()) or 0
-        meta = u.meta_diaria or 0
-        perc = round(_percent(feitas, meta), 1) if meta else 0.0
-        progresso.append({
-            "id": u.id,
-            "nome": u.nome,
-            "meta": meta,
-            "feitas": int(feitas),
-            "percentual": perc
-        })
-
-    conv_rows = (
-        db.session.query(
-            Usuario.id,
-            Usuario.nome,
-            func.count(Ligacao.id).label("ligacoes"),
-            func.sum(case((Ligacao.resultado == 'comprou', 1), else_=0)).label("vendas"),
-            func.sum(case((Ligacao.resultado == 'comprou', Ligacao.valor_venda), else_=0)).label("receita")
-        )
-        .join(Ligacao, Ligacao.consultor_id == Usuario.id, isouter=True)
-        .filter(Usuario.tipo == 'consultor', Usuario.ativo == True)
-        .filter(or_(Ligacao.data_hora >= desde, Ligacao.id == None))
-        .group_by(Usuario.id, Usuario.nome)
-        .order_by(desc("receita"))
-        .all()
-    )
-
-    conversao = []
-    for _, nome, ligs, vend, rec in conv_rows:
-        ligs = int(ligs or 0)
-        vend = int(vend or 0)
-        receita_val = float(rec or 0)
-        conv_pct = (vend / ligs * 100) if ligs else 0.0
-        conversao.append({
-            "nome": nome,
-            "ligacoes": ligs,
-            "vendas": vend,
-            "conversao": round(conv_pct, 1),
-            "receita": receita_val,
-            "receita_fmt": f"{receita_val:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-        })
+    metricas = snapshot_metricas()
 
     # 🆕 Gerar lista de meses/anos disponíveis para o filtro
     meses_disponiveis = []
@@ -1154,16 +3031,7 @@ def supervisor_dashboard():
 
     return render_template(
         'supervisor.html',
-        total_consultores=total_consultores,
-        total_clientes=total_clientes,
-        total_ligacoes=total_ligacoes,
-        ligacoes_hoje=ligacoes_hoje,
-        ranking=ranking,
-        ligacoes_por_dia=lig_por_dia,
-        resultados_chart=resultados_chart,
-        progresso=progresso,
-        consultores=consultores,
-        conversao=conversao,
+        **metricas.contexto_dashboard(),
         mes_filtro=mes_filtro,
         ano_filtro=ano_filtro,
         meses_disponiveis=meses_disponiveis,
@@ -1175,337 +3043,202 @@ def supervisor_dashboard():
 # RELATÓRIO POR E-MAIL
 # =============================================================================
 def build_relatorio_html():
-    hoje = datetime.now().date()
-    agora = datetime.now()
-    desde7 = agora - timedelta(days=7)
-    desde30 = agora - timedelta(days=30)
+    return snapshot_metricas().html_email()
 
-    total_hoje = (db.session.query(func.count(Ligacao.id))
-                  .filter(func.date(Ligacao.data_hora) == hoje).scalar()) or 0
-    total_7 = (db.session.query(func.count(Ligacao.id))
-               .filter(Ligacao.data_hora >= desde7).scalar()) or 0
-    total_30 = (db.session.query(func.count(Ligacao.id))
-                .filter(Ligacao.data_hora >= desde30).scalar()) or 0
-
-    resultados = dict(
-        (r or 'nao_comprou', int(c))
-        for r, c in (
-            db.session.query(Ligacao.resultado, func.count(Ligacao.id))
-            .filter(Ligacao.data_hora >= desde30)
-            .group_by(Ligacao.resultado)
-            .all()
-        )
-    )
-    compras_30 = resultados.get('comprou', 0)
-    conv_30 = _percent(compras_30, total_30)
+# Fila de saída: quem pede um e-mail só grava em emails_saida; o envio roda no
+# scheduler, em lotes que reaproveitam uma única conexão SMTP. Falhas voltam
+# para a fila com espera exponencial até EMAIL_TENTATIVAS_MAX.
+EMAIL_LOTE = int(os.getenv("EMAIL_LOTE", "50"))
+EMAIL_INTERVALO = int(os.getenv("EMAIL_INTERVALO", "30"))  # segundos
+EMAIL_TENTATIVAS_MAX = int(os.getenv("EMAIL_TENTATIVAS_MAX", "6"))
+EMAIL_ESPERA_BASE = timedelta(minutes=1)
+EMAIL_ESPERA_MAXIMA = timedelta(hours=1)
 
-    ranking = (
-        db.session.query(
-            Usuario.nome,
-            func.count(Ligacao.id).label("qtd")
-        )
-        .join(Ligacao, Ligacao.consultor_id == Usuario.id, isouter=True)
-        .filter(Usuario.tipo == 'consultor', Usuario.ativo == True)
-        .filter(or_(Ligacao.data_hora >= desde30, Ligacao.id == None))
-        .group_by(Usuario.id, Usuario.nome)
-        .order_by(desc("qtd"))
-        .all()
-    )
 
-    progresso = []
-    consultores_ativos = (
-        Usuario.query
-        .filter_by(tipo='consultor', ativo=True)
-        .order_by(Usuario.nome)
-        .all()
-    )
-    for u in consultores_ativos:
-        feitas = (
-            db.session.query(func.count(Ligacao.id))
-            .filter(Ligacao.consultor_id == u.id)
-            .filter(func.date(Ligacao.data_hora) == hoje)
-            .scalar()
-        ) or 0
-        meta = u.meta_diaria or 0
-        perc = round(_percent(feitas, meta), 1) if meta else 0.0
-        progresso.append((u.nome, feitas, meta, perc))
-    progresso.sort(key=lambda x: x[3], reverse=True)
-
-    ult7 = (
-        db.session.query(func.date(Ligacao.data_hora), func.count(Ligacao.id))
-        .filter(Ligacao.data_hora >= desde7)
-        .group_by(func.date(Ligacao.data_hora))
-        .order_by(func.date(Ligacao.data_hora))
-        .all()
-    )
+def enfileirar_email(assunto, destinatarios, html):
+    """Adiciona o e-mail à fila (sem commit) e devolve o registro."""
+    email = EmailSaida(assunto=assunto[:255], destinatarios=",".join(destinatarios), html=html)
+    db.session.add(email)
+    return email
 
-    linhas_ult7 = "".join(
-        f"<tr><td>{d.strftime('%d/%m')}</td>"
-        f"<td style='text-align:right'>{int(t)}</td></tr>"
-        for d, t in ult7
-    )
 
-    max_ult7 = max((int(t) for _, t in ult7), default=0)
-    linhas_ult7_graf = ""
-    if max_ult7 > 0:
-        total_blocos = 30
-        for d, t in ult7:
-            t_int = int(t)
-            blocos_preenchidos = int(round(t_int / max_ult7 * total_blocos))
-            blocos_preenchidos = max(0, min(blocos_preenchidos, total_blocos))
-            barra = "█" * blocos_preenchidos + "░" * (total_blocos - blocos_preenchidos)
-            linhas_ult7_graf += (
-                "<tr>"
-                f"<td>{d.strftime('%d/%m')}</td>"
-                f"<td style='font-family:monospace; white-space:nowrap;'>{barra}</td>"
-                f"<td style='text-align:right'>{t_int}</td>"
-                "</tr>"
-            )
+def _acordar_envio_emails():
+    # antecipa a próxima rodada do envio para não esperar o intervalo inteiro
+    if _scheduler and _scheduler.running:
+        try:
+            _scheduler.modify_job('enviar_emails', next_run_time=datetime.now(_scheduler.timezone))
+        except Exception:
+            pass
 
-    desempenho_hoje = (
-        db.session.query(
-            Usuario.id,
-            Usuario.nome,
-            Usuario.meta_diaria,
-            func.count(Ligacao.id).label("ligacoes"),
-            func.sum(
-                case((Ligacao.resultado == 'comprou', 1), else_=0)
-            ).label("vendas"),
-            func.sum(
-                case((Ligacao.resultado == 'comprou', Ligacao.valor_venda), else_=0)
-            ).label("receita"),
-        )
-        .join(Ligacao, Ligacao.consultor_id == Usuario.id, isouter=True)
-        .filter(Usuario.tipo == 'consultor', Usuario.ativo == True)
-        .filter(or_(func.date(Ligacao.data_hora) == hoje, Ligacao.id == None))
-        .group_by(Usuario.id, Usuario.nome, Usuario.meta_diaria)
-        .order_by(Usuario.nome)
-        .all()
-    )
 
-    desempenho_30 = (
-        db.session.query(
-            Usuario.id,
-            Usuario.nome,
-            func.count(Ligacao.id).label("ligacoes"),
-            func.sum(
-                case((Ligacao.resultado == 'comprou', 1), else_=0)
-            ).label("vendas"),
-            func.sum(
-                case((Ligacao.resultado == 'comprou', Ligacao.valor_venda), else_=0)
-            ).label("receita"),
-        )
-        .join(Ligacao, Ligacao.consultor_id == Usuario.id, isouter=True)
-        .filter(Usuario.tipo == 'consultor', Usuario.ativo == True)
-        .filter(or_(Ligacao.data_hora >= desde30, Ligacao.id == None))
-        .group_by(Usuario.id, Usuario.nome)
-        .order_by(Usuario.nome)
-        .all()
-    )
+def _falha_envio(email, erro, agora):
+    email.tentativas += 1
+    email.ultimo_erro = str(erro)[:2000]
+    # destinatário recusado pelo servidor não melhora com nova tentativa
+    if email.tentativas >= EMAIL_TENTATIVAS_MAX or isinstance(erro, smtplib.SMTPRecipientsRefused):
+        email.status = 'falhou'
+    else:
+        espera = min(EMAIL_ESPERA_BASE * 2 ** (email.tentativas - 1), EMAIL_ESPERA_MAXIMA)
+        email.proxima_tentativa = agora + espera
 
-    linhas_rank = "".join(
-        f"<tr><td>{nome}</td>"
-        f"<td style='text-align:right'>{int(q or 0)}</td></tr>"
-        for nome, q in ranking
-    )
 
-    linhas_prog = "".join(
-        f"<tr>"
-        f"<td>{nome}</td>"
-        f"<td style='text-align:right'>{feitas} / {meta}</td>"
-        f"<td style='text-align:right'>{perc:.1f}%</td>"
-        f"</tr>"
-        for (nome, feitas, meta, perc) in progresso
-    )
+def _lote_emails_vencidos(agora):
+    return (EmailSaida.query
+            .filter(EmailSaida.status == 'pendente', EmailSaida.proxima_tentativa <= agora)
+            .order_by(EmailSaida.id)
+            .limit(EMAIL_LOTE)
+            .all())
 
-    linhas_res = "".join(
-        f"<tr><td>{lab}</td>"
-        f"<td style='text-align:right'>{int(val)}</td></tr>"
-        for lab, val in [
-            ("Comprou", resultados.get("comprou", 0)),
-            ("Rel. (pós-venda)", resultados.get("relacionamento", 0)),
-            ("Retornar", resultados.get("retornar", 0)),
-            ("Sem interesse", resultados.get("sem_interesse", 0)),
-            ("Não comprou", resultados.get("nao_comprou", 0)),
-        ]
-    )
 
-    linhas_consultor_hoje = ""
-    for _id, nome, meta, lig, vend, rec in desempenho_hoje:
-        lig = int(lig or 0)
-        vend = int(vend or 0)
-        rec = float(rec or 0)
-        meta = int(meta or 0)
-        pct_meta = _percent(lig, meta) if meta else 0.0
-
-        linhas_consultor_hoje += (
-            "<tr>"
-            f"<td>{nome}</td>"
-            f"<td style='text-align:right'>{lig}</td>"
-            f"<td style='text-align:right'>{vend}</td>"
-            f"<td style='text-align:right'>{formatar_dinheiro(rec)}</td>"
-            f"<td style='text-align:right'>{meta}</td>"
-            f"<td style='text-align:right'>{pct_meta:.1f}%</td>"
-            "</tr>"
-        )
+def enviar_emails_pendentes():
+    """Esvazia a fila vencida, em lotes de EMAIL_LOTE, por uma única conexão SMTP.
+    Devolve quantos e-mails saíram."""
+    agora = datetime.now()
+    pendentes = _lote_emails_vencidos(agora)
+    if not pendentes:
+        return 0
 
-    linhas_consultor_30 = ""
-    for _id, nome, lig, vend, rec in desempenho_30:
-        lig = int(lig or 0)
-        vend = int(vend or 0)
-        rec = float(rec or 0)
-        conv = _percent(vend, lig) if lig else 0.0
-        media_dia = lig / 30.0 if lig else 0.0
-
-        total_blocos = 20
-        blocos_preenchidos = int(round((conv / 100) * total_blocos))
-        blocos_preenchidos = max(0, min(blocos_preenchidos, total_blocos))
-        barra = "█" * blocos_preenchidos + "░" * (total_blocos - blocos_preenchidos)
-
-        linhas_consultor_30 += (
-            "<tr>"
-            f"<td>{nome}</td>"
-            f"<td style='text-align:right'>{lig}</td>"
-            f"<td style='text-align:right'>{vend}</td>"
-            f"<td style='white-space:nowrap;font-family:monospace;font-size:12px'>{barra}</td>"
-            f"<td style='text-align:right'>{conv:.1f}%</td>"
-            f"<td style='text-align:right'>{formatar_dinheiro(rec)}</td>"
-            f"<td style='text-align:right'>{media_dia:.1f}</td>"
-            "</tr>"
-        )
+    if not MAIL_PASSWORD:
+        for email in pendentes:
+            _falha_envio(email, "MAIL_PASSWORD não configurado.", agora)
+        db.session.commit()
+        return 0
 
-    html = f"""
-    <div style="font-family:Arial,Helvetica,sans-serif; font-size:14px; color:#222;">
-      <h2 style="margin:0 0 10px 0;">📊 Relatório de Ligações — {hoje.strftime('%d/%m/%Y')}</h2>
-      <p style="margin:0 0 16px 0; color:#555">Resumo do dia, últimos 7 e 30 dias.</p>
-
-      <table cellpadding="0" cellspacing="0" border="0" style="width:100%; margin-bottom:16px">
-        <tr>
-          <td style="width:33%; background:#f8fafc; padding:12px; border:1px solid #e5e7eb;">
-            <div style="font-size:12px; color:#64748b;">Hoje</div>
-            <div style="font-size:22px; font-weight:700;">{_kfmt(total_hoje)}</div>
-          </td>
-          <td style="width:33%; background:#f8fafc; padding:12px; border:1px solid #e5e7eb;">
-            <div style="font-size:12px; color:#64748b;">Últimos 7 dias</div>
-            <div style="font-size:22px; font-weight:700;">{_kfmt(total_7)}</div>
-          </td>
-          <td style="width:33%; background:#f8fafc; padding:12px; border:1px solid #e5e7eb;">
-            <div style="font-size:12px; color:#64748b;">Últimos 30 dias</div>
-            <div style="font-size:22px; font-weight:700;">{_kfmt(total_30)}</div>
-          </td>
-        </tr>
-      </table>
-
-      <table cellpadding="0" cellspacing="0" border="0" style="width:100%; table-layout:fixed;">
-        <tr>
-          <td style="vertical-align:top; width:50%; padding-right:8px">
-            <h3 style="margin:0 0 8px 0;">📈 Gráfico de ligações (7 dias)</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb;">
-              <tr style="background:#f1f5f9">
-                <th align="left">Dia</th>
-                <th align="left">Gráfico</th>
-                <th align="right">Total</th>
-              </tr>
-              {linhas_ult7_graf or "<tr><td colspan='3' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-
-            <h3 style="margin:16px 0 8px 0;">📅 Ligações por dia (7d)</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb;">
-              <tr style="background:#f1f5f9">
-                <th align="left">Dia</th>
-                <th align="right">Total</th>
-              </tr>
-              {linhas_ult7 or "<tr><td colspan='2' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-
-            <h3 style="margin:16px 0 8px 0;">🏆 Ranking (30d)</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb;">
-              <tr style="background:#f1f5f9"><th align="left">Consultor</th><th align="right">Ligações</th></tr>
-              {linhas_rank or "<tr><td colspan='2' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-          </td>
-
-          <td style="vertical-align:top; width:50%; padding-left:8px">
-            <h3 style="margin:0 0 8px 0;">🎯 Progresso meta (hoje)</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb;">
-              <tr style="background:#f1f5f9">
-                <th align="left">Consultor</th>
-                <th align="right">Feitas/Meta</th>
-                <th align="right">% Meta</th>
-              </tr>
-              {linhas_prog or "<tr><td colspan='3' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-
-            <h3 style="margin:16px 0 8px 0;">🧭 Resultados (30d)</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb;">
-              <tr style="background:#f1f5f9">
-                <th align="left">Status</th>
-                <th align="right">Qtde</th>
-              </tr>
-              {linhas_res or "<tr><td colspan='2' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-
-            <p style="margin-top:12px; color:#64748b; font-size:12px">
-              Conversão (30d): <b>{conv_30:.1f}%</b> — {compras_30} compras de {total_30} ligações.
-            </p>
-
-            <h3 style="margin:16px 0 8px 0;">👤 Desempenho por consultor — Hoje</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb; font-size:12px;">
-              <tr style="background:#f1f5f9">
-                <th align="left">Consultor</th>
-                <th align="right">Lig.</th>
-                <th align="right">Vend.</th>
-                <th align="right">Receita</th>
-                <th align="right">Meta</th>
-                <th align="right">% Meta</th>
-              </tr>
-              {linhas_consultor_hoje or "<tr><td colspan='6' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-
-            <h3 style="margin:16px 0 8px 0;">📅 Desempenho por consultor — 30 dias</h3>
-            <table cellpadding="6" cellspacing="0" border="0" style="width:100%; border:1px solid #e5e7eb; font-size:12px;">
-              <tr style="background:#f1f5f9">
-                <th align="left">Consultor</th>
-                <th align="right">Lig.</th>
-                <th align="right">Vend.</th>
-                <th align="left">Gráfico</th>
-                <th align="right">Conv.</th>
-                <th align="right">Receita</th>
-                <th align="right">Média/dia</th>
-              </tr>
-              {linhas_consultor_30 or "<tr><td colspan='7' style='color:#64748b'>Sem dados</td></tr>"}
-            </table>
-          </td>
-        </tr>
-      </table>
-    </div>
-    """
-    return html
+    enviados = 0
+    tratados = 0
+    try:
+        with mail.connect() as conn:
+            while pendentes:
+                tratados = 0
+                for email in pendentes:
+                    msg = Message(subject=email.assunto, recipients=email.destinatarios.split(","))
+                    msg.html = email.html
+                    try:
+                        conn.send(msg)
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except Exception as e:
+                        # erro só desta mensagem (destinatário recusado etc.)
+                        _falha_envio(email, e, agora)
+                    else:
+                        email.status = 'enviado'
+                        email.enviado_em = datetime.now()
+                        enviados += 1
+                    db.session.commit()
+                    tratados += 1
+                pendentes = _lote_emails_vencidos(agora)
+    except Exception as e:
+        # conexão caiu ou nem abriu: o resto do lote volta para a fila
+        print(f"❌ Erro na conexão SMTP: {e}")
+        db.session.rollback()
+        for email in pendentes[tratados:]:
+            _falha_envio(email, e, agora)
+        db.session.commit()
 
-def enviar_relatorio_email(recipients=None):
+    if enviados:
+        print(f"✅ {enviados} e-mail(s) enviado(s)")
+    return enviados
+
+
+def enfileirar_relatorio_email(recipients=None):
+    """Gera o relatório e põe na fila de saída. Devolve (ok, mensagem, id do e-mail)."""
     recs = recipients or MAIL_RECIPIENTS
     if not recs:
         print("❌ Email: Sem destinatários")
-        return False, "Sem destinatários configurados."
-    
+        return False, "Sem destinatários configurados.", None
+
     if not MAIL_PASSWORD:
         print("❌ Email: Senha não configurada")
-        return False, "MAIL_PASSWORD não configurado."
-    
+        return False, "MAIL_PASSWORD não configurado.", None
+
     html = build_relatorio_html()
     assunto = f"📊 Relatório de Ligações — {datetime.now().strftime('%d/%m/%Y')}"
-    
+
+    try:
+        email = enfileirar_email(assunto, recs, html)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Falha ao enfileirar e-mail: {e}", None
+    _acordar_envio_emails()
+    return True, f"Relatório na fila de envio para: {', '.join(recs)}", email.id
+
+
+RETORNOS_NO_RELATORIO = 10
+RESULTADOS_ROTULOS = [
+    ("comprou", "Comprou"),
+    ("relacionamento", "Rel. (pós-venda)"),
+    ("retornar", "Retornar"),
+    ("sem_interesse", "Sem interesse"),
+    ("nao_comprou", "Não comprou"),
+    ("cliente_inativo", "Cliente inativo"),
+]
+
+
+def dados_relatorios_consultores(metricas):
+    """Dados do relatório pessoal de todos os consultores ativos.
+
+    O dia de cada consultor vem do snapshot de métricas; a carteira sai de
+    mais duas consultas agrupadas por consultor (contagens e retornos
+    atrasados), independente de quantos consultores existam.
+    """
+    agora = metricas.gerado_em
+    emails = {u["id"]: u["email"] for u in metricas.consultores}
+    consultores = {
+        c["id"]: dict(c, email=emails[c["id"]], atrasados=0, pendentes=0, retornos=[])
+        for c in metricas.desempenho_hoje
+    }
+    if not consultores:
+        return []
+
+    for row in db.session.execute(
+        select(Cliente.consultor_id,
+               func.sum(case((Cliente.proxima_ligacao <= agora, 1), else_=0)).label('atrasados'),
+               func.sum(case((Cliente.total_ligacoes == 0, 1), else_=0)).label('pendentes'))
+        .where(Cliente.consultor_id.in_(consultores), Cliente.ativo == True)
+        .group_by(Cliente.consultor_id)
+    ):
+        consultores[row.consultor_id]["atrasados"] = int(row.atrasados or 0)
+        consultores[row.consultor_id]["pendentes"] = int(row.pendentes or 0)
+
+    # os N atrasados mais antigos de cada consultor, cortados no banco
+    atrasados = (
+        select(Cliente.consultor_id, Cliente.nome, Cliente.telefone, Cliente.proxima_ligacao,
+               func.row_number().over(partition_by=Cliente.consultor_id,
+                                      order_by=(Cliente.proxima_ligacao, Cliente.id)).label('ordem'))
+        .where(Cliente.consultor_id.in_(consultores), Cliente.ativo == True,
+               Cliente.proxima_ligacao <= agora)
+        .subquery()
+    )
+    for row in db.session.execute(
+        select(atrasados.c.consultor_id, atrasados.c.nome, atrasados.c.telefone, atrasados.c.proxima_ligacao)
+        .where(atrasados.c.ordem <= RETORNOS_NO_RELATORIO)
+        .order_by(atrasados.c.consultor_id, atrasados.c.ordem)
+    ):
+        consultores[row.consultor_id]["retornos"].append(row)
+
+    return list(consultores.values())
+
+
+def enfileirar_relatorios_consultores():
+    """Põe na fila o relatório pessoal de cada consultor ativo. Devolve (ok, mensagem)."""
+    template = app.jinja_env.get_template('email/relatorio_consultor.html')
     try:
-        print(f"📧 Tentando enviar email para: {', '.join(recs)}")
-        with app.app_context():
-            msg = Message(subject=assunto, recipients=recs)
-            msg.html = html
-            mail.send(msg)
-        print(f"✅ Email enviado com sucesso!")
-        return True, f"Relatório enviado para: {', '.join(recs)}"
+        metricas = snapshot_metricas()
+        assunto = f"📋 Seu dia — {metricas.hoje.strftime('%d/%m/%Y')}"
+        emails = [
+            {"assunto": assunto, "destinatarios": c["email"],
+             "html": template.render(c=c, hoje=metricas.hoje, resultados=RESULTADOS_ROTULOS)}
+            for c in dados_relatorios_consultores(metricas)
+        ]
+        if emails:
+            db.session.execute(insert(EmailSaida), emails)
+        db.session.commit()
     except Exception as e:
-        print(f"❌ Erro ao enviar email: {e}")
-        return False, f"Falha ao enviar e-mail: {e}"
+        db.session.rollback()
+        return False, f"Falha ao gerar relatórios individuais: {e}"
+    _acordar_envio_emails()
+    return True, f"{len(emails)} relatórios individuais na fila de envio."
 
 
 @app.route('/admin/enviar-relatorio', methods=['POST', 'GET'])
@@ -1513,11 +3246,32 @@ def enviar_relatorio_email(recipients=None):
 def admin_enviar_relatorio():
     if current_user.tipo != 'supervisor':
         return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
-    ok, msg = enviar_relatorio_email()
+    ok, msg, email_id = enfileirar_relatorio_email()
+    if ok and request.args.get('individuais') == '1':
+        msg += " " + enfileirar_relatorios_consultores()[1]
     if request.method == 'GET':
         flash(msg, 'success' if ok else 'danger')
         return redirect(url_for('dashboard_supervisor'))
-    return jsonify({"ok": ok, "mensagem": msg})
+    return jsonify({"ok": ok, "mensagem": msg, "email_id": email_id})
+
+
+@app.route('/admin/emails/<int:email_id>')
+@login_required
+def status_email(email_id):
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+    email = db.session.get(EmailSaida, email_id)
+    if not email:
+        return jsonify({"ok": False, "mensagem": "E-mail não encontrado"}), 404
+    return jsonify({
+        "ok": True,
+        "id": email.id,
+        "status": email.status,
+        "tentativas": email.tentativas,
+        "proxima_tentativa": email.proxima_tentativa.isoformat() if email.status == 'pendente' else None,
+        "ultimo_erro": email.ultimo_erro,
+        "enviado_em": email.enviado_em.isoformat() if email.enviado_em else None,
+    })
 
 
 @app.route('/admin/testar-scheduler')
@@ -1527,6 +3281,15 @@ def testar_scheduler():
         return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
     
     try:
+        execucoes = [{
+            "job": e.job,
+            "instancia": e.instancia,
+            "inicio": e.inicio.isoformat(),
+            "duracao_ms": e.duracao_ms,
+            "status": e.status,
+            "mensagem": e.mensagem,
+        } for e in ExecucaoJob.query.order_by(ExecucaoJob.id.desc()).limit(20)]
+
         if _scheduler:
             jobs = _scheduler.get_jobs()
             jobs_info = [{
@@ -1539,43 +3302,437 @@ def testar_scheduler():
                 "ok": True,
                 "scheduler_running": _scheduler.running,
                 "jobs": jobs_info,
+                "execucoes": execucoes,
                 "mensagem": "Scheduler está ativo!"
             })
         else:
             return jsonify({
                 "ok": False,
-                "mensagem": "Scheduler não inicializado"
+                "execucoes": execucoes,
+                "mensagem": "Scheduler não inicializado neste processo"
             })
     except Exception as e:
         return jsonify({"ok": False, "mensagem": str(e)}), 500
 
+# =============================================================================
+# EXPORTAÇÃO (CSV / XLSX em streaming)
+# =============================================================================
+# As linhas saem de um cursor no servidor (stream_results: SSCursor no
+# PyMySQL) em uma conexão própria e vão sendo escritas conforme chegam, então
+# nem um ano inteiro de ligações fica em memória.
+EXPORTACAO_LOTE = 1000
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_COLUNAS_EXPORTACAO_LIGACOES = [
+    "ID", "Data/Hora", "Consultor", "Cliente", "CNPJ", "Telefone",
+    "Resultado", "Contato", "Valor venda", "Observação",
+]
+_COLUNAS_EXPORTACAO_CLIENTES = [
+    "ID", "Nome", "CNPJ", "Telefone", "Representante", "Consultor", "Ativo", "Origem",
+    "Total ligações", "Última ligação", "Próxima ligação", "Cadastro",
+]
+
+
+def _data_exportacao(v):
+    return v.strftime('%d/%m/%Y %H:%M') if v else ""
+
+
+def _linhas_exportacao(stmt, converter):
+    with db.engine.connect() as conn:
+        resultado = conn.execution_options(stream_results=True, max_row_buffer=EXPORTACAO_LOTE).execute(stmt)
+        for lote in resultado.partitions(EXPORTACAO_LOTE):
+            yield [converter(row) for row in lote]
+
+
+def _resposta_exportacao(nome, formato, cabecalho, lotes):
+    if formato == 'xlsx':
+        return Response(stream_with_context(_gerar_xlsx(cabecalho, lotes)), mimetype=MIMETYPE_XLSX,
+                        headers={"Content-Disposition": f'attachment; filename="{nome}.xlsx"'})
+    return Response(stream_with_context(_gerar_csv(cabecalho, lotes)), mimetype='text/csv; charset=utf-8',
+                    headers={"Content-Disposition": f'attachment; filename="{nome}.csv"'})
+
+
+def _gerar_csv(cabecalho, lotes):
+    # ';' e BOM para o Excel em português abrir direto
+    buf = io.StringIO()
+    escritor = csv.writer(buf, delimiter=';')
+    buf.write('\ufeff')
+    escritor.writerow(cabecalho)
+    for lote in lotes:
+        escritor.writerows([f"{v:.2f}".replace('.', ',') if isinstance(v, float) else v for v in linha]
+                           for linha in lote)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def _gerar_xlsx(cabecalho, lotes):
+    # modo write-only: cada linha vai para disco na hora; o zip final sai em pedaços
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(cabecalho)
+    for lote in lotes:
+        for linha in lote:
+            ws.append(linha)
+    with tempfile.TemporaryFile() as arq:
+        wb.save(arq)
+        arq.seek(0)
+        while True:
+            pedaco = arq.read(64 * 1024)
+            if not pedaco:
+                break
+            yield pedaco
+
+
+def _periodo_exportacao():
+    hoje = date.today()
+    try:
+        inicio = date.fromisoformat(request.args.get('inicio') or hoje.replace(day=1).isoformat())
+        fim = date.fromisoformat(request.args.get('fim') or hoje.isoformat())
+    except ValueError:
+        return None
+    if fim < inicio:
+        return None
+    return inicio, fim
+
+
+@app.route('/supervisor/exportar/ligacoes')
+@login_required
+@classe_carga('exportacao')
+def exportar_ligacoes():
+    """Ligações de `inicio` a `fim` (inclusive, AAAA-MM-DD), com filtros opcionais
+    por consultor_id e resultado. formato=csv (padrão) ou xlsx."""
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+
+    periodo = _periodo_exportacao()
+    if not periodo:
+        return jsonify({"ok": False, "mensagem": "Período inválido"}), 400
+    inicio, fim = periodo
+
+    desde = datetime.combine(inicio, datetime.min.time())
+    ate = datetime.combine(fim + timedelta(days=1), datetime.min.time())
+    consultor_id = request.args.get('consultor_id', type=int)
+    resultado = s(request.args.get('resultado'))
+
+    def montar(t, arquivada):
+        conds = [t.c.data_hora >= desde, t.c.data_hora < ate]
+        if consultor_id:
+            conds.append(t.c.consultor_id == consultor_id)
+        if resultado:
+            conds.append(t.c.resultado == resultado)
+        return (select(t.c.id, t.c.data_hora, Usuario.nome.label('consultor'),
+                       Cliente.nome.label('cliente'), Cliente.cnpj, Cliente.telefone,
+                       t.c.resultado, t.c.contato_nome, t.c.valor_venda, t.c.observacao)
+                .outerjoin(Usuario, Usuario.id == t.c.consultor_id)
+                .outerjoin(Cliente, Cliente.id == t.c.cliente_id)
+                .where(*conds))
+
+    ligs = union_all(*_ligacoes_quentes_e_arquivo(montar, desde)).subquery()
+    stmt = select(ligs).order_by(ligs.c.data_hora, ligs.c.id)
+    rotulos = dict(RESULTADOS_ROTULOS)
+
+    def converter(r):
+        return [r.id, _data_exportacao(r.data_hora), r.consultor or "", r.cliente or "",
+                r.cnpj or "", r.telefone or "", rotulos.get(r.resultado, r.resultado or ""),
+                r.contato_nome or "", float(r.valor_venda or 0), r.observacao or ""]
+
+    nome = f"ligacoes_{inicio.isoformat()}_a_{fim.isoformat()}"
+    return _resposta_exportacao(nome, request.args.get('formato'), _COLUNAS_EXPORTACAO_LIGACOES,
+                                _linhas_exportacao(stmt, converter))
+
+
+@app.route('/supervisor/exportar/clientes')
+@login_required
+@classe_carga('exportacao')
+def exportar_clientes():
+    """Carteira de clientes; filtros opcionais consultor_id e ativos=1."""
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+
+    conds = []
+    consultor_id = request.args.get('consultor_id', type=int)
+    if consultor_id:
+        conds.append(Cliente.consultor_id == consultor_id)
+    if request.args.get('ativos') == '1':
+        conds.append(Cliente.ativo == True)
+
+    stmt = (select(Cliente.id, Cliente.nome, Cliente.cnpj, Cliente.telefone, Cliente.representante_nome,
+                   Usuario.nome.label('consultor'), Cliente.ativo, Cliente.origem, Cliente.total_ligacoes,
+                   Cliente.ultima_ligacao, Cliente.proxima_ligacao, Cliente.data_cadastro)
+            .outerjoin(Usuario, Usuario.id == Cliente.consultor_id)
+            .where(*conds)
+            .order_by(Cliente.id))
+
+    def converter(r):
+        return [r.id, r.nome, r.cnpj or "", r.telefone or "", r.representante_nome or "",
+                r.consultor or "", "Sim" if r.ativo else "Não", r.origem or "",
+                int(r.total_ligacoes or 0), _data_exportacao(r.ultima_ligacao),
+                _data_exportacao(r.proxima_ligacao), _data_exportacao(r.data_cadastro)]
+
+    nome = f"clientes_{date.today().isoformat()}"
+    return _resposta_exportacao(nome, request.args.get('formato'), _COLUNAS_EXPORTACAO_CLIENTES,
+                                _linhas_exportacao(stmt, converter))
+
+# =============================================================================
+# EXTRAÇÃO ANALÍTICA (Parquet particionado por mês)
+# =============================================================================
+# Um job copia as ligações para arquivos Parquet em EXTRACAO_DIR, no layout
+# que o pandas/pyarrow lê como dataset particionado:
+#
+#   ligacoes/mes=2026-10/ligacoes_<primeiro id>_<último id>.parquet
+#   clientes.parquet, consultores.parquet
+#
+# Ligações só são acrescentadas: cada execução lê os ids acima do maior já
+# extraído (a marca d'água sai dos próprios nomes dos arquivos). Clientes e
+# consultores são regravados inteiros, pois mudam de dono e de status.
+# Análises leem esses arquivos em vez de consultar o banco de produção.
+EXTRACAO_DIR = os.getenv("EXTRACAO_DIR", os.path.join(APP_DIR, "extracoes"))
+EXTRACAO_INTERVALO = int(os.getenv("EXTRACAO_INTERVALO_MINUTOS", "60"))
+EXTRACAO_LOTE = 50000
+EXTRACAO_MAX_ARQUIVOS = 12  # acima disso, os arquivos do mês são compactados em um só
+EXTRACAO_FOLGA = timedelta(seconds=5)  # ligações mais novas podem ter ids menores ainda não gravados
+
+_RE_ARQUIVO_EXTRACAO = re.compile(r'^ligacoes_(\d+)_(\d+)\.parquet$')
+
+
+def _esquemas_extracao():
+    import pyarrow as pa
+    return {
+        'ligacoes': pa.schema([
+            ('id', pa.int64()), ('data_hora', pa.timestamp('us')), ('cliente_id', pa.int64()),
+            ('consultor_id', pa.int64()), ('resultado', pa.string()), ('valor_venda', pa.float64()),
+            ('contato_nome', pa.string()), ('observacao', pa.string()),
+        ]),
+        'clientes': pa.schema([
+            ('id', pa.int64()), ('nome', pa.string()), ('cnpj', pa.string()), ('telefone', pa.string()),
+            ('consultor_id', pa.int64()), ('ativo', pa.bool_()), ('origem', pa.string()),
+            ('total_ligacoes', pa.int64()), ('ultima_ligacao', pa.timestamp('us')),
+            ('proxima_ligacao', pa.timestamp('us')), ('data_cadastro', pa.timestamp('us')),
+        ]),
+        'consultores': pa.schema([
+            ('id', pa.int64()), ('nome', pa.string()), ('email', pa.string()), ('tipo', pa.string()),
+            ('ativo', pa.bool_()), ('meta_diaria', pa.int64()),
+        ]),
+    }
+
+
+def _gravar_parquet(df, esquema, caminho):
+    # grava em um arquivo oculto e renomeia: quem lê nunca vê arquivo pela metade
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tabela = pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+    tmp = os.path.join(os.path.dirname(caminho), '.tmp-' + os.path.basename(caminho))
+    pq.write_table(tabela, tmp, compression='snappy')
+    os.replace(tmp, caminho)
+
+
+def _arquivos_mes(pasta):
+    """[(primeiro_id, ultimo_id, nome)] de uma partição, descartando arquivos
+    cobertos por outro (sobra de uma compactação interrompida)."""
+    arquivos = []
+    for nome in os.listdir(pasta):
+        m = _RE_ARQUIVO_EXTRACAO.match(nome)
+        if m:
+            arquivos.append((int(m.group(1)), int(m.group(2)), nome))
+    validos = []
+    for ini, fim, nome in arquivos:
+        if any(i <= ini and fim <= f and (i, f) != (ini, fim) for i, f, _ in arquivos):
+            os.remove(os.path.join(pasta, nome))
+        else:
+            validos.append((ini, fim, nome))
+    return sorted(validos)
+
+
+def _particoes_ligacoes():
+    """{mes: pasta} das partições já gravadas."""
+    base = os.path.join(EXTRACAO_DIR, 'ligacoes')
+    if not os.path.isdir(base):
+        return {}
+    return {nome[4:]: os.path.join(base, nome) for nome in sorted(os.listdir(base))
+            if nome.startswith('mes=') and os.path.isdir(os.path.join(base, nome))}
+
+
+def _compactar_mes(pasta, esquema):
+    import pyarrow.parquet as pq
+    arquivos = _arquivos_mes(pasta)
+    if len(arquivos) <= EXTRACAO_MAX_ARQUIVOS:
+        return
+    tabela = pq.read_table([os.path.join(pasta, nome) for _, _, nome in arquivos], schema=esquema)
+    df = tabela.to_pandas().sort_values('id')
+    _gravar_parquet(df, esquema, os.path.join(pasta, f"ligacoes_{arquivos[0][0]}_{arquivos[-1][1]}.parquet"))
+    for _, _, nome in arquivos:
+        os.remove(os.path.join(pasta, nome))
+
+
+def extrair_dados_analiticos():
+    """Acrescenta as ligações novas ao dataset e regrava clientes/consultores.
+    Devolve quantas ligações foram extraídas."""
+    esquemas = _esquemas_extracao()
+    marca = max((fim for pasta in _particoes_ligacoes().values()
+                 for _, fim, _ in _arquivos_mes(pasta)), default=0)
+
+    # para antes da primeira ligação recente: ids abaixo dela podem estar em
+    # transações ainda abertas e seriam pulados para sempre
+    recente = db.session.execute(
+        select(func.min(Ligacao.id)).where(Ligacao.id > marca,
+                                           Ligacao.atualizado_em >= datetime.now() - EXTRACAO_FOLGA)
+    ).scalar()
+    limite = recente - 1 if recente else None
+
+    colunas = [Ligacao.id, Ligacao.data_hora, Ligacao.cliente_id, Ligacao.consultor_id,
+               Ligacao.resultado, Ligacao.valor_venda, Ligacao.contato_nome, Ligacao.observacao]
+    total, meses = 0, set()
+    with db.engine.connect() as conn:
+        while True:
+            conds = [Ligacao.id > marca]
+            if limite is not None:
+                conds.append(Ligacao.id <= limite)
+            df = pd.read_sql(select(*colunas).where(*conds).order_by(Ligacao.id).limit(EXTRACAO_LOTE), conn)
+            if df.empty:
+                break
+            df['data_hora'] = pd.to_datetime(df['data_hora'])
+            df['valor_venda'] = df['valor_venda'].astype(float)
+            mes = df['data_hora'].dt.strftime('%Y-%m').fillna('sem-data')
+            for chave, parte in df.groupby(mes):
+                nome = f"ligacoes_{parte['id'].iloc[0]}_{parte['id'].iloc[-1]}.parquet"
+                _gravar_parquet(parte, esquemas['ligacoes'],
+                                os.path.join(EXTRACAO_DIR, 'ligacoes', f"mes={chave}", nome))
+                meses.add(chave)
+            marca = int(df['id'].iloc[-1])
+            total += len(df)
+
+        for chave in meses:
+            _compactar_mes(_particoes_ligacoes()[chave], esquemas['ligacoes'])
+
+        clientes = pd.read_sql(select(Cliente.id, Cliente.nome, Cliente.cnpj, Cliente.telefone,
+                                      Cliente.consultor_id, Cliente.ativo, Cliente.origem,
+                                      Cliente.total_ligacoes, Cliente.ultima_ligacao,
+                                      Cliente.proxima_ligacao, Cliente.data_cadastro)
+                               .order_by(Cliente.id), conn)
+        for campo in ('ultima_ligacao', 'proxima_ligacao', 'data_cadastro'):
+            clientes[campo] = pd.to_datetime(clientes[campo])
+        clientes['ativo'] = clientes['ativo'].astype(bool)
+        _gravar_parquet(clientes, esquemas['clientes'], os.path.join(EXTRACAO_DIR, 'clientes.parquet'))
+
+        consultores = pd.read_sql(select(Usuario.id, Usuario.nome, Usuario.email, Usuario.tipo,
+                                         Usuario.ativo, Usuario.meta_diaria).order_by(Usuario.id), conn)
+        consultores['ativo'] = consultores['ativo'].astype(bool)
+        _gravar_parquet(consultores, esquemas['consultores'], os.path.join(EXTRACAO_DIR, 'consultores.parquet'))
+
+    print(f"📦 Extração analítica: {total} ligações novas")
+    return total
+
+
+@app.route('/supervisor/extracao')
+@login_required
+@classe_carga('analitico')
+def listar_extracao():
+    """Partições disponíveis (mais recentes primeiro), com linhas e tamanho."""
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+    import pyarrow.parquet as pq
+
+    meses = []
+    for mes, pasta in sorted(_particoes_ligacoes().items(), reverse=True):
+        arquivos = [os.path.join(pasta, nome) for _, _, nome in _arquivos_mes(pasta)]
+        meses.append({
+            "mes": mes,
+            "arquivos": len(arquivos),
+            "linhas": sum(pq.read_metadata(a).num_rows for a in arquivos),
+            "bytes": sum(os.path.getsize(a) for a in arquivos),
+        })
+    ultima = db.session.execute(
+        select(ExecucaoJob.fim, ExecucaoJob.status, ExecucaoJob.mensagem)
+        .where(ExecucaoJob.job == 'extracao_analitica')
+        .order_by(ExecucaoJob.id.desc()).limit(1)
+    ).first()
+    return jsonify({
+        "ok": True,
+        "meses": meses,
+        "ultima_execucao": {"fim": ultima.fim.isoformat() if ultima.fim else None,
+                            "status": ultima.status, "mensagem": ultima.mensagem} if ultima else None,
+    })
+
+
+@app.route('/supervisor/extracao/baixar')
+@login_required
+@classe_carga('exportacao')
+def baixar_extracao():
+    """Zip com clientes, consultores e as `meses` partições mais recentes de
+    ligações (padrão 3; meses=0 para todas), no mesmo layout do diretório."""
+    if current_user.tipo != 'supervisor':
+        return jsonify({"ok": False, "mensagem": "Acesso negado"}), 403
+    import zipfile
+
+    particoes = sorted(_particoes_ligacoes().items(), reverse=True)
+    if not particoes:
+        return jsonify({"ok": False, "mensagem": "Nenhuma extração gerada ainda"}), 404
+    qtd = request.args.get('meses', 3, type=int)
+    if qtd and qtd > 0:
+        particoes = particoes[:qtd]
+
+    arquivos = [n for n in ('clientes.parquet', 'consultores.parquet')
+                if os.path.exists(os.path.join(EXTRACAO_DIR, n))]
+    for mes, pasta in particoes:
+        arquivos += [f"ligacoes/mes={mes}/{nome}" for _, _, nome in _arquivos_mes(pasta)]
+
+    def gerar():
+        # parquet já vem comprimido: o zip só empacota (ZIP_STORED)
+        with tempfile.TemporaryFile() as arq:
+            with zipfile.ZipFile(arq, 'w', zipfile.ZIP_STORED) as zf:
+                for rel in arquivos:
+                    zf.write(os.path.join(EXTRACAO_DIR, rel), rel)
+            arq.seek(0)
+            while True:
+                pedaco = arq.read(64 * 1024)
+                if not pedaco:
+                    break
+                yield pedaco
+
+    nome = f"extracao_{date.today().isoformat()}.zip"
+    return Response(gerar(), mimetype='application/zip',
+                    headers={"Content-Disposition": f'attachment; filename="{nome}"'})
+
 # =============================================================================
 # LIGAÇÕES POR DIA (JSON)
 # =============================================================================
 @app.route('/ligacoes-dia/<string:data>')
+@classe_carga('analitico')
 def ligacoes_dia(data):
     if not current_user.is_authenticated or current_user.tipo != 'supervisor':
         return jsonify({"erro": "Acesso negado"}), 403
 
     try:
-        data_obj = datetime.strptime(data, "%Y-%m-%d").date()
-
-        ligacoes = (Ligacao.query
-                   .options(joinedload(Ligacao.consultor), joinedload(Ligacao.cliente))
-                   .filter(func.date(Ligacao.data_hora) == data_obj)
-                   .order_by(Ligacao.data_hora.desc())
-                   .all())
+        inicio = datetime.strptime(data, "%Y-%m-%d")
+        fim = inicio + timedelta(days=1)
+
+        def montar(t, arquivada):
+            # na tabela quente, `dia` usa o índice ix_ligacoes_dia
+            periodo = ((t.c.dia == inicio.date(),) if 'dia' in t.c
+                       else (t.c.data_hora >= inicio, t.c.data_hora < fim))
+            return (select(t.c.data_hora, Usuario.nome.label('consultor'), Cliente.nome.label('cliente'),
+                           t.c.contato_nome, t.c.resultado, t.c.valor_venda, t.c.observacao)
+                    .outerjoin(Usuario, Usuario.id == t.c.consultor_id)
+                    .outerjoin(Cliente, Cliente.id == t.c.cliente_id)
+                    .where(*periodo))
+
+        ligs = union_all(*_ligacoes_quentes_e_arquivo(montar, inicio)).subquery()
+        stmt = select(ligs).order_by(ligs.c.data_hora.desc())
 
         resultado = []
-        for lig in ligacoes:
+        for data_hora, consultor_nome, cliente_nome, contato, res, valor, obs in db.session.execute(stmt):
             resultado.append({
-                "hora": lig.data_hora.strftime("%H:%M"),
-                "consultor": lig.consultor.nome if lig.consultor else "",
-                "cliente": lig.cliente.nome if lig.cliente else "",
-                "contato": lig.contato_nome or "-",
-                "resultado": lig.resultado or "nao_comprou",
-                "valor": formatar_dinheiro(lig.valor_venda or 0),
-                "observacao": lig.observacao or ""
+                "hora": data_hora.strftime("%H:%M"),
+                "consultor": consultor_nome or "",
+                "cliente": cliente_nome or "",
+                "contato": contato or "-",
+                "resultado": res or "nao_comprou",
+                "valor": formatar_dinheiro(valor or 0),
+                "observacao": obs or ""
             })
 
         return jsonify(resultado)
@@ -1594,10 +3751,15 @@ def gerenciar_usuarios():
         return redirect(url_for('index'))
     
     usuarios = Usuario.query.order_by(Usuario.nome.asc()).all()
+    clientes_por_consultor = dict(db.session.execute(
+        select(Cliente.consultor_id, func.count())
+        .where(Cliente.ativo == True)
+        .group_by(Cliente.consultor_id)
+    ).all())
     
     usuarios_data = []
     for u in usuarios:
-        total_clientes = Cliente.query.filter_by(consultor_id=u.id, ativo=True).count() if u.tipo == 'consultor' else 0
+        total_clientes = clientes_por_consultor.get(u.id, 0) if u.tipo == 'consultor' else 0
         usuarios_data.append({
             'id': u.id,
             'nome': u.nome,
@@ -1645,6 +3807,8 @@ def criar_usuario():
         )
         
         db.session.add(novo_usuario)
+        db.session.flush()
+        emitir_evento('usuario_criado', usuario_id=novo_usuario.id, tipo=tipo, por=current_user.id)
         db.session.commit()
         
         return jsonify({"ok": True, "mensagem": f"Usuário {nome} criado com sucesso!"})
@@ -1686,6 +3850,9 @@ def editar_usuario(usuario_id):
         usuario.tipo = tipo
         usuario.meta_diaria = meta_diaria
         
+        emitir_evento('usuario_alterado', usuario_id=usuario.id, por=current_user.id,
+                      campos=[c for c in ('nome', 'email', 'tipo', 'meta_diaria')
+                              if db.inspect(usuario).attrs[c].history.has_changes()])
         db.session.commit()
         
         return jsonify({"ok": True, "mensagem": f"Usuário {nome} atualizado com sucesso!"})
@@ -1710,6 +3877,8 @@ def toggle_status_usuario(usuario_id):
             return jsonify({"ok": False, "mensagem": "Você não pode inativar sua própria conta"}), 400
         
         usuario.ativo = not usuario.ativo
+        emitir_evento('usuario_alterado', usuario_id=usuario.id, por=current_user.id,
+                      campos=['ativo'], ativo=usuario.ativo)
         db.session.commit()
         
         status_texto = "ativado" if usuario.ativo else "inativado"
@@ -1738,6 +3907,7 @@ def redefinir_senha_usuario(usuario_id):
             return jsonify({"ok": False, "mensagem": "Senha deve ter no mínimo 6 caracteres"}), 400
         
         usuario.senha_hash = generate_password_hash(nova_senha)
+        emitir_evento('usuario_alterado', usuario_id=usuario.id, por=current_user.id, campos=['senha'])
         db.session.commit()
         
         return jsonify({"ok": True, "mensagem": f"Senha de {usuario.nome} redefinida com sucesso!"})
@@ -1870,29 +4040,11 @@ def minha_conta():
     stats = {}
     
     if current_user.tipo == 'consultor':
-        hoje = datetime.now().date()
-        desde30 = datetime.now() - timedelta(days=30)
-        
-        stats['total_clientes'] = Cliente.query.filter_by(
-            consultor_id=current_user.id, 
-            ativo=True
-        ).count()
-        
-        stats['total_ligacoes'] = Ligacao.query.filter(
-            Ligacao.consultor_id == current_user.id,
-            Ligacao.data_hora >= desde30
-        ).count()
-        
-        stats['ligacoes_hoje'] = Ligacao.query.filter(
-            Ligacao.consultor_id == current_user.id,
-            func.date(Ligacao.data_hora) == hoje
-        ).count()
-        
-        meta = current_user.meta_diaria or 10
-        stats['progresso_meta'] = round(
-            (stats['ligacoes_hoje'] / meta * 100) if meta > 0 else 0, 
-            1
-        )
+        st = stats_consultor(current_user)
+        stats['total_clientes'] = st['total_clientes']
+        stats['total_ligacoes'] = st['ligacoes_mes']
+        stats['ligacoes_hoje'] = st['ligacoes_hoje']
+        stats['progresso_meta'] = st['progresso_meta']
     
     return render_template('minha_conta.html', **stats)
 
@@ -1932,6 +4084,7 @@ def alterar_senha():
 # =============================================================================
 @app.route('/api/busca-clientes')
 @login_required
+@classe_carga(_classe_lista_clientes)
 def api_busca_clientes():
     if not current_user.is_authenticated:
         return jsonify({"erro": "Não autenticado"}), 401
@@ -1941,58 +4094,11 @@ def api_busca_clientes():
         aba = request.args.get('aba', 'pendentes')
         apenas_meus = True if current_user.tipo == 'consultor' else (request.args.get('meus') == '1')
         
-        # Query base
-        q = Cliente.query.options(joinedload(Cliente.ligacoes)).filter(Cliente.ativo == True)
-        if apenas_meus:
-            q = q.filter(Cliente.consultor_id == current_user.id)
-        
-        # Aplicar filtro de busca
-        if termo:
-            like = f"%{termo}%"
-            q = q.filter(or_(
-                Cliente.nome.like(like),
-                Cliente.cnpj.like(like),
-                Cliente.telefone.like(like),
-                Cliente.representante_nome.like(like)
-            ))
-        
-        clientes_todos = q.order_by(Cliente.nome.asc()).all()
-        
-        pendentes, contatados, precisa_retornar = [], [], []
-        agora = datetime.now()
-        
-        for c in clientes_todos:
-            ligs = sorted(c.ligacoes, key=lambda x: x.data_hora, reverse=True)
-            ultima = ligs[0] if ligs else None
-            total = len(ligs)
-            dados = {
-                "id": c.id,
-                "nome": c.nome,
-                "cnpj": c.cnpj,
-                "telefone": c.telefone,
-                "representante_nome": c.representante_nome,
-                "ultima_ligacao": ultima.data_hora.strftime("%d/%m/%Y %H:%M") if ultima else None,
-                "total_ligacoes": total,
-                "proxima_ligacao": c.proxima_ligacao.strftime("%d/%m/%Y %H:%M") if c.proxima_ligacao else None,
-                "origem": getattr(c, 'origem', None),
-            }
-            
-            if total == 0:
-                pendentes.append(dados)
-            else:
-                if c.proxima_ligacao:
-                    dados["retorno_atrasado"] = (agora >= c.proxima_ligacao)
-                    precisa_retornar.append(dados)
-                else:
-                    contatados.append(dados)
-        
-        # Retornar apenas a aba solicitada
-        if aba == 'pendentes':
-            clientes = pendentes
-        elif aba == 'retornar':
-            clientes = sorted(precisa_retornar, key=lambda x: (x['proxima_ligacao'] or datetime.max))
-        else:
-            clientes = contatados
+        clientes = []
+        for c in _clientes_da_aba(aba, _condicoes_clientes(apenas_meus, termo)):
+            c["ultima_ligacao"] = c["ultima_ligacao"].strftime("%d/%m/%Y %H:%M") if c["ultima_ligacao"] else None
+            c["proxima_ligacao"] = c["proxima_ligacao"].strftime("%d/%m/%Y %H:%M") if c["proxima_ligacao"] else None
+            clientes.append(c)
         
         return jsonify({
             "ok": True,
@@ -2023,16 +4129,23 @@ def remover_cliente(cliente_id):
         cliente.ativo = False
         
         if motivo:
+            agora = datetime.now()
             lig = Ligacao(
                 cliente_id=cliente_id,
                 consultor_id=current_user.id,
-                data_hora=datetime.now(),
+                data_hora=agora,
                 observacao=f"CLIENTE REMOVIDO: {motivo}",
                 resultado='sem_interesse'
             )
             db.session.add(lig)
-        
+            _registrar_resumo_ligacao(cliente, agora)
+            _evento_ligacao(lig, cliente)
+
+        emitir_evento('cliente_removido', cliente_id=cliente.id, dono_id=cliente.consultor_id,
+                      por=current_user.id, motivo=motivo or None)
         db.session.commit()
+        invalidar_stats_consultor(cliente.consultor_id)
+        invalidar_stats_consultor(current_user.id)
         
         return jsonify({"ok": True, "mensagem": f"Cliente {cliente.nome} removido com sucesso"})
         
@@ -2061,6 +4174,9 @@ def internal_error(error):
 # =============================================================================
 with app.app_context():
     db.create_all()
+    # bancos novos já saem completos do create_all; os ALTERs abaixo atualizam
+    # bancos antigos (MySQL) e falham sem efeito quando a coluna/índice já existe
+    dialeto = db.engine.dialect.name
     
     # meta_diaria em usuarios
     try:
@@ -2086,22 +4202,113 @@ with app.app_context():
     except Exception:
         db.session.rollback()
 
-    # coluna origem em clientes
+    # coluna origem em clientes (ENUM só existe no MySQL; nos outros, VARCHAR como o create_all)
     try:
+        tipo_origem = "ENUM('importado_csv','manual')" if dialeto == 'mysql' else "VARCHAR(12)"
         db.session.execute(text(
-            "ALTER TABLE clientes ADD COLUMN origem ENUM('importado_csv','manual') "
-            "NOT NULL DEFAULT 'manual'"
+            f"ALTER TABLE clientes ADD COLUMN origem {tipo_origem} NOT NULL DEFAULT 'manual'"
         ))
         db.session.commit()
     except Exception:
         db.session.rollback()
 
     # garantir enum com 'relacionamento' e 'cliente_inativo' em ligacoes.resultado
+    # (nos outros bancos o Enum vira VARCHAR sem lista de valores: nada a alterar)
+    if dialeto == 'mysql':
+        try:
+            db.session.execute(text(
+                "ALTER TABLE ligacoes MODIFY COLUMN resultado "
+                "ENUM('comprou','nao_comprou','retornar','sem_interesse','relacionamento','cliente_inativo') "
+                "NOT NULL DEFAULT 'nao_comprou'"
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    # atualizado_em em ligacoes (validador HTTP da linha do tempo)
+    try:
+        db.session.execute(text("ALTER TABLE ligacoes ADD COLUMN atualizado_em DATETIME NULL"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    try:
+        db.session.execute(text("UPDATE ligacoes SET atualizado_em = data_hora WHERE atualizado_em IS NULL"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    # dia em ligacoes: coluna gerada DATE(data_hora) + índice para agrupar por dia
+    # (o SQLite só aceita coluna gerada VIRTUAL em ALTER TABLE)
+    try:
+        armazenamento = 'VIRTUAL' if dialeto == 'sqlite' else 'STORED'
+        db.session.execute(text(
+            f"ALTER TABLE ligacoes ADD COLUMN dia DATE GENERATED ALWAYS AS (date(data_hora)) {armazenamento}"
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    try:
+        db.session.execute(text(
+            "CREATE INDEX ix_ligacoes_dia ON ligacoes (dia, consultor_id, resultado, valor_venda)"
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    # colunas-resumo em clientes (última ligação / total de ligações)
+    try:
+        db.session.execute(text("ALTER TABLE clientes ADD COLUMN ultima_ligacao DATETIME NULL"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    try:
+        db.session.execute(text("ALTER TABLE clientes ADD COLUMN total_ligacoes INT NOT NULL DEFAULT 0"))
+        db.session.commit()
+        # coluna acabou de ser criada: preenche a partir do histórico existente
+        db.session.execute(text(
+            "UPDATE clientes SET "
+            "total_ligacoes = (SELECT COUNT(*) FROM ligacoes l WHERE l.cliente_id = clientes.id), "
+            "ultima_ligacao = (SELECT MAX(l.data_hora) FROM ligacoes l WHERE l.cliente_id = clientes.id)"
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    for ddl in (
+        "CREATE INDEX ix_clientes_fila ON clientes (consultor_id, ativo, proxima_ligacao)",
+        "CREATE INDEX ix_clientes_ultima ON clientes (consultor_id, ativo, ultima_ligacao)",
+    ):
+        try:
+            db.session.execute(text(ddl))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    # chave de idempotência em ligacoes (registro em lote / fila offline)
+    try:
+        db.session.execute(text("ALTER TABLE ligacoes ADD COLUMN chave_idempotencia VARCHAR(64) NULL"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    try:
+        db.session.execute(text("CREATE UNIQUE INDEX ux_ligacoes_chave ON ligacoes (chave_idempotencia)"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    # índice (consultor_id, data_hora) para as estatísticas do consultor
     try:
         db.session.execute(text(
-            "ALTER TABLE ligacoes MODIFY COLUMN resultado "
-            "ENUM('comprou','nao_comprou','retornar','sem_interesse','relacionamento','cliente_inativo') "
-            "NOT NULL DEFAULT 'nao_comprou'"
+            "CREATE INDEX ix_ligacoes_consultor_data ON ligacoes (consultor_id, data_hora)"
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    # índice (cliente_id, data_hora) para o histórico do cliente (no MySQL substitui
+    # o índice só de cliente_id da chave estrangeira e já entrega ordenado)
+    try:
+        db.session.execute(text(
+            "CREATE INDEX ix_ligacoes_cliente_data ON ligacoes (cliente_id, data_hora)"
         ))
         db.session.commit()
     except Exception:
@@ -2126,7 +4333,172 @@ with app.app_context():
 # =============================================================================
 # SCHEDULER DIÁRIO 18:00
 # =============================================================================
+# Vários processos (instâncias web ou scheduler.py) podem ter o scheduler
+# ligado: cada disparo pega uma trava no banco antes de rodar, e jobs com
+# horário fixo (relatório) ainda conferem se aquele horário já foi executado.
 _scheduler = None
+INSTANCIA = f"{socket.gethostname()}:{os.getpid()}"
+LEASE_JOB = timedelta(minutes=int(os.getenv("LEASE_JOB_MINUTOS", "10")))
+
+
+@contextmanager
+def trava_job(nome):
+    """Trava exclusiva entre processos; entrega True se foi obtida."""
+    if db.engine.dialect.name == 'mysql':
+        # GET_LOCK pertence à conexão: ela fica aberta enquanto o job roda e,
+        # se o processo morrer, o MySQL solta a trava sozinho
+        with db.engine.connect() as conn:
+            obtida = conn.execute(text("SELECT GET_LOCK(:n, 0)"), {"n": f"bakof_job_{nome}"}).scalar() == 1
+            try:
+                yield obtida
+            finally:
+                if obtida:
+                    conn.execute(text("SELECT RELEASE_LOCK(:n)"), {"n": f"bakof_job_{nome}"})
+        return
+
+    agora = datetime.now()
+    try:
+        obtida = db.session.execute(
+            update(LeaseJob)
+            .where(LeaseJob.job == nome, or_(LeaseJob.expira_em < agora, LeaseJob.dono == INSTANCIA))
+            .values(dono=INSTANCIA, expira_em=agora + LEASE_JOB)
+        ).rowcount == 1
+        if not obtida:
+            db.session.execute(insert(LeaseJob).values(job=nome, dono=INSTANCIA, expira_em=agora + LEASE_JOB))
+            obtida = True
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        obtida = False
+    try:
+        yield obtida
+    finally:
+        if obtida:
+            db.session.rollback()
+            db.session.execute(
+                update(LeaseJob)
+                .where(LeaseJob.job == nome, LeaseJob.dono == INSTANCIA)
+                .values(expira_em=datetime.now())
+            )
+            db.session.commit()
+
+
+def executar_job(nome, fn, agendado_para=None, registrar_vazio=True):
+    """Roda `fn` sob a trava do job e registra duração e resultado.
+
+    Com `agendado_para`, o disparo só roda se ninguém ainda executou esse
+    horário com sucesso. Com registrar_vazio=False, execuções em que `fn`
+    devolve 0 (nada a fazer) não entram no histórico.
+    """
+    with app.app_context():
+        with trava_job(nome) as obtida:
+            if not obtida:
+                return None
+            if agendado_para is not None:
+                ja_rodou = db.session.execute(
+                    select(ExecucaoJob.id).where(ExecucaoJob.job == nome,
+                                                 ExecucaoJob.agendado_para == agendado_para,
+                                                 ExecucaoJob.status == 'ok')
+                ).first()
+                if ja_rodou:
+                    return None
+
+            execucao = ExecucaoJob(job=nome, agendado_para=agendado_para, instancia=INSTANCIA)
+            inicio = time.perf_counter()
+            try:
+                resultado = fn()
+                execucao.status = 'ok'
+                execucao.mensagem = None if resultado is None else str(resultado)[:2000]
+            except Exception as e:
+                db.session.rollback()
+                resultado = None
+                execucao.status = 'erro'
+                execucao.mensagem = str(e)[:2000]
+                print(f"❌ Erro no job {nome}: {e}")
+
+            if execucao.status == 'ok' and not registrar_vazio and not resultado:
+                return resultado
+            execucao.fim = datetime.now()
+            execucao.duracao_ms = int((time.perf_counter() - inicio) * 1000)
+            db.session.add(execucao)
+            db.session.commit()
+            return resultado
+
+
+def _job_relatorio():
+    snapshot_metricas(congelar=True)
+    ok, msg, _ = enfileirar_relatorio_email(MAIL_RECIPIENTS)
+    print(f"📧 Relatório automático: {msg}")
+    if RELATORIO_INDIVIDUAL:
+        ok_ind, msg_ind = enfileirar_relatorios_consultores()
+        print(f"📧 Relatórios individuais: {msg_ind}")
+        ok, msg = ok and ok_ind, f"{msg} {msg_ind}"
+    if not ok:
+        raise RuntimeError(msg)
+    return msg
+
+
+def _ultimo_disparo(gatilho, agora, janela):
+    """Último horário de `gatilho` até `agora`, procurando até `janela` para trás.
+
+    É o horário agendado do disparo em andamento, o mesmo em todas as
+    instâncias, ainda que uma delas dispare com atraso."""
+    ultimo = None
+    proximo = gatilho.get_next_fire_time(None, agora - janela)
+    while proximo is not None and proximo <= agora:
+        ultimo = proximo
+        proximo = gatilho.get_next_fire_time(proximo, proximo + timedelta(microseconds=1))
+    return ultimo
+
+
+def _job_agendado(scheduler, nome, fn, **cron):
+    """Job cron que roda no máximo uma vez por horário agendado, entre instâncias."""
+    gatilho = CronTrigger(timezone=scheduler.timezone, **cron)
+
+    def job():
+        agendado = _ultimo_disparo(gatilho, datetime.now(scheduler.timezone), timedelta(days=1))
+        executar_job(nome, fn, agendado_para=agendado.replace(tzinfo=None))
+
+    scheduler.add_job(job, trigger=gatilho, id=nome, replace_existing=True)
+
+
+def configurar_jobs(scheduler):
+    _job_agendado(scheduler, 'relatorio_diario', _job_relatorio,
+                  day_of_week='mon-fri', hour=18, minute=0)
+
+    scheduler.add_job(
+        lambda: executar_job('enviar_emails', enviar_emails_pendentes, registrar_vazio=False),
+        trigger='interval',
+        seconds=EMAIL_INTERVALO,
+        id='enviar_emails',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
+    if ARQUIVO_MESES > 0:
+        _job_agendado(scheduler, 'arquivar_ligacoes', arquivar_ligacoes, day=1, hour=3, minute=0)
+
+    scheduler.add_job(
+        lambda: executar_job('extracao_analitica', extrair_dados_analiticos, registrar_vazio=False),
+        trigger='interval',
+        minutes=EXTRACAO_INTERVALO,
+        id='extracao_analitica',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        lambda: executar_job('despachar_eventos', despachar_eventos, registrar_vazio=False),
+        trigger='interval',
+        seconds=EVENTOS_INTERVALO,
+        id='despachar_eventos',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
 
 def start_scheduler_once():
     from pytz import timezone
@@ -2137,25 +4509,7 @@ def start_scheduler_once():
     
     tz = timezone("America/Sao_Paulo")
     _scheduler = BackgroundScheduler(timezone=tz)
-    
-    def job_relatorio():
-        with app.app_context():
-            try:
-                ok, msg = enviar_relatorio_email(MAIL_RECIPIENTS)
-                print(f"📧 Relatório automático: {msg}")
-            except Exception as e:
-                print(f"❌ Erro no relatório automático: {e}")
-    
-    _scheduler.add_job(
-        job_relatorio,
-        trigger='cron',
-        day_of_week='mon-fri',
-        hour=18,
-        minute=0,
-        id='relatorio_diario',
-        replace_existing=True
-    )
-    
+    configurar_jobs(_scheduler)
     _scheduler.start()
     app._scheduler_started = True
     print("✅ Scheduler configurado: envio diário às 18:00 (America/Sao_Paulo)")
@@ -2166,7 +4520,9 @@ def start_scheduler_once():
 if __name__ == "__main__":
     from waitress import serve
 
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug:
+    # SCHEDULER_NA_WEB=false quando os jobs rodam à parte (python scheduler.py)
+    if os.getenv("SCHEDULER_NA_WEB", "true").lower() == "true" and (
+            os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug):
         start_scheduler_once()
 
     host = os.getenv("HOST", "0.0.0.0")
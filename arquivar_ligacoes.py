@@ -0,0 +1,25 @@
+"""Move as ligações antigas de `ligacoes` para `ligacoes_arquivo`.
+
+    python arquivar_ligacoes.py --meses 12
+
+Mantém na tabela quente os últimos N meses fechados mais o mês atual. O
+histórico do cliente, a linha do tempo, as consultas por mês e a exportação
+continuam enxergando as ligações arquivadas. Com ARQUIVO_MESES no .env o
+scheduler faz o mesmo todo dia 1º às 03:00.
+"""
+import argparse
+
+from app import ARQUIVO_MESES, arquivar_ligacoes, executar_job
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquiva ligações antigas")
+    parser.add_argument("--meses", type=int, default=ARQUIVO_MESES,
+                        help="meses fechados mantidos na tabela quente (padrão: ARQUIVO_MESES)")
+    args = parser.parse_args()
+    if args.meses <= 0:
+        parser.error("informe --meses maior que zero (ou defina ARQUIVO_MESES)")
+
+    movidas = executar_job('arquivar_ligacoes', lambda: arquivar_ligacoes(args.meses))
+    if movidas is None:
+        print("⚠️ Outro processo está arquivando agora (ou a execução falhou; veja o log de jobs).")
@@ -1,43 +1,25 @@
 from werkzeug.security import generate_password_hash
-import pymysql
 
-# Configurações do banco
-DB_HOST = 'localhost'
-DB_USER = 'root'
-DB_PASSWORD = '1235'  
-DB_NAME = 'controle_ligacoes'
+# Usa o mesmo banco do app (.env: DB_* ou DATABASE_URL, ex.: sqlite:///teste.db)
+from app import app, db, Usuario
 
 def criar_usuarios():
     """Cria usuários de teste no banco"""
     
-    # Conectar ao banco
-    conexao = pymysql.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME
-    )
-    
-    cursor = conexao.cursor()
-    
     # Limpar usuários existentes (opcional)
     print("Limpando usuários antigos...")
-    cursor.execute("DELETE FROM usuarios")
+    Usuario.query.delete()
     
     # Criar supervisor
     senha_supervisor = generate_password_hash('admin123')
-    cursor.execute("""
-        INSERT INTO usuarios (nome, email, senha_hash, tipo)
-        VALUES (%s, %s, %s, %s)
-    """, ('Supervisor', 'supervisor@bakof.com.br', senha_supervisor, 'supervisor'))
+    db.session.add(Usuario(nome='Supervisor', email='supervisor@bakof.com.br',
+                           senha_hash=senha_supervisor, tipo='supervisor'))
     print("✅ Supervisor criado: supervisor@bakof.com.br / admin123")
     
     # Criar consultor Gabriel
     senha_gabriel = generate_password_hash('123456')
-    cursor.execute("""
-        INSERT INTO usuarios (nome, email, senha_hash, tipo)
-        VALUES (%s, %s, %s, %s)
-    """, ('Gabriel', 'gabriel@empresa.com', senha_gabriel, 'consultor'))
+    db.session.add(Usuario(nome='Gabriel', email='gabriel@empresa.com',
+                           senha_hash=senha_gabriel, tipo='consultor'))
     print("✅ Consultor criado: gabriel@empresa.com / 123456")
     
     # Criar mais consultores de exemplo (opcional)
@@ -49,18 +31,11 @@ def criar_usuarios():
     
     for nome, email, senha in consultores:
         senha_hash = generate_password_hash(senha)
-        cursor.execute("""
-            INSERT INTO usuarios (nome, email, senha_hash, tipo)
-            VALUES (%s, %s, %s, %s)
-        """, (nome, email, senha_hash, 'consultor'))
+        db.session.add(Usuario(nome=nome, email=email, senha_hash=senha_hash, tipo='consultor'))
         print(f"✅ Consultor criado: {email} / {senha}")
     
     # Salvar mudanças
-    conexao.commit()
-    
-    # Fechar conexão
-    cursor.close()
-    conexao.close()
+    db.session.commit()
     
     print("\n🎉 Todos os usuários foram criados com sucesso!")
     print("\nPara fazer login, use:")
@@ -71,10 +46,11 @@ if __name__ == '__main__':
     print("=== Criador de Usuários ===\n")
     
     try:
-        criar_usuarios()
+        with app.app_context():
+            criar_usuarios()
     except Exception as e:
         print(f"❌ Erro: {e}")
         print("\nVerifique:")
         print("1. MySQL está rodando?")
         print("2. Banco 'controle_ligacoes' foi criado?")
-        print("3. Usuário e senha estão corretos no script?")
\ No newline at end of file
+        print("3. DB_USER/DB_PASSWORD (ou DATABASE_URL) estão corretos no .env?")
\ No newline at end of file
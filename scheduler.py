@@ -0,0 +1,22 @@
+"""Roda os jobs agendados (relatório das 18:00, fila de e-mails, eventos) fora
+do servidor web. Use com SCHEDULER_NA_WEB=false nas instâncias web:
+
+    python scheduler.py
+
+Pode haver mais de um processo destes: cada job pega uma trava no banco
+antes de rodar, então nada é executado em dobro.
+"""
+from pytz import timezone
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from app import configurar_jobs
+
+
+if __name__ == "__main__":
+    scheduler = BlockingScheduler(timezone=timezone("America/Sao_Paulo"))
+    configurar_jobs(scheduler)
+    print("✅ Scheduler dedicado iniciado: envio diário às 18:00 (America/Sao_Paulo)")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
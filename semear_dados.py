@@ -0,0 +1,391 @@
+"""Gera uma base de dados fictícia e realista para testes de carga e desempenho.
+
+    python semear_dados.py --clientes 100000 --ligacoes 2000000 --limpar
+    python semear_dados.py --url sqlite:///bench.db --ate 2026-06-30
+
+Mesma semente + mesmos parâmetros + mesma data final (--ate) = mesma base,
+linha por linha. Os dados vão em lotes (executemany) direto nas tabelas, sem
+passar pelo ORM; os ids são atribuídos aqui, acima dos que já existem.
+
+Volumes: até ~1M de clientes e ~10M de ligações. As ligações seguem dias
+úteis (sábado fraco, domingo sem), horário comercial com queda no almoço,
+consultores com produtividades diferentes e uma distribuição de resultados
+parecida com a da operação. As colunas-resumo dos clientes (total, última e
+próxima ligação) saem coerentes com as ligações geradas.
+
+Os usuários criados são supervisor1@seed.local e consultor001@seed.local em
+diante, todos com a senha de --senha.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from array import array
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, func, insert, select, update
+from werkzeug.security import generate_password_hash
+
+NOMES = ["Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Fernando", "Gabriela", "Henrique", "Isabela",
+         "João", "Juliana", "Lucas", "Mariana", "Marcos", "Natália", "Paulo", "Rafaela", "Rodrigo",
+         "Sandra", "Tiago", "Vanessa", "Vitor", "Cláudio", "Luana", "Márcia", "Sérgio", "Alemir", "Ivone"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Schmidt", "Weber", "Rossi", "Bortolini", "Kunz",
+              "Pereira", "Costa", "Becker", "Zanella", "Fritsch", "Lima", "Moraes", "Dalla Costa",
+              "Hoffmann", "Rodrigues", "Bakof", "Marchi", "Menegat", "Scherer", "Vieira"]
+RAMOS = ["Agropecuária", "Comercial", "Cerealista", "Granja", "Fazenda", "Cooperativa", "Distribuidora",
+         "Mercado", "Agro", "Transportes", "Laticínios", "Suinocultura", "Construtora", "Ferragem"]
+SUFIXOS = ["Ltda", "ME", "EIRELI", "S/A", "Ltda", "Ltda", ""]
+DDDS = ["51", "53", "54", "55", "55", "55"]
+
+RESULTADOS = ["nao_comprou", "retornar", "sem_interesse", "comprou", "relacionamento", "cliente_inativo"]
+PESOS_RESULTADOS = [40, 20, 12, 15, 10, 3]
+# 08h às 18h, com queda no almoço
+PESOS_HORAS = {8: 0.6, 9: 1.0, 10: 1.1, 11: 1.0, 12: 0.3, 13: 0.6, 14: 1.0, 15: 1.1, 16: 1.0, 17: 0.7, 18: 0.2}
+PESOS_SEMANA = [1.0, 1.0, 1.0, 1.0, 0.95, 0.15, 0.0]  # seg..dom
+
+OBSERVACOES = [
+    "Pediu para ligar na semana que vem.", "Sem estoque no momento, retornar no fim do mês.",
+    "Comprou 2 caixas d'água 10.000L.", "Falou com o filho, o dono estava na lavoura.",
+    "Interessado em cisterna, mandar orçamento por WhatsApp.", "Número não atende.",
+    "Cliente satisfeito com a última entrega.", "Achou o preço alto, comparar com concorrente.",
+    "Vai reformar o galpão, pediu catálogo.", "Ligação caiu, tentar de novo.",
+]
+NOTAS = [
+    "Prefere contato pela manhã.", "Pagamento sempre no boleto 30 dias.", "Cliente antigo, muito fiel.",
+    "Tem duas propriedades, entregar na de baixo.", "Falar com a esposa, ela cuida das compras.",
+    "Pediu visita do representante.", "Sensível a preço.", "Usa o produto há mais de 10 anos.",
+]
+BANNERS = [
+    ("Meta do mês", "Faltam poucos dias para fechar a meta do mês. Bora!", "info"),
+    ("Promoção de caixas d'água", "Condição especial para pedidos acima de 5 unidades até sexta.", "success"),
+    ("Manutenção programada", "O sistema ficará fora do ar sábado das 22h às 23h.", "warning"),
+    ("Atualização de preços", "Nova tabela de preços vale a partir de segunda.", "danger"),
+]
+
+# ordem de exclusão respeitando as chaves estrangeiras
+TABELAS_LIMPAR = ["resumo_mensal", "metricas_congeladas", "execucoes_jobs", "jobs_lease",
+                  "notas", "ligacoes", "ligacoes_arquivo", "alteracoes", "eventos", "eventos_offsets",
+                  "emails_saida", "banners", "clientes", "usuarios"]
+
+
+def cnpj_valido(base8):
+    """CNPJ (só dígitos) da matriz 0001 com dígitos verificadores corretos."""
+    numeros = [int(c) for c in f"{base8:08d}0001"]
+    for pesos in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        resto = sum(n * p for n, p in zip(numeros, pesos)) % 11
+        numeros.append(0 if resto < 2 else 11 - resto)
+    return "".join(map(str, numeros))
+
+
+def telefone(rnd):
+    ddd = rnd.choice(DDDS)
+    if rnd.random() < 0.7:
+        return f"{ddd}9{rnd.randint(10000000, 99999999)}"
+    return f"{ddd}{rnd.randint(2, 5)}{rnd.randint(1000000, 9999999)}"
+
+
+def nome_cliente(rnd):
+    partes = [rnd.choice(RAMOS), rnd.choice(SOBRENOMES)]
+    if rnd.random() < 0.3:
+        partes.append(rnd.choice(SOBRENOMES))
+    sufixo = rnd.choice(SUFIXOS)
+    return " ".join(partes + ([sufixo] if sufixo else []))
+
+
+def pessoa(rnd):
+    return f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}"
+
+
+class Semeador:
+    def __init__(self, conn, tabelas, args):
+        self.conn = conn
+        self.t = tabelas
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.fim = datetime.combine(args.ate, datetime.min.time()) + timedelta(days=1)
+        self.inicio = self.fim - timedelta(days=args.dias)
+
+    # ------------------------------------------------------------------ util
+    def _proximo_id(self, nome):
+        return (self.conn.execute(select(func.max(self.t[nome].c.id))).scalar() or 0) + 1
+
+    def _inserir(self, nome, linhas):
+        if linhas:
+            self.conn.execute(insert(self.t[nome]), linhas)
+            self.conn.commit()
+
+    def _em_lotes(self, nome, gerador, total, rotulo):
+        inicio = time.perf_counter()
+        lote, feitos = [], 0
+        for linha in gerador:
+            lote.append(linha)
+            if len(lote) >= self.args.lote:
+                self._inserir(nome, lote)
+                feitos += len(lote)
+                lote = []
+                dt = time.perf_counter() - inicio
+                print(f"\r   {rotulo}: {feitos:,}/{total:,} ({feitos / dt:,.0f}/s)", end="", flush=True)
+        self._inserir(nome, lote)
+        feitos += len(lote)
+        dt = time.perf_counter() - inicio
+        print(f"\r   {rotulo}: {feitos:,}/{total:,} em {dt:.1f}s" + " " * 20)
+
+    # -------------------------------------------------------------- etapas
+    def limpar(self):
+        for nome in TABELAS_LIMPAR:
+            if nome in self.t:
+                self.conn.execute(self.t[nome].delete())
+        self.conn.commit()
+        print("🧹 Tabelas limpas")
+
+    def usuarios(self):
+        a, rnd = self.args, self.rnd
+        senha_hash = generate_password_hash(a.senha)  # uma vez só: o hash é lento de propósito
+        prox = self._proximo_id("usuarios")
+        linhas = []
+        for i in range(a.supervisores):
+            linhas.append({"id": prox + len(linhas), "nome": f"Supervisor {i + 1}",
+                           "email": f"supervisor{i + 1}@seed.local", "senha_hash": senha_hash,
+                           "tipo": "supervisor", "ativo": True, "meta_diaria": 10, "viu_novidades": True,
+                           "data_cadastro": self.inicio})
+        self.consultores = []
+        for i in range(a.consultores):
+            uid = prox + len(linhas)
+            linhas.append({"id": uid, "nome": pessoa(rnd), "email": f"consultor{i + 1:03d}@seed.local",
+                           "senha_hash": senha_hash, "tipo": "consultor", "ativo": True,
+                           "meta_diaria": rnd.choice([10, 15, 20, 20, 30]), "viu_novidades": True,
+                           "data_cadastro": self.inicio})
+            self.consultores.append(uid)
+        self.supervisor_id = prox if a.supervisores else self.consultores[0]
+        self._inserir("usuarios", linhas)
+        print(f"👤 {a.supervisores} supervisores e {a.consultores} consultores (senha: {a.senha})")
+
+    def clientes(self):
+        a, rnd = self.args, self.rnd
+        # carteiras de tamanhos diferentes
+        pesos = [rnd.lognormvariate(0, 0.5) for _ in self.consultores]
+        self.cliente_base = self._proximo_id("clientes")
+        self.dono = array("i")
+        self.carteiras = {uid: array("i") for uid in self.consultores}
+        deslocamento = rnd.randrange(10 ** 8)
+
+        def gerar():
+            for i in range(a.clientes):
+                cid = self.cliente_base + i
+                dono = rnd.choices(self.consultores, pesos)[0]
+                self.dono.append(dono)
+                self.carteiras[dono].append(cid)
+                cadastro = self.inicio - timedelta(days=rnd.randint(0, 3 * 365), minutes=rnd.randint(0, 1440))
+                yield {
+                    "id": cid,
+                    "nome": nome_cliente(rnd),
+                    # 7919 é primo com 10^8: bases distintas para até 10^8 clientes
+                    "cnpj": cnpj_valido((cid * 7919 + deslocamento) % 10 ** 8),
+                    "telefone": telefone(rnd),
+                    "representante_nome": pessoa(rnd) if rnd.random() < 0.6 else None,
+                    "consultor_id": dono,
+                    "data_cadastro": cadastro,
+                    "ativo": rnd.random() >= 0.03,
+                    "origem": "importado_csv" if rnd.random() < 0.85 else "manual",
+                    "total_ligacoes": 0,
+                }
+
+        self._em_lotes("clientes", gerar(), a.clientes, "🏢 clientes")
+
+    def _chamadas_por_dia(self):
+        rnd, a = self.rnd, self.args
+        dias = [self.inicio.date() + timedelta(days=d) for d in range(a.dias)]
+        # leve crescimento ao longo do período + ruído diário
+        pesos = [PESOS_SEMANA[d.weekday()] * (0.7 + 0.6 * i / max(1, a.dias - 1)) * rnd.uniform(0.75, 1.25)
+                 for i, d in enumerate(dias)]
+        total_pesos = sum(pesos) or 1
+        qtds = [math.floor(a.ligacoes * p / total_pesos) for p in pesos]
+        sobra = a.ligacoes - sum(qtds)
+        uteis = [i for i, p in enumerate(pesos) if p > 0] or list(range(len(dias)))
+        for k in range(sobra):
+            qtds[uteis[k % len(uteis)]] += 1
+        return zip(dias, qtds)
+
+    def ligacoes(self):
+        a, rnd = self.args, self.rnd
+        horas = list(PESOS_HORAS)
+        pesos_horas = list(PESOS_HORAS.values())
+        produtividade = [rnd.lognormvariate(0, 0.35) for _ in self.consultores]
+        com_carteira = [(uid, p) for uid, p in zip(self.consultores, produtividade) if self.carteiras[uid]]
+        if not com_carteira:
+            return
+        quem, pesos_quem = zip(*com_carteira)
+
+        # colunas-resumo dos clientes, acumuladas enquanto as ligações são geradas
+        n = a.clientes
+        self.total = array("i", bytes(4 * n))
+        self.ultima = array("d", bytes(8 * n))
+        self.retorno = array("d", bytes(8 * n))
+        lid = self._proximo_id("ligacoes")
+
+        def gerar():
+            nonlocal lid
+            for dia, qtd in self._chamadas_por_dia():
+                base = datetime.combine(dia, datetime.min.time())
+                momentos = sorted(
+                    base + timedelta(hours=h, seconds=rnd.randrange(3600))
+                    for h in rnd.choices(horas, pesos_horas, k=qtd)
+                )
+                consultores = rnd.choices(quem, pesos_quem, k=qtd)
+                resultados = rnd.choices(RESULTADOS, PESOS_RESULTADOS, k=qtd)
+                for quando, consultor, resultado in zip(momentos, consultores, resultados):
+                    carteira = self.carteiras[consultor]
+                    cid = carteira[rnd.randrange(len(carteira))]
+                    i = cid - self.cliente_base
+                    self.total[i] += 1
+                    self.ultima[i] = quando.timestamp()
+                    self.retorno[i] = ((quando + timedelta(days=rnd.randint(1, 10))).timestamp()
+                                       if resultado == "retornar" else 0.0)
+                    yield {
+                        "id": lid,
+                        "cliente_id": cid,
+                        "consultor_id": consultor,
+                        "data_hora": quando,
+                        "observacao": rnd.choice(OBSERVACOES) if rnd.random() < 0.35 else None,
+                        "contato_nome": rnd.choice(NOMES) if rnd.random() < 0.7 else None,
+                        "resultado": resultado,
+                        "valor_venda": round(rnd.lognormvariate(7.0, 0.8), 2) if resultado == "comprou" else 0,
+                        "atualizado_em": quando,
+                    }
+                    lid += 1
+
+        self._em_lotes("ligacoes", gerar(), a.ligacoes, "📞 ligações")
+        self._resumo_clientes()
+        self._descartar_resumo_mensal()
+
+    def _descartar_resumo_mensal(self):
+        """As ligações entram sem passar por emitir_evento, então o resumo mensal
+        ficaria defasado. Sem a linha de offset, o próximo despacho refaz a carga
+        inicial a partir das ligações."""
+        if "resumo_mensal" not in self.t:
+            return
+        offsets = self.t["eventos_offsets"]
+        self.conn.execute(self.t["resumo_mensal"].delete())
+        self.conn.execute(offsets.delete().where(offsets.c.assinante == "_resumo_mensal"))
+        self.conn.commit()
+
+    def _resumo_clientes(self):
+        """Grava total/última/próxima ligação nos clientes. Os valores vão para
+        uma tabela auxiliar em lotes e entram com um único UPDATE, que roda
+        igual no MySQL e no SQLite."""
+        meta = MetaData()
+        resumo = Table("_semear_resumo", meta,
+                       Column("id", Integer, primary_key=True, autoincrement=False),
+                       Column("total", Integer), Column("ultima", DateTime), Column("proxima", DateTime))
+        meta.drop_all(self.conn)
+        meta.create_all(self.conn)
+
+        def gerar():
+            for i in range(len(self.total)):
+                if self.total[i]:
+                    yield {"id": self.cliente_base + i, "total": self.total[i],
+                           "ultima": datetime.fromtimestamp(self.ultima[i]),
+                           "proxima": datetime.fromtimestamp(self.retorno[i]) if self.retorno[i] else None}
+
+        lote = []
+        for linha in gerar():
+            lote.append(linha)
+            if len(lote) >= self.args.lote:
+                self.conn.execute(insert(resumo), lote)
+                lote = []
+        if lote:
+            self.conn.execute(insert(resumo), lote)
+
+        clientes = self.t["clientes"]
+        def valor(col):
+            return select(col).where(resumo.c.id == clientes.c.id).scalar_subquery()
+        self.conn.execute(
+            update(clientes)
+            .where(clientes.c.id.in_(select(resumo.c.id)))
+            .values(total_ligacoes=valor(resumo.c.total), ultima_ligacao=valor(resumo.c.ultima),
+                    proxima_ligacao=valor(resumo.c.proxima))
+        )
+        meta.drop_all(self.conn)
+        self.conn.commit()
+        print("   ↳ colunas-resumo dos clientes atualizadas")
+
+    def notas(self):
+        a, rnd = self.args, self.rnd
+        if not a.notas or not a.clientes:
+            return
+        nid = self._proximo_id("notas")
+        segundos = int((self.fim - self.inicio).total_seconds())
+
+        def gerar():
+            for k in range(a.notas):
+                i = rnd.randrange(a.clientes)
+                yield {"id": nid + k, "cliente_id": self.cliente_base + i, "usuario_id": self.dono[i],
+                       "texto": rnd.choice(NOTAS),
+                       "data_criacao": self.inicio + timedelta(seconds=rnd.randrange(segundos))}
+
+        self._em_lotes("notas", gerar(), a.notas, "📝 notas")
+
+    def banners(self):
+        a = self.args
+        linhas = []
+        for k in range(a.banners):
+            titulo, mensagem, tipo = BANNERS[k % len(BANNERS)]
+            linhas.append({"titulo": titulo, "mensagem": mensagem, "tipo": tipo, "ativo": k == 0,
+                           "data_criacao": self.fim - timedelta(days=7 * (k + 1)),
+                           "data_expiracao": self.fim + timedelta(days=30) if k == 0 else None,
+                           "criado_por": self.supervisor_id})
+        self._inserir("banners", linhas)
+        if linhas:
+            print(f"📣 {len(linhas)} banners")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados fictícios para testes de desempenho")
+    parser.add_argument("--url", help="banco de destino (ex.: sqlite:///bench.db); padrão: o mesmo do app")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ate", type=date.fromisoformat, default=date.today(),
+                        help="último dia com ligações, AAAA-MM-DD (padrão: hoje)")
+    parser.add_argument("--dias", type=int, default=365, help="dias de histórico de ligações")
+    parser.add_argument("--supervisores", type=int, default=1)
+    parser.add_argument("--consultores", type=int, default=20)
+    parser.add_argument("--clientes", type=int, default=10000)
+    parser.add_argument("--ligacoes", type=int, default=200000)
+    parser.add_argument("--notas", type=int, default=5000)
+    parser.add_argument("--banners", type=int, default=3)
+    parser.add_argument("--senha", default="123456", help="senha de todos os usuários gerados")
+    parser.add_argument("--lote", type=int, default=5000, help="linhas por executemany")
+    parser.add_argument("--limpar", action="store_true",
+                        help="APAGA usuários, clientes, ligações, notas, banners e as tabelas derivadas antes de gerar")
+    args = parser.parse_args()
+    if args.consultores < 1:
+        parser.error("--consultores precisa ser pelo menos 1")
+
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    # o import cria as tabelas que faltarem no banco de destino
+    from app import app, db
+
+    with app.app_context():
+        tabelas = db.metadata.tables
+        with db.engine.connect() as conn:
+            print(f"🌱 Semeando {db.engine.url.render_as_string(hide_password=True)} (seed={args.seed}, até {args.ate})")
+            inicio = time.perf_counter()
+            s = Semeador(conn, tabelas, args)
+            if args.limpar:
+                s.limpar()
+            s.usuarios()
+            s.clientes()
+            s.ligacoes()
+            s.notas()
+            s.banners()
+            print(f"✅ Pronto em {time.perf_counter() - inicio:.1f}s")
+            print(f"   Para reproduzir: python {os.path.basename(sys.argv[0])} --seed {args.seed} --ate {args.ate} "
+                  f"--dias {args.dias} --supervisores {args.supervisores} --consultores {args.consultores} "
+                  f"--clientes {args.clientes} --ligacoes {args.ligacoes} --notas {args.notas} "
+                  f"--banners {args.banners} --limpar")
+
+
+if __name__ == "__main__":
+    main()
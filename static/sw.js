@@ -0,0 +1,67 @@
+// Service worker do consultor: mantém a página de clientes e os arquivos
+// estáticos disponíveis sem rede. Ligações feitas offline ficam na fila do
+// IndexedDB (meus_clientes.html) e são enviadas em lote ao reconectar.
+const CACHE = 'bakof-v1';
+const PRECACHE = [
+  '/meus-clientes',
+  '/static/img/bakof-logo.png',
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+  'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/bootstrap-icons.css',
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js'
+];
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(CACHE)
+      .then(cache => Promise.all(PRECACHE.map(url => cache.add(url).catch(() => null))))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(nomes => Promise.all(nomes.filter(n => n !== CACHE).map(n => caches.delete(n))))
+      .then(() => self.clients.claim())
+  );
+});
+
+function ehEstatico(url) {
+  return url.origin !== self.location.origin || url.pathname.startsWith('/static/');
+}
+
+self.addEventListener('fetch', event => {
+  const req = event.request;
+  if (req.method !== 'GET') return;
+
+  const url = new URL(req.url);
+
+  // estáticos (inclusive CDN): cache primeiro, atualizando em segundo plano
+  if (ehEstatico(url)) {
+    event.respondWith(
+      caches.open(CACHE).then(cache =>
+        cache.match(req).then(cacheado => {
+          const rede = fetch(req).then(resp => {
+            if (resp.ok) cache.put(req, resp.clone());
+            return resp;
+          }).catch(() => cacheado);
+          return cacheado || rede;
+        })
+      )
+    );
+    return;
+  }
+
+  // página de clientes: rede primeiro, cópia em cache para uso offline
+  if (req.mode === 'navigate' && url.pathname === '/meus-clientes') {
+    event.respondWith(
+      fetch(req).then(resp => {
+        if (resp.ok && !resp.redirected) {
+          const copia = resp.clone();
+          caches.open(CACHE).then(cache => cache.put('/meus-clientes', copia));
+        }
+        return resp;
+      }).catch(() => caches.match('/meus-clientes'))
+    );
+  }
+});
@@ -0,0 +1,343 @@
+"""Teste de carga HTTP: simula consultores e supervisores usando o sistema.
+
+    python teste_carga.py --usuarios 30 --duracao 60
+    python teste_carga.py --usuarios 30 --duracao 60 --salvar-base base.json
+    python teste_carga.py --usuarios 30 --duracao 60 --comparar base.json
+
+Roda contra uma instância já no ar (python app.py) com a base gerada por
+semear_dados.py: cada usuário virtual entra como consultor001@seed.local... ou
+supervisor1@seed.local e repete uma mistura ponderada de ações (busca enquanto
+digita, linha do tempo do cliente com a página seguinte e a revalidação pelo
+ETag, registro de ligação, filtro por mês, painel),
+com uma pausa entre elas (--pausa). O registro de ligações GRAVA no banco:
+use uma base descartável ou --sem-escrita.
+
+Ao final mostra, por ação: requisições, requisições/s, latências p50/p90/p95/p99
+e taxa de erro (status >= 400 ou falha de conexão; 503 é contado à parte
+porque é a recusa por sobrecarga). --salvar-base grava esses números em JSON e
+--comparar aponta as ações que pioraram além de --tolerancia em relação a uma
+base salva; se houver regressão, sai com código 1.
+
+Só usa a biblioteca padrão, uma conexão keep-alive por usuário virtual.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+
+# (peso, perfil): as ações de consultor só rodam em usuários consultores
+ACOES = {
+    "busca": (40, "consultor"),
+    "historico": (25, "consultor"),
+    "registrar": (15, "consultor"),
+    "mes": (10, "consultor"),
+    "painel": (7, "supervisor"),
+    "resultados_mes": (3, "supervisor"),
+}
+TERMOS = ["agro", "silva", "granja", "coop", "santos", "fazenda", "mercado", "souza", "lat", "dist"]
+ABAS = ["pendentes", "pendentes", "retornar", "contatados"]
+RESULTADOS = ["nao_comprou", "retornar", "sem_interesse", "comprou", "relacionamento"]
+PERCENTIS = (50, 90, 95, 99)
+
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    # nearest-rank: menor valor com pelo menos p% das amostras até ele
+    i = min(len(ordenados) - 1, max(0, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[i]
+
+
+class Estatisticas:
+    """Latências e contagens por ação, compartilhadas entre as threads."""
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.latencias = {}
+        self.erros = {}
+        self.recusas = {}
+        self.ativo = False
+
+    def registrar(self, acao, ms, status):
+        if not self.ativo:
+            return
+        with self.trava:
+            self.latencias.setdefault(acao, []).append(ms)
+            if status == 503:
+                self.recusas[acao] = self.recusas.get(acao, 0) + 1
+            elif status is None or status >= 400:
+                self.erros[acao] = self.erros.get(acao, 0) + 1
+
+    def resumo(self, duracao):
+        resumo = {}
+        with self.trava:
+            for acao in sorted(self.latencias):
+                lat = sorted(self.latencias[acao])
+                total = len(lat)
+                item = {
+                    "requisicoes": total,
+                    "rps": round(total / duracao, 2),
+                    "erros_pct": round(100.0 * self.erros.get(acao, 0) / total, 2),
+                    "recusas_pct": round(100.0 * self.recusas.get(acao, 0) / total, 2),
+                    "max_ms": round(lat[-1], 1),
+                }
+                for p in PERCENTIS:
+                    item[f"p{p}_ms"] = round(percentil(lat, p), 1)
+                resumo[acao] = item
+        return resumo
+
+
+class UsuarioVirtual(threading.Thread):
+    def __init__(self, args, email, perfil, stats, fim, semente):
+        super().__init__(daemon=True)
+        self.args = args
+        self.email = email
+        self.perfil = perfil
+        self.stats = stats
+        self.fim = fim
+        self.rnd = random.Random(semente)
+        self.cookies = {}
+        self.clientes = []
+        self.falha = None
+        alvo = urlsplit(args.url)
+        self.host, self.porta, self.prefixo = alvo.hostname, alvo.port or 80, alvo.path.rstrip("/")
+        self.conexao = None
+        self.cabecalhos_resposta = None
+
+        acoes = [(nome, peso) for nome, (peso, perfil_acao) in ACOES.items()
+                 if perfil_acao == perfil and not (args.sem_escrita and nome == "registrar")]
+        self.nomes = [nome for nome, _ in acoes]
+        self.pesos = [peso for _, peso in acoes]
+
+    # ---- HTTP ----
+    def requisicao(self, metodo, caminho, corpo=None, tipo=None, extras=None):
+        """(status, bytes) — reabre a conexão uma vez se o servidor a fechou. Os
+        cabeçalhos da resposta ficam em self.cabecalhos_resposta."""
+        cabecalhos = {"Accept": "application/json, text/html", **(extras or {})}
+        if self.cookies:
+            cabecalhos["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if tipo:
+            cabecalhos["Content-Type"] = tipo
+        for tentativa in (1, 2):
+            try:
+                if self.conexao is None:
+                    self.conexao = http.client.HTTPConnection(self.host, self.porta, timeout=self.args.timeout)
+                self.conexao.request(metodo, self.prefixo + caminho, body=corpo, headers=cabecalhos)
+                resp = self.conexao.getresponse()
+                dados = resp.read()
+                self.cabecalhos_resposta = resp.headers
+                for valor in resp.headers.get_all("Set-Cookie") or []:
+                    nome, _, resto = valor.partition("=")
+                    self.cookies[nome.strip()] = resto.split(";", 1)[0]
+                if resp.will_close:
+                    self.conexao.close()
+                    self.conexao = None
+                return resp.status, dados
+            except (http.client.HTTPException, OSError):
+                if self.conexao is not None:
+                    self.conexao.close()
+                    self.conexao = None
+                if tentativa == 2:
+                    raise
+
+    def medir(self, acao, metodo, caminho, corpo=None, tipo=None, extras=None):
+        inicio = time.perf_counter()
+        try:
+            status, dados = self.requisicao(metodo, caminho, corpo, tipo, extras)
+        except (http.client.HTTPException, OSError):
+            status, dados = None, b""
+        self.stats.registrar(acao, (time.perf_counter() - inicio) * 1000.0, status)
+        return status, dados
+
+    def entrar(self):
+        corpo = urlencode({"email": self.email, "senha": self.args.senha})
+        status, _ = self.requisicao("POST", "/login", corpo, "application/x-www-form-urlencoded")
+        if status != 302 or not self.cookies:
+            raise RuntimeError(f"login de {self.email} falhou (HTTP {status})")
+        if self.perfil == "consultor":
+            for aba in ("contatados", "retornar", "pendentes"):
+                status, dados = self.requisicao("GET", "/api/busca-clientes?" + urlencode({"q": "", "aba": aba}))
+                if status == 200:
+                    self.clientes += [c["id"] for c in json.loads(dados).get("clientes", [])]
+            if not self.clientes:
+                raise RuntimeError(f"{self.email} não tem clientes")
+
+    # ---- ações ----
+    def busca(self):
+        # digitação: um request a cada letra a partir da segunda
+        termo = self.rnd.choice(TERMOS)
+        aba = self.rnd.choice(ABAS)
+        for n in range(2, len(termo) + 1):
+            self.medir("busca", "GET", "/api/busca-clientes?" + urlencode({"q": termo[:n], "aba": aba}))
+            if time.monotonic() >= self.fim:
+                return
+            time.sleep(self.rnd.uniform(0.08, 0.2))
+
+    def historico(self):
+        # como o modal do cliente: abre a linha do tempo, carrega a página
+        # seguinte e, ao reabrir, revalida a primeira com o ETag (304 sem mudança)
+        caminho = f"/clientes/{self.rnd.choice(self.clientes)}/timeline"
+        status, dados = self.medir("historico", "GET", caminho)
+        if status != 200:
+            return
+        etag = self.cabecalhos_resposta.get("ETag")
+        cursor = json.loads(dados).get("proximo_cursor")
+        if cursor:
+            time.sleep(self.rnd.uniform(0.3, 1.0))
+            self.medir("historico_mais", "GET", caminho + "?" + urlencode({"cursor": cursor}))
+        if etag:
+            time.sleep(self.rnd.uniform(0.3, 1.0))
+            self.medir("historico_304", "GET", caminho, extras={"If-None-Match": etag})
+
+    def registrar(self):
+        resultado = self.rnd.choice(RESULTADOS)
+        payload = {
+            "resultado": resultado,
+            "observacao": "teste de carga",
+            "contato_nome": "Teste",
+            "chave_idempotencia": uuid.UUID(int=self.rnd.getrandbits(128)).hex,
+        }
+        if resultado == "comprou":
+            payload["valor_venda"] = round(self.rnd.uniform(200, 5000), 2)
+        if resultado == "retornar":
+            payload["dias_retorno"] = self.rnd.choice([1, 3, 7, 30])
+        self.medir("registrar", "POST", f"/registrar-ligacao/{self.rnd.choice(self.clientes)}",
+                   json.dumps(payload), "application/json")
+
+    def _mes_aleatorio(self):
+        hoje = date.today()
+        atras = self.rnd.choice([0, 0, 0, 1, 1, 2, 3, 6])
+        ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - atras, 12)
+        return {"mes": mes + 1, "ano": ano}
+
+    def mes(self):
+        self.medir("mes", "GET", "/api/minhas-ligacoes-por-mes?" + urlencode(self._mes_aleatorio()))
+
+    def painel(self):
+        self.medir("painel", "GET", "/supervisor")
+
+    def resultados_mes(self):
+        self.medir("resultados_mes", "GET", "/api/resultados-por-mes?" + urlencode(self._mes_aleatorio()))
+
+    def run(self):
+        try:
+            self.entrar()
+        except Exception as e:
+            self.falha = str(e)
+            return
+        while time.monotonic() < self.fim:
+            getattr(self, self.rnd.choices(self.nomes, self.pesos)[0])()
+            if self.args.pausa:
+                time.sleep(self.rnd.uniform(0.5, 1.5) * self.args.pausa)
+        if self.conexao is not None:
+            self.conexao.close()
+
+
+def imprimir(resumo, duracao):
+    print(f"\n{duracao:.0f}s medidos")
+    print(f"{'ação':<15}{'req':>8}{'req/s':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'erro%':>8}{'503%':>7}")
+    for acao, r in resumo.items():
+        print(f"{acao:<15}{r['requisicoes']:>8}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}{r['erros_pct']:>8.2f}{r['recusas_pct']:>7.2f}")
+    print("(latências em ms)")
+
+
+def comparar(resumo, base, tolerancia):
+    """Lista de textos descrevendo cada regressão em relação à base."""
+    regressoes = []
+    for acao, antes in base.get("resultados", {}).items():
+        agora = resumo.get(acao)
+        if agora is None:
+            regressoes.append(f"{acao}: sem requisições nesta rodada")
+            continue
+        for chave in ("p50_ms", "p95_ms", "p99_ms"):
+            # p99 com poucas amostras é o máximo; abaixo de 5 ms a variação é ruído
+            if chave == "p99_ms" and min(agora["requisicoes"], antes["requisicoes"]) < 100:
+                continue
+            if agora[chave] > max(antes[chave] * (1 + tolerancia), antes[chave] + 5):
+                regressoes.append(f"{acao}: {chave} {antes[chave]:.1f} -> {agora[chave]:.1f}")
+        if agora["rps"] < antes["rps"] * (1 - tolerancia):
+            regressoes.append(f"{acao}: req/s {antes['rps']:.1f} -> {agora['rps']:.1f}")
+        for chave in ("erros_pct", "recusas_pct"):
+            if agora[chave] > antes[chave] + 1.0:
+                regressoes.append(f"{acao}: {chave} {antes[chave]:.2f} -> {agora[chave]:.2f}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga com a mistura de uso de consultores e supervisores")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--usuarios", type=int, default=20, help="usuários virtuais simultâneos")
+    parser.add_argument("--supervisores", type=int, default=2, help="quantos dos usuários são supervisores")
+    parser.add_argument("--consultores-base", type=int, default=20,
+                        help="consultores existentes na base (consultor001..N@seed.local)")
+    parser.add_argument("--senha", default="123456")
+    parser.add_argument("--duracao", type=float, default=60, help="segundos medidos")
+    parser.add_argument("--aquecimento", type=float, default=5, help="segundos iniciais descartados")
+    parser.add_argument("--pausa", type=float, default=1.0, help="pausa média entre ações, em segundos (0 = sem pausa)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sem-escrita", action="store_true", help="não registra ligações")
+    parser.add_argument("--salvar-base", metavar="ARQUIVO", help="grava o resultado como base de comparação")
+    parser.add_argument("--comparar", metavar="ARQUIVO", help="compara com uma base salva")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    supervisores = min(args.supervisores, args.usuarios)
+    stats = Estatisticas()
+    fim = time.monotonic() + args.aquecimento + args.duracao
+    usuarios = []
+    for i in range(args.usuarios):
+        if i < supervisores:
+            email, perfil = "supervisor1@seed.local", "supervisor"
+        else:
+            email, perfil = f"consultor{(i - supervisores) % args.consultores_base + 1:03d}@seed.local", "consultor"
+        usuarios.append(UsuarioVirtual(args, email, perfil, stats, fim, args.seed * 1000 + i))
+
+    print(f"{args.usuarios} usuários ({supervisores} supervisores) contra {args.url}: "
+          f"{args.aquecimento:.0f}s de aquecimento + {args.duracao:.0f}s medidos")
+    for u in usuarios:
+        u.start()
+    time.sleep(args.aquecimento)
+    stats.ativo = True
+    inicio = time.monotonic()
+    for u in usuarios:
+        u.join()
+    duracao = time.monotonic() - inicio
+
+    falhas = [u for u in usuarios if u.falha]
+    for u in falhas:
+        print(f"[ERRO] {u.falha}", file=sys.stderr)
+    if len(falhas) == len(usuarios):
+        sys.exit(2)
+
+    resumo = stats.resumo(duracao)
+    imprimir(resumo, duracao)
+
+    if args.salvar_base:
+        parametros = {k: getattr(args, k) for k in ("url", "usuarios", "supervisores", "duracao", "pausa", "seed", "sem_escrita")}
+        with open(args.salvar_base, "w", encoding="utf-8") as f:
+            json.dump({"parametros": parametros, "resultados": resumo}, f, indent=2, ensure_ascii=False)
+        print(f"Base salva em {args.salvar_base}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regressoes = comparar(resumo, base, args.tolerancia)
+        if regressoes:
+            print(f"\nREGRESSÕES em relação a {args.comparar} (tolerância {args.tolerancia:.0%}):")
+            for r in regressoes:
+                print(f"  - {r}")
+            sys.exit(1)
+        print(f"\nSem regressões em relação a {args.comparar}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Ambiente dos testes: SQLite temporário e um servidor SMTP local (aiosmtpd).
+
+O app lê banco e e-mail do ambiente na importação, então tudo é definido aqui,
+antes do primeiro `import app`. Rode da raiz do projeto:
+
+    pip install pytest aiosmtpd
+    python -m pytest -q
+"""
+import os
+import shutil
+import socket
+import sys
+import tempfile
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+PASTA = tempfile.mkdtemp(prefix="testes_bakof_")
+PORTA_SMTP = _porta_livre()
+
+# sobrescreve (não setdefault): um .env de desenvolvimento não pode mandar e-mail de verdade
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + os.path.join(PASTA, "testes.db"),
+    "SECRET_KEY": "testes",
+    "MAIL_SERVER": "127.0.0.1",
+    "MAIL_PORT": str(PORTA_SMTP),
+    "MAIL_USE_TLS": "false",
+    "MAIL_USE_SSL": "false",
+    "MAIL_USERNAME": "testes@exemplo.com",
+    "MAIL_PASSWORD": "testes",
+    "SCHEDULER_NA_WEB": "false",
+})
+
+
+class CaixaSMTP:
+    """Handler do aiosmtpd: guarda o que chega e, sob pedido, recusa
+    destinatários ou falha na entrega."""
+
+    def __init__(self):
+        self.limpar()
+
+    def limpar(self):
+        self.mensagens = []  # (peer da conexão, envelope)
+        self.recusar = set()
+        self.falhar_entrega = False
+
+    @property
+    def conexoes(self):
+        return len({peer for peer, _ in self.mensagens})
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.recusar:
+            return "550 5.1.1 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.falhar_entrega:
+            return "451 4.3.0 Temporary failure"
+        self.mensagens.append((session.peer, envelope))
+        return "250 Message accepted for delivery"
+
+
+def _autenticar(server, session, envelope, mecanismo, dados):
+    return AuthResult(success=True)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(PASTA, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def servidor_smtp():
+    caixa = CaixaSMTP()
+    controller = Controller(caixa, hostname="127.0.0.1", port=PORTA_SMTP,
+                            authenticator=_autenticar, auth_require_tls=False)
+    controller.start()
+    yield caixa
+    controller.stop()
+
+
+@pytest.fixture
+def smtp(servidor_smtp):
+    servidor_smtp.limpar()
+    return servidor_smtp
+
+
+@pytest.fixture
+def contexto():
+    from app import app, db
+    with app.app_context():
+        yield
+        db.session.remove()
@@ -0,0 +1,52 @@
+"""Número máximo de consultas SQL das rotas mais usadas (pega um N+1 no CI).
+
+As rotas, os usuários e a base vêm do verificar_consultas.py, que continua
+com a checagem de plano (EXPLAIN) para rodar contra o MySQL. A contagem não
+depende do volume, então a base semeada é a pequena de lá. Se uma mudança
+precisa mesmo de mais uma consulta, ajuste o limite no mesmo commit.
+"""
+import os
+from datetime import date
+
+import pytest
+
+import verificar_consultas as vc
+from app import app, db
+
+LIMITES = {
+    "meus_clientes": 5,
+    "meus_clientes (supervisor)": 5,
+    "api_busca_clientes": 2,
+    "historico_ligacoes": 4,
+    "supervisor_dashboard": 7,
+    "api_resultados_por_mes": 3,
+    "ligacoes_dia": 3,
+    "gerenciar_usuarios": 3,
+}
+SENHA = "123456"  # padrão do semear_dados.py
+
+
+@pytest.fixture(scope="module")
+def base():
+    # --limpar: a base semeada substitui o que os outros módulos deixaram
+    hoje = date.today()
+    vc.semear(os.environ["DATABASE_URL"], hoje)
+    with app.app_context():
+        valores = vc.valores_rotas(hoje)
+        db.session.remove()
+    assert valores is not None
+    return valores, vc.logar(app, SENHA)
+
+
+def test_todas_as_rotas_tem_limite():
+    assert {nome for nome, *_ in vc.ROTAS} == set(LIMITES)
+
+
+@pytest.mark.parametrize("nome, perfil, caminho", [rota[:3] for rota in vc.ROTAS])
+def test_limite_de_consultas(base, nome, perfil, caminho):
+    valores, clientes_http = base
+    with app.app_context():
+        engine = db.engine
+    status, consultas = vc.consultas_da_rota(engine, clientes_http[perfil], caminho.format(**valores))
+    assert status == 200
+    assert len(consultas) <= LIMITES[nome], "\n".join(" ".join(st.split())[:200] for st, _ in consultas)
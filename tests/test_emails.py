@@ -0,0 +1,113 @@
+"""Fila de saída de e-mails (enviar_emails_pendentes) contra o SMTP local do conftest."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as modulo
+from app import EmailSaida, db, enfileirar_email, enviar_emails_pendentes
+
+
+@pytest.fixture(autouse=True)
+def fila_vazia(contexto):
+    EmailSaida.query.delete()
+    db.session.commit()
+
+
+def _enfileirar(*destinatarios, assunto="Teste"):
+    emails = [enfileirar_email(f"{assunto} {i}", [d], "<p>olá</p>") for i, d in enumerate(destinatarios)]
+    db.session.commit()
+    return emails
+
+
+def _vencer(*emails):
+    for email in emails:
+        email.proxima_tentativa = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_lotes_saem_pela_mesma_conexao(smtp, monkeypatch):
+    monkeypatch.setattr(modulo, "EMAIL_LOTE", 2)  # 5 e-mails = 3 lotes
+    emails = _enfileirar(*(f"dest{i}@exemplo.com" for i in range(5)))
+
+    assert enviar_emails_pendentes() == 5
+
+    assert len(smtp.mensagens) == 5
+    assert smtp.conexoes == 1
+    assert sorted(env.rcpt_tos[0] for _, env in smtp.mensagens) == [f"dest{i}@exemplo.com" for i in range(5)]
+    for email in emails:
+        db.session.refresh(email)
+        assert email.status == 'enviado'
+        assert email.enviado_em is not None
+
+
+def test_falha_reagenda_com_espera_exponencial(smtp, monkeypatch):
+    monkeypatch.setattr(modulo, "EMAIL_TENTATIVAS_MAX", 3)
+    smtp.falhar_entrega = True
+    email, = _enfileirar("dest@exemplo.com")
+
+    antes = datetime.now()
+    assert enviar_emails_pendentes() == 0
+    db.session.refresh(email)
+    assert (email.status, email.tentativas) == ('pendente', 1)
+    assert email.proxima_tentativa >= antes + modulo.EMAIL_ESPERA_BASE
+    assert "451" in email.ultimo_erro
+
+    # ainda não venceu: a rodada seguinte nem tenta
+    assert enviar_emails_pendentes() == 0
+    db.session.refresh(email)
+    assert email.tentativas == 1
+
+    _vencer(email)
+    antes = datetime.now()
+    assert enviar_emails_pendentes() == 0
+    db.session.refresh(email)
+    assert email.tentativas == 2
+    assert email.proxima_tentativa >= antes + 2 * modulo.EMAIL_ESPERA_BASE
+
+    _vencer(email)
+    assert enviar_emails_pendentes() == 0
+    db.session.refresh(email)
+    assert (email.status, email.tentativas) == ('falhou', 3)
+    assert smtp.mensagens == []
+
+
+def test_recuperacao_depois_da_falha(smtp):
+    smtp.falhar_entrega = True
+    email, = _enfileirar("dest@exemplo.com")
+    assert enviar_emails_pendentes() == 0
+
+    smtp.falhar_entrega = False
+    _vencer(email)
+    assert enviar_emails_pendentes() == 1
+    db.session.refresh(email)
+    assert (email.status, email.tentativas) == ('enviado', 1)
+    assert len(smtp.mensagens) == 1
+
+
+def test_conexao_recusada_reagenda_o_lote(smtp, monkeypatch):
+    from conftest import _porta_livre
+    monkeypatch.setattr(modulo.app.extensions["mail"], "port", _porta_livre())
+    emails = _enfileirar("a@exemplo.com", "b@exemplo.com")
+
+    antes = datetime.now()
+    assert enviar_emails_pendentes() == 0
+    for email in emails:
+        db.session.refresh(email)
+        assert (email.status, email.tentativas) == ('pendente', 1)
+        assert email.proxima_tentativa >= antes + modulo.EMAIL_ESPERA_BASE
+
+
+def test_destinatario_recusado_falha_sem_nova_tentativa(smtp):
+    smtp.recusar = {"nao.existe@exemplo.com"}
+    recusado, aceito = _enfileirar("nao.existe@exemplo.com", "ok@exemplo.com")
+
+    assert enviar_emails_pendentes() == 1
+
+    db.session.refresh(recusado)
+    db.session.refresh(aceito)
+    assert (recusado.status, recusado.tentativas) == ('falhou', 1)
+    assert "nao.existe@exemplo.com" in recusado.ultimo_erro
+    assert aceito.status == 'enviado'
+    # a recusa não derruba a conexão: o e-mail seguinte sai por ela
+    assert smtp.conexoes == 1
+    assert [env.rcpt_tos for _, env in smtp.mensagens] == [["ok@exemplo.com"]]
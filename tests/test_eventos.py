@@ -0,0 +1,152 @@
+"""resumo_mensal mantido pelos eventos: depois de cada caminho de escrita em
+ligações e de uma rodada do despachante, o resumo bate com a soma das ligações
+(quentes + arquivo)."""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from flask_login import login_user
+from sqlalchemy import select, union_all
+from werkzeug.security import generate_password_hash
+
+import app as modulo
+from app import (Cliente, Evento, EventoOffset, Ligacao, LigacaoArquivo, ResumoMensal, Usuario,
+                 _registrar_ligacao_cliente, app, arquivar_ligacoes, db, despachar_eventos)
+
+SENHA = "123456"
+
+
+@pytest.fixture(autouse=True)
+def sem_folga(monkeypatch):
+    # eventos recém-gravados já entram na rodada
+    monkeypatch.setattr(modulo, "EVENTOS_FOLGA", timedelta(seconds=-1))
+
+
+@pytest.fixture(scope="module")
+def dados():
+    with app.app_context():
+        consultor = Usuario(nome="Consultor Eventos", email="eventos.consultor@exemplo.com",
+                            senha_hash=generate_password_hash(SENHA), tipo="consultor")
+        db.session.add(consultor)
+        db.session.flush()
+        clientes = [Cliente(nome=f"CLIENTE EVENTOS {i}", consultor_id=consultor.id) for i in range(3)]
+        db.session.add_all(clientes)
+        db.session.commit()
+        ids = {"consultor": consultor.id, "email": consultor.email, "clientes": [c.id for c in clientes]}
+        db.session.remove()
+    return ids
+
+
+def _cliente_http(email):
+    c = app.test_client()
+    r = c.post("/login", data={"email": email, "senha": SENHA})
+    r.close()
+    assert r.status_code == 302
+    return c
+
+
+def _post(c, caminho, json):
+    r = c.post(caminho, json=json)
+    dados = r.get_json()
+    r.close()
+    assert r.status_code == 200 and dados["ok"], dados
+    return dados
+
+
+def _resumo():
+    return {(r.ano, r.mes, r.consultor_id): (r.ligacoes, r.vendas, Decimal(r.receita).quantize(Decimal("0.01")))
+            for r in db.session.execute(select(ResumoMensal)).scalars()}
+
+
+def _ao_vivo():
+    """Mesmos totais do resumo, somados em Python a partir das duas tabelas."""
+    totais = defaultdict(lambda: [0, 0, Decimal("0.00")])
+    colunas = lambda t: select(t.c.consultor_id, t.c.data_hora, t.c.resultado, t.c.valor_venda)
+    for lig in db.session.execute(union_all(colunas(Ligacao.__table__), colunas(LigacaoArquivo.__table__))):
+        if lig.data_hora is None:
+            continue
+        linha = totais[(lig.data_hora.year, lig.data_hora.month, lig.consultor_id)]
+        linha[0] += 1
+        if lig.resultado == 'comprou':
+            linha[1] += 1
+            linha[2] += Decimal(str(lig.valor_venda or 0)).quantize(Decimal("0.01"))
+    return {k: tuple(v) for k, v in totais.items()}
+
+
+def _despachar():
+    with app.app_context():
+        despachar_eventos()
+        resumo, vivo = _resumo(), _ao_vivo()
+        carregado = db.session.get(EventoOffset, '_resumo_mensal') is not None
+        db.session.remove()
+    return resumo, vivo, carregado
+
+
+def test_carga_inicial_sobre_resumo_que_sobrou(dados):
+    with app.app_context():
+        # resumo de uma carga anterior sem a linha de offset (ex.: base semeada de novo)
+        db.session.query(EventoOffset).filter_by(assinante='_resumo_mensal').delete()
+        db.session.merge(ResumoMensal(ano=2001, mes=1, consultor_id=dados["consultor"],
+                                      ligacoes=99, vendas=9, receita=999))
+        db.session.commit()
+        db.session.remove()
+
+    resumo, vivo, carregado = _despachar()
+    assert carregado
+    assert (2001, 1, dados["consultor"]) not in resumo
+    assert resumo == vivo
+
+    # com todos os offsets gravados, a poda volta a andar (o evento mais novo fica)
+    with app.app_context():
+        minimo = min(db.session.execute(select(EventoOffset.ultimo_id)).scalars())
+        ids = db.session.execute(select(Evento.id).where(Evento.id <= minimo)).scalars().all()
+        assert len(ids) <= 1
+        db.session.remove()
+
+
+def test_evento_depois_da_poda_nao_reaproveita_id(dados):
+    _despachar()
+    c = _cliente_http(dados["email"])
+    for _ in range(2):  # cada rodada poda tudo o que já foi entregue
+        _post(c, f"/registrar-ligacao/{dados['clientes'][0]}", {"resultado": "comprou", "valor_venda": 10})
+        resumo, vivo, _ = _despachar()
+        assert resumo == vivo
+
+
+def test_caminhos_de_escrita_mantem_o_resumo(dados):
+    _despachar()  # garante a carga inicial feita antes das escritas
+    c = _cliente_http(dados["email"])
+    um, dois, tres = dados["clientes"]
+
+    _post(c, f"/registrar-ligacao/{um}", {"resultado": "comprou", "valor_venda": "150,50"})
+    _post(c, f"/registrar-ligacao/{um}", {"resultado": "nao_comprou"})
+    ontem = (datetime.now() - timedelta(days=1)).isoformat()
+    _post(c, "/registrar-ligacoes", {"ligacoes": [
+        {"cliente_id": dois, "chave_idempotencia": "eventos-1", "data_hora": ontem,
+         "resultado": "comprou", "valor_venda": 80},
+        {"cliente_id": dois, "chave_idempotencia": "eventos-2", "resultado": "retornar"},
+        {"cliente_id": dois, "chave_idempotencia": "eventos-1", "resultado": "comprou", "valor_venda": 80},
+    ]})
+    _post(c, f"/remover-cliente/{tres}", {"motivo": "fechou a empresa"})
+
+    resumo, vivo, _ = _despachar()
+    assert resumo == vivo
+
+    # ligação antiga (mês fechado) que depois vai para o arquivo
+    tres_meses = datetime.now().replace(day=1) - timedelta(days=80)
+    with app.test_request_context():
+        login_user(db.session.get(Usuario, dados["consultor"]))
+        cli = db.session.get(Cliente, um)
+        _registrar_ligacao_cliente(cli, {"resultado": "comprou", "valor_venda": 42}, tres_meses)
+        db.session.commit()
+        db.session.remove()
+    resumo, vivo, _ = _despachar()
+    assert resumo == vivo
+
+    with app.app_context():
+        assert arquivar_ligacoes(1) >= 1
+        db.session.remove()
+    resumo, vivo, _ = _despachar()
+    assert resumo == vivo
+    assert resumo[(tres_meses.year, tres_meses.month, dados["consultor"])][1] >= 1
@@ -0,0 +1,170 @@
+"""Endpoints JSON de leitura servidos por projeção de colunas: nenhum objeto ORM
+hidratado por linha, número de consultas que não cresce com o volume e pico de
+memória do request limitado (constante nas rotas paginadas)."""
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+from werkzeug.security import generate_password_hash
+
+from app import Cliente, Ligacao, Nota, Usuario, app, db
+
+SENHA = "123456"
+MEMORIA_POR_LINHA = 8 * 1024  # bytes de pico a mais por linha devolvida (hoje, ~4,5 KB)
+
+
+@pytest.fixture(scope="module")
+def dados():
+    with app.app_context():
+        consultor = Usuario(nome="Consultor Projeção", email="projecao.consultor@exemplo.com",
+                            senha_hash=generate_password_hash(SENHA), tipo="consultor")
+        supervisor = Usuario(nome="Supervisor Projeção", email="projecao.supervisor@exemplo.com",
+                             senha_hash=generate_password_hash(SENHA), tipo="supervisor")
+        db.session.add_all([consultor, supervisor])
+        db.session.flush()
+        cliente = Cliente(nome="CLIENTE PROJEÇÃO", consultor_id=consultor.id)
+        db.session.add(cliente)
+        db.session.commit()
+        ids = {"consultor": consultor.id, "cliente": cliente.id,
+               "emails": {"consultor": consultor.email, "supervisor": supervisor.email}}
+        db.session.remove()
+    return ids
+
+
+def _semear(dados, quantidade):
+    """Acrescenta `quantidade` ligações (de hoje) e notas ao cliente de teste."""
+    inicio = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    with app.app_context():
+        db.session.execute(insert(Ligacao.__table__), [
+            {"cliente_id": dados["cliente"], "consultor_id": dados["consultor"],
+             "data_hora": inicio + timedelta(seconds=i), "observacao": "obs " * 200,
+             "resultado": "comprou" if i % 4 == 0 else "nao_comprou", "valor_venda": 10}
+            for i in range(quantidade)
+        ])
+        db.session.execute(insert(Nota.__table__), [
+            {"cliente_id": dados["cliente"], "usuario_id": dados["consultor"],
+             "texto": "nota", "data_criacao": inicio + timedelta(seconds=i)}
+            for i in range(quantidade)
+        ])
+        db.session.commit()
+        db.session.remove()
+
+
+def _cliente_http(email):
+    c = app.test_client()
+    r = c.post("/login", data={"email": email, "senha": SENHA})
+    r.close()
+    assert r.status_code == 302
+    return c
+
+
+def _medir(c, caminho):
+    """(resposta JSON, consultas SQL, objetos Ligacao/Nota carregados pelo ORM)."""
+    consultas, carregados = [], []
+
+    def _consulta(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    def _carregado(alvo, contexto):
+        carregados.append(alvo)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _consulta)
+    event.listen(Ligacao, "load", _carregado)
+    event.listen(Nota, "load", _carregado)
+    try:
+        r = c.get(caminho)
+        dados = r.get_json()
+        r.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", _consulta)
+        event.remove(Ligacao, "load", _carregado)
+        event.remove(Nota, "load", _carregado)
+    assert r.status_code == 200, dados
+    return dados, len(consultas), len(carregados)
+
+
+def _pico_memoria(c, caminho):
+    """(resposta JSON, pico de memória alocada durante o request, em bytes)."""
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        r = c.get(caminho)
+        dados = r.get_json()
+        r.close()
+        pico = tracemalloc.get_traced_memory()[1] - antes
+    finally:
+        tracemalloc.stop()
+    assert r.status_code == 200, dados
+    return dados, pico
+
+
+# (perfil, caminho, chave da lista no JSON ou None se a resposta é a lista, tamanho máximo da página)
+ROTAS = [
+    ("consultor", "/historico-ligacoes/{cliente}", None, None),
+    ("consultor", "/clientes/{cliente}/notas", None, None),
+    ("consultor", "/api/minhas-ligacoes-por-mes?limite=200", "ligacoes", 200),
+    ("supervisor", "/ligacoes-dia/{hoje}", None, None),
+]
+
+
+@pytest.mark.parametrize("perfil, caminho, chave, pagina", ROTAS)
+def test_leitura_sem_hidratar_e_com_consultas_constantes(dados, perfil, caminho, chave, pagina):
+    caminho = caminho.format(cliente=dados["cliente"], hoje=datetime.now().date().isoformat())
+    c = _cliente_http(dados["emails"][perfil])
+
+    def linhas(resposta):
+        return len(resposta[chave] if chave else resposta)
+
+    _semear(dados, 5)
+    pequeno, consultas_pequeno, carregados = _medir(c, caminho)
+    assert linhas(pequeno) >= 5
+    assert carregados == 0
+
+    _semear(dados, 150)
+    grande, consultas_grande, carregados = _medir(c, caminho)
+    esperado = linhas(pequeno) + 150
+    assert linhas(grande) == (min(esperado, pagina) if pagina else esperado)
+    assert carregados == 0
+    assert consultas_grande == consultas_pequeno
+
+
+@pytest.mark.parametrize("perfil, caminho, chave, pagina", ROTAS)
+def test_pico_de_memoria_acompanha_so_as_linhas_devolvidas(dados, perfil, caminho, chave, pagina):
+    caminho = caminho.format(cliente=dados["cliente"], hoje=datetime.now().date().isoformat())
+    c = _cliente_http(dados["emails"][perfil])
+
+    def linhas(resposta):
+        return len(resposta[chave] if chave else resposta)
+
+    _semear(dados, 300)
+    _pico_memoria(c, caminho)  # aquece caches de SQL compilado e templates
+    menor, pico_menor = _pico_memoria(c, caminho)
+    _semear(dados, 900)
+    maior, pico_maior = _pico_memoria(c, caminho)
+
+    if pagina:
+        # página cheia nas duas medições: o volume da tabela não pode pesar
+        assert linhas(menor) == linhas(maior) == pagina
+        assert pico_maior <= pico_menor * 1.25
+    else:
+        assert linhas(maior) == linhas(menor) + 900
+        assert (pico_maior - pico_menor) / 900 <= MEMORIA_POR_LINHA
+
+
+def test_observacao_adiada_nas_listas(dados):
+    _semear(dados, 1)
+    with app.app_context():
+        lig = Ligacao.query.filter_by(cliente_id=dados["cliente"]).first()
+        assert "observacao" not in lig.__dict__
+        db.session.remove()
+
+
+def test_lista_mensal_nao_devolve_observacao(dados):
+    _semear(dados, 1)
+    c = _cliente_http(dados["emails"]["consultor"])
+    resposta, _, _ = _medir(c, "/api/minhas-ligacoes-por-mes")
+    assert resposta["ligacoes"]
+    assert all("observacao" not in lig for lig in resposta["ligacoes"])
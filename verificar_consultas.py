@@ -0,0 +1,219 @@
+"""Confere o plano das consultas SQL das rotas mais usadas, de preferência no MySQL.
+
+    python verificar_consultas.py                      # SQLite temporário, semeado aqui
+    python verificar_consultas.py --url mysql+pymysql://u:s@host/bench --sem-semear
+
+Serve para o CI pegar um filtro que não usa índice antes de chegar em
+produção. Cada rota de ROTAS roda uma vez sobre uma base do semear_dados.py e
+o EXPLAIN de cada SELECT não pode ter varredura completa em ligacoes ou
+clientes: no MySQL, type ALL; no SQLite, "SCAN <tabela>" sem índice. Tabelas
+com menos de --min-linhas linhas ficam de fora, porque aí o otimizador prefere
+varrer mesmo.
+
+O limite de consultas por rota (N+1) fica em tests/test_consultas.py, que usa
+ROTAS e os helpers daqui e roda com o pytest.
+
+Sai com código 1 se alguma rota falhar.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date
+
+# (rota, usuário, caminho, tabelas que a rota pode varrer)
+# {cliente} = cliente do consultor com mais ligações; {dia}/{mes}/{ano} = último dia semeado
+ROTAS = [
+    ("meus_clientes", "consultor", "/meus-clientes", ()),
+    # a carteira de todos os consultores conta a tabela inteira (classe de carga analítica)
+    ("meus_clientes (supervisor)", "supervisor", "/meus-clientes", ("clientes",)),
+    ("api_busca_clientes", "consultor", "/api/busca-clientes?q=silva&aba=pendentes", ()),
+    ("historico_ligacoes", "consultor", "/historico-ligacoes/{cliente}", ()),
+    ("supervisor_dashboard", "supervisor", "/supervisor", ()),
+    ("api_resultados_por_mes", "supervisor", "/api/resultados-por-mes?mes={mes}&ano={ano}", ()),
+    ("ligacoes_dia", "supervisor", "/ligacoes-dia/{dia}", ()),
+    ("gerenciar_usuarios", "supervisor", "/supervisor/usuarios", ()),
+]
+USUARIOS = {"consultor": "consultor001@seed.local", "supervisor": "supervisor1@seed.local"}
+TABELAS_VIGIADAS = ("ligacoes", "clientes")
+
+SEMEAR = ["--seed", "42", "--dias", "120", "--supervisores", "1", "--consultores", "5",
+          "--clientes", "3000", "--ligacoes", "30000", "--notas", "300", "--banners", "2", "--limpar"]
+
+
+def semear(url, ate):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semear_dados.py")
+    subprocess.run([sys.executable, script, "--url", url, "--ate", ate.isoformat(), *SEMEAR], check=True)
+
+
+def valores_rotas(ate):
+    """Valores de {cliente}/{dia}/{mes}/{ano} nos caminhos de ROTAS, ou None se a
+    base não tem os usuários semeados. Precisa de app context."""
+    from sqlalchemy import func, select
+    from app import db, Cliente, Ligacao, Usuario
+
+    consultor = Usuario.query.filter_by(email=USUARIOS["consultor"]).first()
+    if consultor is None:
+        return None
+    cliente = db.session.execute(
+        select(Ligacao.cliente_id).join(Cliente, Cliente.id == Ligacao.cliente_id)
+        .where(Cliente.consultor_id == consultor.id)
+        .group_by(Ligacao.cliente_id).order_by(func.count().desc()).limit(1)
+    ).scalar()
+    return {"cliente": cliente, "dia": ate.isoformat(), "mes": ate.month, "ano": ate.year}
+
+
+def logar(app, senha):
+    """{perfil: test client logado} para os perfis de USUARIOS; levanta
+    RuntimeError se algum login falhar."""
+    clientes_http = {}
+    for perfil, email in USUARIOS.items():
+        c = app.test_client()
+        r = c.post("/login", data={"email": email, "senha": senha})
+        r.close()
+        if r.status_code != 302:
+            raise RuntimeError(f"login de {email} falhou (HTTP {r.status_code})")
+        clientes_http[perfil] = c
+    return clientes_http
+
+
+def consultas_da_rota(engine, c, caminho):
+    """(status HTTP, [(statement, parameters)]) de um GET com o test client `c`."""
+    from sqlalchemy import event
+
+    consultas = []
+
+    def _coletar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _coletar)
+    try:
+        resp = c.get(caminho)
+        resp.get_data()
+        resp.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", _coletar)
+    return resp.status_code, consultas
+
+
+def _apelidos(statement):
+    """{apelido ou nome: tabela} das tabelas vigiadas que aparecem na consulta."""
+    nomes = "|".join(TABELAS_VIGIADAS)
+    apelidos = {t: t for t in TABELAS_VIGIADAS}
+    for tabela, apelido in re.findall(rf"\b({nomes})\b\s+(?:AS\s+)?(\w+)", statement, re.IGNORECASE):
+        if apelido.upper() not in ("WHERE", "JOIN", "LEFT", "INNER", "ON", "GROUP", "ORDER", "LIMIT", "SET"):
+            apelidos[apelido] = tabela.lower()
+    return apelidos
+
+
+def varreduras(conn, statement, parameters, grandes):
+    """Tabelas vigiadas (com >= --min-linhas) que o plano da consulta varre inteiras."""
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return []
+    apelidos = _apelidos(statement)
+    if not any(re.search(rf"\b{t}\b", statement) for t in grandes):
+        return []
+
+    achadas = []
+    if conn.dialect.name == "mysql":
+        for linha in conn.exec_driver_sql("EXPLAIN " + statement, parameters).mappings():
+            tabela = apelidos.get(linha["table"])
+            if tabela in grandes and linha["type"] == "ALL":
+                achadas.append(f"{tabela} (type ALL, ~{linha['rows']} linhas)")
+    elif conn.dialect.name == "sqlite":
+        for linha in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters):
+            detalhe = linha[-1]
+            m = re.match(r"SCAN (\w+)(?: AS (\w+))?", detalhe)
+            if m and "USING" not in detalhe:
+                tabela = apelidos.get(m.group(2) or m.group(1), m.group(1))
+                if tabela in grandes:
+                    achadas.append(f"{tabela} ({detalhe})")
+    return achadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planos (EXPLAIN) das consultas SQL das rotas mais usadas")
+    parser.add_argument("--url", help="banco a usar (padrão: SQLite temporário)")
+    parser.add_argument("--sem-semear", action="store_true", help="usa a base de --url como está (já semeada)")
+    parser.add_argument("--ate", type=date.fromisoformat, default=date.today(),
+                        help="último dia com ligações da base semeada, AAAA-MM-DD (padrão: hoje)")
+    parser.add_argument("--senha", default="123456")
+    parser.add_argument("--min-linhas", type=int, default=1000,
+                        help="tabelas menores que isso não entram na checagem de varredura")
+    parser.add_argument("-v", "--verbose", action="store_true", help="lista as consultas de cada rota")
+    args = parser.parse_args()
+
+    temporario = None
+    if not args.url:
+        if args.sem_semear:
+            parser.error("--sem-semear precisa de --url")
+        temporario = tempfile.mkdtemp(prefix="verificar_consultas_")
+        args.url = "sqlite:///" + os.path.join(temporario, "verificar.db")
+    try:
+        if not args.sem_semear:
+            semear(args.url, args.ate)
+        os.environ["DATABASE_URL"] = args.url
+        # sem .env (CI), o login não grava a sessão sem SECRET_KEY
+        os.environ.setdefault("SECRET_KEY", "verificar-consultas")
+        return verificar(args)
+    finally:
+        if temporario:
+            shutil.rmtree(temporario, ignore_errors=True)
+
+
+def verificar(args):
+    from sqlalchemy import func, select
+    from app import app, db
+
+    with app.app_context():
+        engine = db.engine
+        valores = valores_rotas(args.ate)
+        if valores is None:
+            print(f"❌ {USUARIOS['consultor']} não existe: rode o semear_dados.py ou tire o --sem-semear")
+            return 1
+        grandes = {t for t in TABELAS_VIGIADAS
+                   if db.session.execute(select(func.count()).select_from(db.metadata.tables[t])).scalar()
+                   >= args.min_linhas}
+        db.session.remove()
+
+    try:
+        clientes_http = logar(app, args.senha)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"🔎 {engine.url.render_as_string(hide_password=True)} — varredura vigiada em: "
+          f"{', '.join(sorted(grandes)) or 'nenhuma tabela (base pequena)'}")
+    falhas = 0
+    for nome, perfil, caminho, permitidas in ROTAS:
+        status, consultas = consultas_da_rota(engine, clientes_http[perfil], caminho.format(**valores))
+
+        problemas = []
+        if status != 200:
+            problemas.append(f"HTTP {status}")
+        with engine.connect() as conn:
+            for statement, parameters in consultas:
+                for achada in varreduras(conn, statement, parameters, grandes - set(permitidas)):
+                    problemas.append(f"varredura completa em {achada}: {' '.join(statement.split())[:160]}")
+
+        if problemas:
+            falhas += 1
+            print(f"❌ {nome}: " + "\n     ".join(problemas))
+        else:
+            print(f"✅ {nome}: {len(consultas)} consultas, sem varredura completa")
+        if args.verbose:
+            for statement, _ in consultas:
+                print(f"     · {' '.join(statement.split())[:200]}")
+
+    if falhas:
+        print(f"\n{falhas} rota(s) com problema.")
+        return 1
+    print("\nTudo certo.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())